@@ -13,3 +13,6 @@ NOMOTO_EXP_SPECTRUM_DATA_PATH = os.path.join(
 MATSUI_EXP_SPECTRUM_DATA_PATH = os.path.join(
     DATA_DIRECTORY, "Matsui_1986_spectral_irradiance_conditions.csv"
 )
+JOS3_CACHE_DIRECTORY = os.path.join(DATA_DIRECTORY, "jos3_cache")
+CALIBRATION_CACHE_DIRECTORY = os.path.join(DATA_DIRECTORY, "calibration_cache")
+SWEEP_DIRECTORY = os.path.join(DATA_DIRECTORY, "sweeps")
@@ -0,0 +1,199 @@
+import numpy as np
+from batched_model import BatchedReceptorModel, align_spectra
+from model import ReceptorModel
+
+
+class ActionSpectrumEstimator:
+    """
+    Estimate PSI of arbitrary spectra with action spectra instead of full simulations.
+
+    For a set of environmental conditions, the responses to a small irradiance absorbed
+    at each skin node are simulated in one batched run (one lane per node). Since the
+    absorbed profile of a spectrum is the attenuation kernel times the spectrum, the
+    action spectrum (PSI per W/m² at each wavelength) is the node responses times the
+    kernel, and PSI of a spectrum is one dot product. This replaces the one simulation
+    per wavelength of main.conduct_detailed_wavelength_simulation.
+
+    The estimate is linear in the absorbed irradiance. Each prediction is checked for
+    the two nonlinearities of the model: the T⁴ radiation at the surface and the
+    max(0, ·) threshold of the static warm receptor response. Flagged predictions
+    fall back to the full solver.
+
+    Usage:
+        estimator = ActionSpectrumEstimator()
+        results = estimator.predict(
+            spectra, t_db=25.3, t_r=25.2, q_irradiance=228, T_core=35.5
+        )
+        psi, linear = results["PSI"], results["linear"]
+    """
+
+    def __init__(
+        self,
+        template=None,
+        warm_up_duration=1000,
+        duration=20,
+        records=21,
+        impulse=10,
+        rtol=0.01,
+        atol=0.01,
+    ):
+        """
+        Parameters:
+        - template (ReceptorModel): Model providing the parameters and the spectral
+          tables.
+        - warm_up_duration (int): Duration of the phase without irradiation [s].
+        - duration (int): Duration of the irradiation [s].
+        - records (int): Number of last records averaged into PSI, as in main.py.
+        - impulse (float): Irradiance absorbed at each node for the responses [W/m²].
+        - rtol (float): Relative tolerance of the estimated linearization error.
+        - atol (float): Absolute tolerance of the estimated linearization error [Hz].
+        """
+        if template is None:
+            template = ReceptorModel()
+        self.template = template
+        self.warm_up_duration = warm_up_duration
+        self.duration = duration
+        self.records = records
+        self.impulse = impulse
+        self.rtol = rtol
+        self.atol = atol
+
+        # Node responses by environmental conditions
+        self._responses = {}
+
+    def _conditions(self, t_db, t_r, T_core, hc):
+        """
+        Complete the environmental conditions with the template, as a cache key.
+        """
+        return (
+            float(t_db),
+            float(t_r),
+            float(self.template.T_core if T_core is None else T_core),
+            float(self.template.hc if hc is None else hc),
+        )
+
+    def _simulate(self, conditions, absorbed_profiles=None, spectra=None):
+        """
+        Simulate lanes under the same conditions with absorbed profiles or spectra.
+
+        Returns:
+        - dict: Results of BatchedReceptorModel.simulate.
+        """
+        t_db, t_r, T_core, hc = conditions
+        lanes = len(absorbed_profiles if spectra is None else spectra)
+        model = BatchedReceptorModel(
+            range(lanes), template=self.template, T_core=T_core, hc=hc
+        )
+        if spectra is None:
+            model.set_absorbed_profiles(absorbed_profiles)
+        else:
+            model.set_spectrum(spectra)
+        model.add_phase(self.warm_up_duration, t_db, t_r, q_irradiance=0)
+        model.add_phase(self.duration, t_db, t_r, q_irradiance=1)
+        return model.simulate()
+
+    def node_responses(self, t_db, t_r, T_core=None, hc=None):
+        """
+        Simulate (or get from the cache) the responses to irradiance absorbed at each
+        node.
+
+        Parameters:
+        - t_db (float): Dry bulb temperature (°C).
+        - t_r (float): Radiant temperature (°C).
+        - T_core (float): Core temperature (°C). Uses the template if None.
+        - hc (float): Convection heat transfer coefficient (W/m²K). Uses the template if
+          None.
+
+        Returns:
+        - dict: Baseline without irradiation ("PSI", "T_warm", "T_surface") and the
+          responses per W/m² absorbed at each node ("dPSI" (n,), "dT_warm" and
+          "dT_surface" (n, records + 1)), over the last records + 1 records.
+        """
+        conditions = self._conditions(t_db, t_r, T_core, hc)
+        if conditions not in self._responses:
+            n = self.template.n
+            absorbed_profiles = np.vstack(
+                [np.zeros(n), self.impulse * np.eye(n)]
+            )  # baseline, then one lane per node
+            results = self._simulate(conditions, absorbed_profiles=absorbed_profiles)
+
+            last = slice(-self.records - 1, None)
+            psi = results["PSI"][:, -self.records :].mean(axis=1)
+            T_warm = results["T_warm"][:, last]
+            T_surface = results["T_surface"][:, last]
+            self._responses[conditions] = {
+                "PSI": psi[0],
+                "T_warm": T_warm[0],
+                "T_surface": T_surface[0],
+                "dPSI": (psi[1:] - psi[0]) / self.impulse,
+                "dT_warm": (T_warm[1:] - T_warm[0]) / self.impulse,
+                "dT_surface": (T_surface[1:] - T_surface[0]) / self.impulse,
+            }
+        return self._responses[conditions]
+
+    def action_spectrum(self, t_db, t_r, T_core=None, hc=None):
+        """
+        Calculate the action spectrum under environmental conditions.
+
+        Parameters:
+        - t_db, t_r, T_core, hc: Environmental conditions (see node_responses).
+
+        Returns:
+        - numpy.ndarray: PSI per W/m² of irradiance at each wavelength of the spectral
+          tables (Hz·m²/W).
+        """
+        responses = self.node_responses(t_db, t_r, T_core, hc)
+        return responses["dPSI"] @ self.template.spectral_tables.attenuation_kernel
+
+    def predict(
+        self, spectra, t_db, t_r, q_irradiance=1, T_core=None, hc=None, fallback=True
+    ):
+        """
+        Predict the PSI of many spectra under one set of environmental conditions.
+
+        Parameters:
+        - spectra (numpy.ndarray, pd.Series, pd.DataFrame or list): Spectral irradiance,
+          as an array of shape (spectra, wavelengths), a Series, a DataFrame with one
+          spectrum per column, or a list of Series.
+        - t_db, t_r, T_core, hc: Environmental conditions (see node_responses).
+        - q_irradiance (float or numpy.ndarray): Total irradiance scaling each spectrum.
+        - fallback (bool): If True, simulate the spectra that fail the linearity check.
+
+        Returns:
+        - dict: "PSI" (spectra,), "linear" (True where the linear estimate passed the
+          check) and "error" (estimated linearization error, Hz).
+        """
+        responses = self.node_responses(t_db, t_r, T_core, hc)
+        spectra = align_spectra(self.template, spectra)
+        spectra = spectra * np.reshape(q_irradiance, (-1, 1))
+        absorbed_profiles = spectra @ self.template.spectral_tables.attenuation_kernel.T
+
+        psi = responses["PSI"] + absorbed_profiles @ responses["dPSI"]
+
+        # Second-order term of the T⁴ radiation, applied as a surface heat flux
+        dT_surface = absorbed_profiles @ responses["dT_surface"]
+        T_surface = responses["T_surface"] + 273.15
+        radiation_error = (
+            6
+            * self.template.sigma
+            * self.template.absorption_lw
+            * np.max(T_surface**2 * dT_surface**2, axis=1)
+        )
+        error = np.abs(radiation_error * responses["dPSI"][-1])
+
+        # Static response threshold crossed by the receptor temperature
+        T_warm = responses["T_warm"] + absorbed_profiles @ responses["dT_warm"]
+        above = responses["T_warm"] > self.template.T_no_static_discharge
+        crosses = np.any(
+            (T_warm > self.template.T_no_static_discharge) != above, axis=1
+        )
+
+        linear = ~crosses & (error <= self.atol + self.rtol * np.abs(psi))
+        error[crosses] = np.inf
+
+        if fallback and not np.all(linear):
+            conditions = self._conditions(t_db, t_r, T_core, hc)
+            results = self._simulate(conditions, spectra=spectra[~linear])
+            psi[~linear] = results["PSI"][:, -self.records :].mean(axis=1)
+
+        return {"PSI": psi, "linear": linear, "error": error}
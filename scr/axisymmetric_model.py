@@ -0,0 +1,308 @@
+from functools import lru_cache
+
+import numpy as np
+from batched_model import BatchedReceptorModel
+from model import calculate_receptor_response
+
+# Radial profiles of the irradiation spot
+SPOT_PROFILES = ["uniform", "top_hat", "gaussian"]
+
+
+def calculate_spot_profile(ring_centers, spot_radius, spot_profile="gaussian"):
+    """
+    Calculate the irradiance of a spot relative to its centre.
+
+    Parameters:
+    - ring_centers (numpy.ndarray): Radii of the rings [m].
+    - spot_radius (float): Radius of the spot [m]; the 1/e² radius for "gaussian".
+    - spot_profile (str): "uniform" (laterally uniform, as ReceptorModel), "top_hat" or
+      "gaussian".
+
+    Returns:
+    - numpy.ndarray: Relative irradiance of each ring [-].
+
+    Raises:
+    - ValueError: If the spot profile is unknown.
+    """
+    ring_centers = np.asarray(ring_centers, dtype=float)
+    if spot_profile == "uniform":
+        return np.ones_like(ring_centers)
+    if spot_profile == "top_hat":
+        return (ring_centers <= spot_radius).astype(float)
+    if spot_profile == "gaussian":
+        return np.exp(-2 * ring_centers**2 / spot_radius**2)
+    raise ValueError(f"spot_profile must be one of {SPOT_PROFILES}.")
+
+
+@lru_cache(maxsize=8)
+def _factorize_system(
+    n, nr, dx, dr, conductance, capacity, r_skin2core, r_skin2amb_convection, dt
+):
+    """
+    Assemble and factorize the implicit conduction system of an (r, z) grid.
+
+    The unknowns are the temperatures of the (n, nr) grid, flattened depth-major (core
+    side first). The system is (C / dt + G) T_new = C / dt T + b, where C holds the
+    heat capacities and G the conductances of the finite volumes [W/K], including the
+    core and convective boundaries.
+
+    Returns:
+    - tuple: The sparse LU factorization (scipy.sparse.linalg.SuperLU) and the ring
+      areas [m²].
+    """
+    import scipy.sparse as sparse
+    from scipy.sparse.linalg import splu
+
+    faces = np.arange(nr + 1) * dr
+    ring_areas = np.pi * (faces[1:] ** 2 - faces[:-1] ** 2)
+
+    def path_laplacian(weights):
+        # Conductance matrix of nodes connected in a line by the given conductances
+        diagonal = np.zeros(len(weights) + 1)
+        diagonal[:-1] += weights
+        diagonal[1:] += weights
+        return sparse.diags([-weights, diagonal, -weights], [-1, 0, 1])
+
+    # Conduction between layers within a ring, and between rings within a layer
+    vertical = sparse.kron(
+        path_laplacian(np.full(n - 1, conductance / dx)), sparse.diags(ring_areas)
+    )
+    radial = sparse.kron(
+        sparse.identity(n),
+        path_laplacian(conductance * 2 * np.pi * faces[1:-1] * dx / dr),
+    )
+
+    # Heat capacity and the boundaries to the core and the ambient air
+    diagonal = np.tile(capacity * ring_areas / dt, n)
+    diagonal[:nr] += ring_areas / r_skin2core
+    diagonal[-nr:] += ring_areas / r_skin2amb_convection
+
+    system = (vertical + radial + sparse.diags(diagonal)).tocsc()
+    return splu(system), ring_areas
+
+
+class AxisymmetricReceptorModel:
+    """
+    A receptor model of a finite irradiation spot on an axisymmetric (r, z) skin grid.
+
+    The depth grid, the absorbed profile per unit irradiance (the depth attenuation
+    kernel) and the heat balance are those of ReceptorModel; the skin is divided into
+    rings around the centre of the spot, so lateral conduction lowers the temperatures
+    under the spot. The irradiance of each ring is the centre irradiance times the
+    spot profile. The outer edge of the grid is adiabatic.
+
+    Conduction and convection are integrated implicitly with a sparse LU factorization
+    that is cached by grid and parameters, so each time step is one triangular solve;
+    the T⁴ radiation at the surface is explicit. Leading phases without irradiation
+    are laterally uniform and simulated with the 1-D model.
+
+    Usage:
+        model = AxisymmetricReceptorModel(radius=0.05, nr=500, spot_radius=0.015)
+        model.set_spectrum(spectrum)
+        model.add_phase(duration_in_sec=1000, t_db=25, t_r=25, q_irradiance=0)
+        model.add_phase(duration_in_sec=20, t_db=25, t_r=25, q_irradiance=300)
+        results = model.simulate(radii=[0, 0.01, 0.02])
+    """
+
+    def __init__(
+        self,
+        radius=0.05,
+        nr=500,
+        spot_radius=0.02,
+        spot_profile="gaussian",
+        template=None,
+        **parameters,
+    ):
+        """
+        Parameters:
+        - radius (float): Outer radius of the grid [m].
+        - nr (int): Number of rings.
+        - spot_radius (float): Radius of the spot [m] (see calculate_spot_profile).
+        - spot_profile (str or numpy.ndarray): Spot profile name (see SPOT_PROFILES), or
+          the relative irradiance of each ring.
+        - template (ReceptorModel): Model providing the parameters, the depth grid, the
+          time step and the spectral tables. A new ReceptorModel if None.
+        - parameters: Parameters of the skin (see batched_model.PATCH_PARAMETERS), as
+          scalars. The defaults are the values of the template.
+        """
+        # One column of the skin, providing the parameters and the 1-D warm-up
+        self.column = BatchedReceptorModel([0], template=template, **parameters)
+        self.template = self.column.template
+        self.n = self.column.n
+        self.dt = self.column.dt
+
+        self.radius = radius
+        self.nr = nr
+        self.dr = radius / nr
+        self.ring_centers = (np.arange(nr) + 0.5) * self.dr  # [m]
+        if isinstance(spot_profile, str):
+            self.spot_profile = calculate_spot_profile(
+                self.ring_centers, spot_radius, spot_profile
+            )
+        else:
+            self.spot_profile = np.asarray(spot_profile, dtype=float)
+
+        self.phases = []  # list to store different simulation phases
+
+    def set_spectrum(self, q_spectrum):
+        """
+        Set the spectral irradiance of the spot.
+
+        Parameters:
+        - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance.
+        """
+        self.column.set_spectrum(q_spectrum)
+
+    def add_phase(self, duration_in_sec, t_db, t_r, q_irradiance, T_core=None):
+        """
+        Add a simulation phase with specific environmental conditions.
+
+        Parameters:
+        - duration_in_sec (int): Duration of the phase in seconds.
+        - t_db (float): Dry bulb temperature (°C).
+        - t_r (float): Radiant temperature (°C).
+        - q_irradiance (float): Irradiance at the centre of the spot (W/m²).
+        - T_core (float): Core temperature (°C). Uses the parameters of the model if
+          None.
+
+        Raises:
+        - ValueError: If any parameter is out of a reasonable range.
+        """
+        self.column.add_phase(duration_in_sec, t_db, t_r, q_irradiance, T_core)
+        self.phases.append(self.column.phases.pop())
+
+    def _parameter(self, name):
+        """
+        Get a scalar parameter of the skin column.
+        """
+        return float(getattr(self.column, name)[0])
+
+    def _ring_interpolation(self, radii):
+        """
+        Weights of shape (radii, nr) interpolating ring values linearly at radii.
+        """
+        radii = np.clip(np.asarray(radii, dtype=float), *self.ring_centers[[0, -1]])
+        index = np.clip(
+            np.searchsorted(self.ring_centers, radii, side="right") - 1, 0, self.nr - 2
+        )
+        fraction = (radii - self.ring_centers[index]) / self.dr
+        weights = np.zeros((len(radii), self.nr))
+        weights[np.arange(len(radii)), index] = 1 - fraction
+        weights[np.arange(len(radii)), index + 1] += fraction
+        return weights
+
+    def simulate(self, phases=None, radii=(0,)):
+        """
+        Simulate the skin grid over the defined phases.
+
+        Parameters:
+        - phases (list): Phases to simulate. Uses the phases added with add_phase if
+          None.
+        - radii (list): Radii at which the receptor response is reported [m].
+
+        Returns:
+        - dict: "time" (records,) [s] and "radii", and "T_warm", "T_surface", "R" and
+          "PSI" of shape (radii, records), recorded every second as in ReceptorModel.
+          "final_temperature" of shape (n, nr) (core side first) and "final_time" [s]
+          at the end of the last time step.
+
+        Raises:
+        - ValueError: If no phases have been added before simulation.
+        """
+        phases = list(self.phases if phases is None else phases)
+        if not phases:
+            raise ValueError("At least one phase must be added before simulation.")
+
+        # Laterally uniform warm-up with the 1-D model
+        warm_up = 0
+        while warm_up < len(phases) and not np.any(phases[warm_up]["q_irradiance"]):
+            warm_up += 1
+        if warm_up:
+            results = self.column.simulate(phases=phases[:warm_up])
+            T = np.repeat(results["final_temperature"].T, self.nr, axis=1)
+            current_time = results["final_time"]
+            time_history = results["time"].tolist()
+            T_warm_history = list(np.repeat(results["T_warm"].T, self.nr, axis=1))
+            T_surface_history = list(np.repeat(results["T_surface"].T, self.nr, axis=1))
+        else:
+            T = np.full((self.n, self.nr), self._parameter("initial_temperature"))
+            current_time = 0
+            time_history = [0]
+            T_warm_history = [self.column.receptor_weights[0] @ T]
+            T_surface_history = [T[-1].copy()]
+
+        if warm_up < len(phases):
+            r_skin2core = self._parameter("r_skin2core")
+            r_skin2amb_convection = self._parameter("r_skin2amb_convection")
+            lu, ring_areas = _factorize_system(
+                self.n,
+                self.nr,
+                self._parameter("dx"),
+                self.dr,
+                self._parameter("conductance"),
+                self._parameter("capacity"),
+                r_skin2core,
+                r_skin2amb_convection,
+                self.dt,
+            )
+            capacity = self._parameter("capacity") * ring_areas / self.dt
+            absorbed_profile = self.column.absorbed_profiles[0]
+            radiation = self.column.sigma * self._parameter("absorption_lw")
+            receptor_weights = self.column.receptor_weights[0]
+
+            for phase in phases[warm_up:]:
+                T_db = float(phase["t_db"][0])
+                T_r = float(phase["t_r"][0])
+                T_core = (
+                    self._parameter("T_core")
+                    if phase["T_core"] is None
+                    else float(phase["T_core"][0])
+                )
+
+                # Constant sources of the phase [W]
+                sources = (
+                    absorbed_profile[:, np.newaxis]
+                    * float(phase["q_irradiance"][0])
+                    * self.spot_profile
+                    * ring_areas
+                )
+                sources[0] += ring_areas * T_core / r_skin2core
+                sources[-1] += ring_areas * (
+                    T_db / r_skin2amb_convection + radiation * (T_r + 273.15) ** 4
+                )
+
+                # Number of iterations for the current phase
+                iteration_number = int(phase["duration_in_sec"] / self.dt)
+                for _ in range(iteration_number + 1):
+                    rhs = capacity * T + sources
+                    rhs[-1] -= ring_areas * radiation * (T[-1] + 273.15) ** 4
+                    T = lu.solve(rhs.ravel()).reshape(self.n, self.nr)
+                    current_time += self.dt
+
+                    # Record data at regular intervals
+                    if current_time % 1.0 < self.dt:
+                        time_history.append(int(current_time))
+                        T_warm_history.append(receptor_weights @ T)
+                        T_surface_history.append(T[-1].copy())
+
+        # Receptor response at the requested radii
+        interpolation = self._ring_interpolation(np.atleast_1d(radii))
+        T_warm = interpolation @ np.array(T_warm_history).T
+        response = calculate_receptor_response(
+            T_warm,
+            self.dt,
+            self._parameter("coef_static_warm_receptor"),
+            self._parameter("coef_dynamic_warm_receptor"),
+            self._parameter("T_no_static_discharge"),
+            self.column.time_to_integrate,
+        )
+        return {
+            "time": np.array(time_history),
+            "radii": np.atleast_1d(radii),
+            "T_warm": T_warm,
+            "T_surface": interpolation @ np.array(T_surface_history).T,
+            "R": response["R"],
+            "PSI": response["PSI"],
+            "final_temperature": T,
+            "final_time": current_time,
+        }
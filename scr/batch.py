@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _simulate_run(model, run, show_input):
+    """
+    Simulate one run with a shared model.
+
+    Parameters:
+    - model (ReceptorModel): The model used for the run. It is not modified.
+    - run (dict): Run definition with "phases" and optionally "q_spectrum".
+    - show_input (bool): If True, include input conditions in the output DataFrame.
+
+    Returns:
+    - pd.DataFrame: The simulation results.
+    """
+    return model.simulate(
+        show_input=show_input,
+        phases=run["phases"],
+        q_spectrum=run.get("q_spectrum"),
+    )
+
+
+def simulate_in_thread_pool(model, runs, max_workers=None, show_input=False):
+    """
+    Simulate many small runs of one model in a thread pool.
+
+    ReceptorModel.simulate keeps its per-run state local, so all threads share the
+    same model and its spectral tables; no process is spawned and nothing is copied.
+
+    Parameters:
+    - model (ReceptorModel): The model shared by all runs.
+    - runs (list): Run definitions. Each run is a dict with "phases" (list of phases
+      as created by ReceptorModel.add_phase) and optionally "q_spectrum".
+    - max_workers (int): Number of threads. Uses the executor default if None.
+    - show_input (bool): If True, include input conditions in the output DataFrames.
+
+    Returns:
+    - list: Simulation results (pd.DataFrame) in the order of the runs.
+
+    Usage:
+        runs = [
+            {
+                "phases": [
+                    {"duration_in_sec": 20, "t_db": 25, "t_r": 25, "q_irradiance": q}
+                ]
+            }
+            for q in [100, 200, 300]
+        ]
+        results = simulate_in_thread_pool(ReceptorModel(), runs, max_workers=4)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_simulate_run, model, run, show_input) for run in runs
+        ]
+        return [future.result() for future in futures]
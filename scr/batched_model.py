@@ -0,0 +1,497 @@
+import numpy as np
+from model import (
+    ReceptorModel,
+    _is_pandas_object,
+    calculate_heat_flux,
+    calculate_receptor_response,
+    calculate_receptor_weights,
+)
+from spectral_tables import get_tables_for_grid
+
+# Parameters that can differ between the skin patches of a batch. Radiation is
+# calculated with the Stefan-Boltzmann law, so the radiative parameter of a patch is
+# absorption_lw, not the hr of ReceptorModel (which does not enter the heat balance).
+PATCH_PARAMETERS = [
+    "length",
+    "hc",
+    "conductance",
+    "volumetric_capacity",
+    "absorption_lw",
+    "T_core",
+    "initial_temperature",
+    "coef_static_warm_receptor",
+    "coef_dynamic_warm_receptor",
+    "T_no_static_discharge",
+    "receptor_depth",
+]
+
+
+def align_spectra(model, spectra):
+    """
+    Align many spectra with the wavelength grid of a model.
+
+    Parameters:
+    - model (ReceptorModel): Model providing the wavelength grid.
+    - spectra (numpy.ndarray, pd.Series, pd.DataFrame or list): Spectral irradiance,
+      as an array of shape (spectra, wavelengths), a Series, a DataFrame with one
+      spectrum per column indexed by wavelength, or a list of Series or arrays.
+
+    Returns:
+    - numpy.ndarray: Spectra of shape (spectra, wavelengths), missing values as zero.
+    """
+    if isinstance(spectra, (list, tuple)):
+        return np.array([model._align_spectrum(spectrum) for spectrum in spectra])
+    if _is_pandas_object(spectra, "DataFrame"):
+        return np.array(
+            [model._align_spectrum(spectra[name]) for name in spectra.columns]
+        )
+    return np.atleast_2d(model._align_spectrum(spectra))
+
+
+class BatchedReceptorModel:
+    """
+    A receptor model simulating a batch of skin patches at once.
+
+    Each patch (e.g. a JOS3 body segment) has its own skin thickness, convective heat
+    transfer coefficient, long-wave absorptivity, core temperature and irradiance. The
+    temperatures of all patches are integrated together as a (batch × n) array with the
+    same heat balance and receptor equations as ReceptorModel, so the cost of a time
+    step hardly depends on the number of patches.
+
+    Usage:
+        model = BatchedReceptorModel.from_jos3_outputs(jos3_outputs, hc=4.5)
+        model.set_spectrum(spectrum)
+        model.add_phase(duration_in_sec=1000, t_db=25, t_r=25, q_irradiance=0)
+        model.add_phase(
+            duration_in_sec=20, t_db=25, t_r=25, q_irradiance=local_irradiance
+        )
+        results = model.simulate()
+        psi_map = pd.DataFrame(
+            results["PSI"], index=model.labels, columns=results["time"]
+        )
+    """
+
+    def __init__(self, labels, template=None, **parameters):
+        """
+        Parameters:
+        - labels (list): Name of each skin patch (e.g. JOS3 body segment names).
+        - template (ReceptorModel): Model providing the default parameters, the number
+          of layers, the time step and the PSI window. A new ReceptorModel if None.
+        - parameters: Per-patch parameters (see PATCH_PARAMETERS), each a scalar, an
+          array of one value per patch, or a dict of values by label. The defaults
+          are the values of the template.
+
+        Raises:
+        - ValueError: If a parameter is unknown or does not match the batch.
+        """
+        unknown_parameters = set(parameters) - set(PATCH_PARAMETERS)
+        if unknown_parameters:
+            raise ValueError(f"Unknown parameters: {sorted(unknown_parameters)}")
+
+        if template is None:
+            template = ReceptorModel()
+        self.template = template
+        self.labels = list(labels)
+        self.batch_size = len(self.labels)
+
+        # Parameters shared by all patches
+        self.n = template.n  # number of discretized skin layers
+        self.dt = template.dt  # time step for the simulation [s]
+        # integration time of PSI [s]
+        self.time_to_integrate = template.time_to_integrate
+        self.sigma = template.sigma  # [W/m²K⁴]
+
+        # Per-patch parameters
+        defaults = {
+            name: getattr(template, name)
+            for name in PATCH_PARAMETERS
+            if name != "volumetric_capacity"
+        }
+        defaults["volumetric_capacity"] = template.capacity / template.dx  # [J/m³K]
+        for name in PATCH_PARAMETERS:
+            value = parameters.get(name, defaults[name])
+            setattr(self, name, self._per_patch(value, name))
+
+        self._initialize_parameters()
+
+        # Absorbed irradiance per unit total irradiance of each patch
+        self.absorbed_profiles = np.zeros((self.batch_size, self.n))
+
+        self.phases = []  # list to store different simulation phases
+
+    @classmethod
+    def from_jos3_outputs(cls, outputs, segments=None, template=None, **parameters):
+        """
+        Create a batch of skin patches from JOS3 outputs, one patch per body segment.
+
+        Parameters:
+        - outputs (dict): JOS3 outputs with "t_core_<segment>" entries
+          (e.g. a result of jos3_simulation.precondition).
+        - segments (list): Body segments to simulate. All segments in outputs if None.
+        - template (ReceptorModel): Model providing the default parameters.
+        - parameters: Per-patch parameters (see BatchedReceptorModel).
+
+        Returns:
+        - BatchedReceptorModel: The batch of skin patches.
+        """
+        if segments is None:
+            segments = [
+                name[len("t_core_") :] for name in outputs if name.startswith("t_core_")
+            ]
+        parameters.setdefault(
+            "T_core", [outputs[f"t_core_{segment}"] for segment in segments]
+        )
+        return cls(segments, template=template, **parameters)
+
+    def select(self, indices, phases=None):
+        """
+        Create a batch of some patches of this batch, with their spectra and phases.
+
+        Parameters:
+        - indices (array-like): Indices of the patches; repeated indices repeat a patch.
+        - phases (list): Phases of this batch to select from. Uses the phases added
+          with add_phase if None.
+
+        Returns:
+        - BatchedReceptorModel: The new batch.
+        """
+        indices = np.asarray(indices, dtype=int)
+        parameters = {
+            name: getattr(self, name)[indices]
+            for name in PATCH_PARAMETERS
+            if name != "volumetric_capacity"
+        }
+        parameters["volumetric_capacity"] = (self.capacity / self.dx)[indices]
+        selected = BatchedReceptorModel(
+            [self.labels[i] for i in indices], template=self.template, **parameters
+        )
+        selected.set_absorbed_profiles(self.absorbed_profiles[indices])
+        selected.phases = [
+            {
+                name: value if value is None or np.ndim(value) == 0 else value[indices]
+                for name, value in phase.items()
+            }
+            for phase in (self.phases if phases is None else phases)
+        ]
+        return selected
+
+    def _per_patch(self, value, name):
+        """
+        Convert a parameter into an array of one value per patch.
+
+        Parameters:
+        - value (float, array-like or dict): Scalar, one value per patch, or values by
+          label.
+        - name (str): Name of the parameter, for error messages.
+
+        Returns:
+        - numpy.ndarray: Values of shape (batch,).
+
+        Raises:
+        - ValueError: If the number of values does not match the batch.
+        """
+        if isinstance(value, dict):
+            value = [value[label] for label in self.labels]
+        value = np.asarray(value, dtype=float)
+        if value.ndim == 0:
+            return np.full(self.batch_size, float(value))
+        if value.shape != (self.batch_size,):
+            raise ValueError(f"{name} must have one value per patch.")
+        return value
+
+    def _initialize_parameters(self):
+        """
+        Initialize the layer grid and thermal resistances of each patch.
+        """
+        self.dx = self.length / self.n  # thickness of each skin layer [m]
+        self.node_coordinates = self.dx[:, np.newaxis] * (
+            np.arange(self.n) + 0.5
+        )  # coordinates of each layer [m]
+
+        self.capacity = self.volumetric_capacity * self.dx  # heat capacity [J/m²K]
+        self.r_skin2core = self.dx / (2 * self.conductance)  # skin to core [m²K/W]
+        # skin layer to skin layer [m²K/W]
+        self.r_skin2skin = self.dx / self.conductance
+        self.r_skin2amb_convection = (
+            self.dx / (2 * self.conductance) + 1 / self.hc
+        )  # skin to ambient [m²K/W]
+
+        self.receptor_weights = calculate_receptor_weights(
+            self.node_coordinates, self.length, self.receptor_depth
+        )
+
+    def set_spectrum(self, q_spectrum):
+        """
+        Set the spectral irradiance of the patches and compute their absorbed profiles.
+
+        Patches with the same skin thickness share one attenuation kernel: that of the
+        spectral tables of the template for its thickness, else one built from their
+        optical properties (see spectral_tables.get_tables_for_grid).
+
+        Parameters:
+        - q_spectrum (pd.Series or numpy.ndarray): One spectrum for all patches, or an
+          array of shape (batch, wavelengths) with one spectrum per patch.
+        """
+        q_spectrum = np.asarray(self.template._align_spectrum(q_spectrum))
+        if q_spectrum.ndim == 1:
+            q_spectrum = np.broadcast_to(q_spectrum, (self.batch_size, len(q_spectrum)))
+
+        for length in np.unique(self.length):
+            patches = self.length == length
+            kernel = self._get_spectral_tables(length).attenuation_kernel
+            self.absorbed_profiles[patches] = q_spectrum[patches] @ kernel.T
+
+    def _get_spectral_tables(self, length):
+        """
+        Get the spectral tables of the template for a skin thickness.
+
+        Returns:
+        - SpectralTables: Tables of the template, rebuilt for the node grid of the
+          thickness if it differs from that of the template.
+        """
+        dx = float(length) / self.n
+        return get_tables_for_grid(
+            self.template.spectral_tables, dx * (np.arange(self.n) + 0.5), dx
+        )
+
+    def set_absorbed_profiles(self, absorbed_profiles):
+        """
+        Set the absorbed irradiance per unit total irradiance of each patch directly.
+
+        Parameters:
+        - absorbed_profiles (numpy.ndarray): Profiles of shape (batch, n) or (n,), core
+          side first.
+        """
+        self.absorbed_profiles = np.array(
+            np.broadcast_to(absorbed_profiles, (self.batch_size, self.n)), dtype=float
+        )
+
+    def add_phase(self, duration_in_sec, t_db, t_r, q_irradiance, T_core=None):
+        """
+        Add a simulation phase with specific environmental conditions.
+
+        Parameters:
+        - duration_in_sec (int): Duration of the phase in seconds.
+        - t_db (float, array-like or dict): Dry bulb temperature (°C).
+        - t_r (float, array-like or dict): Radiant temperature (°C).
+        - q_irradiance (float, array-like or dict): Total (local) irradiance (W/m²).
+        - T_core (float, array-like or dict): Core temperature (°C). Uses self.T_core if
+          None.
+
+        Raises:
+        - ValueError: If any parameter is out of a reasonable range.
+        """
+        # Validate input parameters
+        if duration_in_sec <= 0:
+            raise ValueError("Duration must be positive.")
+        q_irradiance = self._per_patch(q_irradiance, "q_irradiance")
+        if np.any(q_irradiance < 0):
+            raise ValueError("q_irradiance must be non-negative.")
+
+        self.phases.append(
+            {
+                "duration_in_sec": duration_in_sec,
+                "t_db": self._per_patch(t_db, "t_db"),
+                "t_r": self._per_patch(t_r, "t_r"),
+                "q_irradiance": q_irradiance,
+                "T_core": None if T_core is None else self._per_patch(T_core, "T_core"),
+            }
+        )
+
+    def simulate(
+        self,
+        phases=None,
+        initial_temperature=None,
+        record_temperature=False,
+        start_time=0,
+    ):
+        """
+        Simulate all patches over the defined phases.
+
+        A simulation can continue a previous one from its "final_temperature" and
+        "final_time", recording at the same times as a single longer simulation.
+
+        Parameters:
+        - phases (list): Phases to simulate. Uses the phases added with add_phase if
+          None.
+        - initial_temperature (numpy.ndarray): Initial temperatures of shape (batch, n).
+          Uses self.initial_temperature if None.
+        - record_temperature (bool): If True, also return the temperatures of all
+          layers.
+        - start_time (float): Simulation time at the start [s].
+
+        Returns:
+        - dict: "time" (records,) [s], and "T_warm", "T_surface", "R" and "PSI" of shape
+          (batch, records), recorded every second as in ReceptorModel (the first record
+          is the initial state). "final_temperature" (batch, n) and "final_time" [s] at
+          the end of the last time step. With record_temperature, "T" of shape
+          (records, batch, n).
+
+        Raises:
+        - ValueError: If no phases have been added before simulation.
+        """
+        phases = list(self.phases if phases is None else phases)
+        if not phases:
+            raise ValueError("At least one phase must be added before simulation.")
+
+        # Initialize variables for simulation
+        if initial_temperature is None:
+            initial_temperature = self.initial_temperature[:, np.newaxis]
+        capacity = self._heat_capacity()
+        T = np.array(np.broadcast_to(initial_temperature, capacity.shape), dtype=float)
+        time_step = self.dt / capacity
+        current_time = start_time  # Track current time in the simulation
+        time_history = [int(current_time)]
+        T_history = [T.copy()]
+
+        for phase in phases:
+            T_db = phase["t_db"]
+            T_r = phase["t_r"]
+            T_core = self.T_core if phase["T_core"] is None else phase["T_core"]
+            q_irradiance_nodes = (
+                self.absorbed_profiles * phase["q_irradiance"][:, np.newaxis]
+            )
+
+            # Number of iterations for the current phase
+            iteration_number = int(phase["duration_in_sec"] / self.dt)
+            for _ in range(iteration_number + 1):
+                q_total_flux = self._calculate_heat_flux(
+                    T, q_irradiance_nodes, T_db, T_r, T_core
+                )
+                T += q_total_flux * time_step
+                current_time += self.dt
+
+                # Record data at regular intervals
+                if current_time % 1.0 < self.dt:
+                    time_history.append(int(current_time))
+                    T_history.append(T.copy())
+
+        results = self._prepare_results(
+            time_history, np.array(T_history), record_temperature
+        )
+        results["final_temperature"] = T
+        results["final_time"] = current_time
+        return results
+
+    def _heat_capacity(self):
+        """
+        Heat capacity of each node of each patch.
+
+        Returns:
+        - numpy.ndarray: Heat capacities of shape (batch, nodes) [J/m²K].
+        """
+        return np.repeat(self.capacity[:, np.newaxis], self.n, axis=1)
+
+    def _calculate_heat_flux(self, T, q_irradiance_nodes, T_db, T_r, T_core):
+        """
+        Calculate the heat flux for each node of each patch.
+
+        Parameters:
+        - T (numpy.ndarray): Temperatures of shape (batch, nodes) (°C).
+        - q_irradiance_nodes (numpy.ndarray): Absorbed irradiance (W/m²) of shape
+          (batch, nodes).
+        - T_db, T_r, T_core (numpy.ndarray): Conditions of each patch (°C).
+
+        Returns:
+        - numpy.ndarray: Heat flux of shape (batch, nodes) (W/m²).
+        """
+        return calculate_heat_flux(
+            T,
+            q_irradiance_nodes,
+            T_db,
+            T_r,
+            T_core,
+            self.r_skin2skin[:, np.newaxis],
+            self.r_skin2core,
+            self.r_skin2amb_convection,
+            self.absorption_lw,
+            self.sigma,
+        )
+
+    def _prepare_results(self, time_history, T_history, record_temperature):
+        """
+        Calculate the receptor response of all patches from the temperature history.
+
+        Parameters:
+        - time_history (list): Recorded times [s].
+        - T_history (numpy.ndarray): Recorded temperatures of shape (records, batch, n).
+        - record_temperature (bool): If True, include the temperatures of all layers.
+
+        Returns:
+        - dict: The simulation results (see simulate).
+        """
+        T_warm = np.einsum(
+            "rbn,bn->br", T_history[:, :, : self.n], self.receptor_weights
+        )
+        response = calculate_receptor_response(
+            T_warm,
+            self.dt,
+            self.coef_static_warm_receptor[:, np.newaxis],
+            self.coef_dynamic_warm_receptor[:, np.newaxis],
+            self.T_no_static_discharge[:, np.newaxis],
+            self.time_to_integrate,
+        )
+        results = {
+            "time": np.array(time_history),
+            "T_warm": T_warm,
+            "T_surface": T_history[:, :, self.n - 1].T,
+            "R": response["R"],
+            "PSI": response["PSI"],
+        }
+        if record_temperature:
+            results["T"] = T_history
+        return results
+
+
+def check_absorbed_profiles(template, q_spectrum, lengths=None):
+    """
+    Compare the absorbed profiles of a batch with those of ReceptorModel.
+
+    For each skin thickness, a ReceptorModel with the spectral tables of the template
+    (rebuilt for the thickness, see ReceptorModel._set_skin_properties) and a patch of
+    a BatchedReceptorModel with the template should absorb the spectrum alike.
+
+    Parameters:
+    - template (ReceptorModel): Model providing the spectral tables.
+    - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance.
+    - lengths (list): Skin thicknesses [m]. Only that of the template if None.
+
+    Returns:
+    - float: Largest absolute difference of the absorbed irradiance of a node (W/m²).
+    """
+    if lengths is None:
+        lengths = [template.length]
+    batch = BatchedReceptorModel(range(len(lengths)), template=template, length=lengths)
+    batch.set_spectrum(q_spectrum)
+
+    difference = 0
+    for profile, length in zip(batch.absorbed_profiles, lengths):
+        model = ReceptorModel(spectral_tables=template.spectral_tables)
+        model.length = length
+        model._initialize_parameters()
+        expected = model._calculate_radiation_distribution(1, q_spectrum)
+        difference = max(difference, np.abs(profile - expected).max())
+    return difference
+
+
+if __name__ == "__main__":
+    from spectral_tables import build_spectral_tables, load_skin_properties
+
+    # Skin ten times as absorbing as the default tables
+    default = ReceptorModel()
+    properties = load_skin_properties()
+    properties["absorption_coefficient_1/mm"] = (
+        properties["absorption_coefficient_1/mm"] * 10
+    )
+    template = ReceptorModel(
+        spectral_tables=build_spectral_tables(
+            default.wavelengths, default.node_coordinates, default.dx, properties
+        )
+    )
+    q_spectrum = (template.wavelengths == 1000).astype(float)
+    difference = check_absorbed_profiles(
+        template, q_spectrum, [template.length, 3e-3, 8e-3]
+    )
+    print(f"Largest difference of the absorbed profiles: {difference:.3g} W/m²")
+    if difference > 1e-12:
+        raise SystemExit("The batch does not use the spectral tables of the template.")
@@ -0,0 +1,395 @@
+"""
+Calibration of the receptor parameters to the thermal sensation votes.
+
+The lanes run with the thermal model of main.simulate_experiment_and_get_dataframe,
+whose PSI the calibration fits: main.py sets the "hc" of the experiments after the
+thermal resistances are built, so the experiments run with the default hc of
+ReceptorModel (4 W/m²K), and so do the lanes (see experiments.py).
+"""
+
+import hashlib
+import json
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import configration
+from batched_model import BatchedReceptorModel
+from experiments import (
+    experiments_summary_dict,
+    get_total_irradiance,
+    load_experiment_spectra,
+)
+from model import ReceptorModel, calculate_receptor_response, calculate_receptor_weights
+
+SENSATION_VOTE_PATH = os.path.join(
+    configration.DATA_DIRECTORY, "psi_vs_sensation_vote.csv"
+)
+# Experiments in the order of the rows of the sensation votes
+EXPERIMENTS = ["Narita_1999", "Matsui_1986", "Nomoto_2021"]
+# Pairs of radiations (indices of "rad_names") compared in each row of an experiment
+RADIATION_PAIRS = [(0, 1), (1, 2), (0, 2)]
+# Bounds of the calibrated parameters
+DEFAULT_BOUNDS = {
+    "coef_static_warm_receptor": (0.1, 10),  # [Hz/K]
+    "coef_dynamic_warm_receptor": (1, 200),  # [Hz·s/K]
+    "receptor_depth": (0.1e-3, 1.5e-3),  # [m]
+    "T_no_static_discharge": (30, 36),  # [°C]
+    "time_to_integrate": (1, 50),  # [s], as used for the PSI window of the model
+}
+
+
+def load_sensation_votes(path=SENSATION_VOTE_PATH):
+    """
+    Load the differences of thermal sensation votes between pairs of radiations.
+
+    Parameters:
+    - path (str): Path to the CSV file.
+
+    Returns:
+    - pd.DataFrame: Columns "experiment", "delta_PSI/PSI", "delta_TSV" and
+      "delta_TSV_SD", three rows per experiment in the order of RADIATION_PAIRS.
+    """
+    import pandas as pd
+
+    votes = pd.read_csv(path)
+    votes.columns = ["experiment"] + list(votes.columns[1:])
+    return votes
+
+
+def _experiment_lanes(template):
+    """
+    Define one lane of BatchedReceptorModel per radiation of each experiment.
+
+    Returns:
+    - tuple: (list of lane conditions, spectra of shape (lanes, wavelengths)).
+    """
+    lanes = []
+    spectra = []
+    for which_experiment in EXPERIMENTS:
+        experiment_dict = experiments_summary_dict[which_experiment]
+        experiment_spectra = load_experiment_spectra(which_experiment)
+        for rad_name in experiment_dict["rad_names"]:
+            lanes.append(
+                {
+                    "experiment": which_experiment,
+                    "rad_name": rad_name,
+                    "q_irradiance": get_total_irradiance(which_experiment, rad_name),
+                    "t_db": experiment_dict["t_db"],
+                    "t_r": experiment_dict["t_r"],
+                    "T_core": experiment_dict["t_core"],
+                }
+            )
+            spectra.append(template._align_spectrum(experiment_spectra[rad_name]))
+    return lanes, np.array(spectra)
+
+
+def _history_key(lanes, spectra, template, warm_up_duration, duration):
+    """
+    Create a cache key from the lanes, the spectra and the thermal parameters.
+    """
+    thermal_parameters = {
+        name: float(getattr(template, name))
+        for name in [
+            "length",
+            "n",
+            "dt",
+            "conductance",
+            "capacity",
+            "hc",
+            "absorption_lw",
+            "initial_temperature",
+            "sigma",
+        ]
+    }
+    content = json.dumps(
+        {
+            "lanes": lanes,
+            "thermal_parameters": thermal_parameters,
+            "durations": [warm_up_duration, duration],
+            "spectra": hashlib.sha1(spectra.tobytes()).hexdigest(),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def simulate_temperature_histories(
+    template=None,
+    warm_up_duration=1000,
+    duration=20,
+    cache_directory=configration.CALIBRATION_CACHE_DIRECTORY,
+):
+    """
+    Simulate the temperature histories of all radiations of all experiments.
+
+    The receptor parameters do not enter the heat balance, so the histories (including
+    the warm-up) are simulated once, in one batched run, and reused by every evaluation
+    of the calibration. They are cached by conditions, spectra and thermal parameters.
+
+    Parameters:
+    - template (ReceptorModel): Model providing the thermal parameters.
+    - warm_up_duration (int): Duration of the phase without irradiation [s].
+    - duration (int): Duration of the irradiation [s].
+    - cache_directory (str): Directory of the cached histories. No cache is used if
+      None.
+
+    Returns:
+    - dict: "lanes" (conditions of each lane), "time" (records,) [s] and "T" of shape
+      (records, lanes, n).
+    """
+    if template is None:
+        template = ReceptorModel()
+    lanes, spectra = _experiment_lanes(template)
+    key = _history_key(lanes, spectra, template, warm_up_duration, duration)
+
+    path = None
+    if cache_directory is not None:
+        path = os.path.join(cache_directory, key + ".npz")
+        if os.path.exists(path):
+            with np.load(path) as cached:
+                return {"lanes": lanes, "time": cached["time"], "T": cached["T"]}
+
+    model = BatchedReceptorModel(
+        [f"{lane['experiment']}_{lane['rad_name']}" for lane in lanes],
+        template=template,
+        T_core=[lane["T_core"] for lane in lanes],
+    )
+    model.set_spectrum(spectra)
+    t_db = [lane["t_db"] for lane in lanes]
+    t_r = [lane["t_r"] for lane in lanes]
+    model.add_phase(warm_up_duration, t_db, t_r, q_irradiance=0)
+    model.add_phase(
+        duration, t_db, t_r, q_irradiance=[lane["q_irradiance"] for lane in lanes]
+    )
+    results = model.simulate(record_temperature=True)
+
+    if path is not None:
+        # Save atomically, so that an interrupted run leaves no partial file
+        os.makedirs(cache_directory, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(temporary_path, time=results["time"], T=results["T"])
+        os.replace(temporary_path, path)
+
+    return {"lanes": lanes, "time": results["time"], "T": results["T"]}
+
+
+def evaluate_parameters(histories, votes, parameters, template=None, records=21):
+    """
+    Evaluate the fit of receptor parameters to the sensation votes.
+
+    As in main.py, the PSI of a radiation is the sum of PSI over the last records,
+    and the PSI ratio is divided by the largest PSI of the experiment. The differences
+    of PSI ratio between pairs of radiations are related to the differences of
+    sensation votes by a slope through the origin, fitted by least squares weighted
+    with the standard deviations of the votes. Scaling both receptor coefficients by
+    the same factor leaves the PSI ratios unchanged.
+
+    Parameters:
+    - histories (dict): Result of simulate_temperature_histories.
+    - votes (pd.DataFrame): Result of load_sensation_votes.
+    - parameters (dict): Receptor parameters (see DEFAULT_BOUNDS). Missing parameters
+      are taken from the template.
+    - template (ReceptorModel): Model providing the default parameters.
+    - records (int): Number of last records summed into the PSI of a radiation.
+
+    Returns:
+    - dict: "PSI" and "ratio" by lane, "delta_ratio" by row of the votes, "slope" and
+      "objective" (weighted sum of squared residuals).
+    """
+    if template is None:
+        template = ReceptorModel()
+    values = {
+        name: parameters.get(name, getattr(template, name)) for name in DEFAULT_BOUNDS
+    }
+
+    weights = calculate_receptor_weights(
+        template.node_coordinates, template.length, values["receptor_depth"]
+    )
+    T_warm = (histories["T"] @ weights).T  # (lanes, records)
+    response = calculate_receptor_response(
+        T_warm,
+        template.dt,
+        values["coef_static_warm_receptor"],
+        values["coef_dynamic_warm_receptor"],
+        values["T_no_static_discharge"],
+        values["time_to_integrate"],
+    )
+    psi = response["PSI"][:, -records:].sum(axis=1)
+
+    # PSI ratios within each experiment and their differences between radiations
+    psi = psi.reshape(len(EXPERIMENTS), -1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = psi / psi.max(axis=1, keepdims=True)
+    delta_ratio = np.abs(
+        np.array([[row[i] - row[j] for i, j in RADIATION_PAIRS] for row in ratio])
+    ).ravel()
+
+    y = votes["delta_TSV"].to_numpy()
+    sd = votes["delta_TSV_SD"].to_numpy()
+    slope = np.sum(delta_ratio * y / sd**2) / np.sum(delta_ratio**2 / sd**2)
+    objective = np.sum(((y - slope * delta_ratio) / sd) ** 2)
+    if not np.isfinite(objective):
+        objective = np.inf
+
+    return {
+        "PSI": psi.ravel(),
+        "ratio": ratio.ravel(),
+        "delta_ratio": delta_ratio,
+        "slope": float(slope),
+        "objective": float(objective),
+    }
+
+
+def _load_state(path):
+    """
+    Load an optimizer state, or return None if it does not exist.
+    """
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _save_state(path, state):
+    """
+    Save an optimizer state atomically, so that an interrupted run leaves no partial
+    file.
+    """
+    if path is None:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=2)
+    os.replace(temporary_path, path)
+
+
+def calibrate(
+    state_path=None,
+    bounds=DEFAULT_BOUNDS,
+    population_size=20,
+    generations=100,
+    mutation=0.7,
+    crossover=0.9,
+    seed=0,
+    max_workers=None,
+    template=None,
+    cache_directory=configration.CALIBRATION_CACHE_DIRECTORY,
+):
+    """
+    Fit receptor parameters jointly across all experiments to the sensation votes.
+
+    The parameters are fitted by differential evolution within the bounds. The
+    candidates of a generation are evaluated in a thread pool on the cached
+    temperature histories, and the optimizer state is saved to a JSON file after
+    every generation, so an interrupted fit resumes from its last generation.
+
+    Parameters:
+    - state_path (str): Path of the JSON optimizer state. The fit is not resumable if
+      None.
+    - bounds (dict): (lower, upper) bounds by parameter (see DEFAULT_BOUNDS).
+    - population_size (int): Number of candidates per generation.
+    - generations (int): Total number of generations, including resumed ones.
+    - mutation (float): Differential weight of differential evolution.
+    - crossover (float): Crossover probability of differential evolution.
+    - seed (int): Seed of the random number generator.
+    - max_workers (int): Number of threads evaluating candidates.
+    - template (ReceptorModel): Model providing the thermal and default parameters.
+    - cache_directory (str): Directory of the cached temperature histories.
+
+    Returns:
+    - dict: "parameters" (best parameters), "evaluation" (see evaluate_parameters)
+      and "generation" (number of generations done).
+
+    Raises:
+    - ValueError: If the saved state was created with other bounds.
+    """
+    if template is None:
+        template = ReceptorModel()
+    names = list(bounds)
+    lower = np.array([bounds[name][0] for name in names], dtype=float)
+    upper = np.array([bounds[name][1] for name in names], dtype=float)
+
+    histories = simulate_temperature_histories(
+        template, cache_directory=cache_directory
+    )
+    votes = load_sensation_votes()
+
+    def evaluate(unit_candidates):
+        candidates = [
+            dict(zip(names, (lower + unit * (upper - lower)).tolist()))
+            for unit in unit_candidates
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            evaluations = executor.map(
+                lambda candidate: evaluate_parameters(
+                    histories, votes, candidate, template
+                )["objective"],
+                candidates,
+            )
+            return np.array(list(evaluations))
+
+    # Resume from the saved state, or start from a random population
+    state = _load_state(state_path)
+    if state is not None:
+        if state["bounds"] != {name: list(bounds[name]) for name in names}:
+            raise ValueError("The saved optimizer state was created with other bounds.")
+        population = np.array(state["population"])
+        fitness = np.array(
+            [np.inf if value is None else value for value in state["fitness"]]
+        )
+        generation = state["generation"]
+    else:
+        rng = np.random.default_rng(seed)
+        population = rng.random((population_size, len(names)))
+        fitness = evaluate(population)
+        generation = 0
+
+    while generation < generations:
+        # Each generation has its own random stream, so a resumed fit is reproducible
+        rng = np.random.default_rng([seed, generation])
+        size = len(population)
+        trials = np.empty_like(population)
+        for i in range(size):
+            a, b, c = rng.choice([j for j in range(size) if j != i], 3, replace=False)
+            mutant = population[a] + mutation * (population[b] - population[c])
+            crossing = rng.random(len(names)) < crossover
+            crossing[rng.integers(len(names))] = True
+            trials[i] = np.clip(np.where(crossing, mutant, population[i]), 0, 1)
+
+        trial_fitness = evaluate(trials)
+        improved = trial_fitness <= fitness
+        population[improved] = trials[improved]
+        fitness[improved] = trial_fitness[improved]
+        generation += 1
+
+        best = int(np.argmin(fitness))
+        _save_state(
+            state_path,
+            {
+                "bounds": {name: list(bounds[name]) for name in names},
+                "parameters": names,
+                "population": population.tolist(),
+                "fitness": [
+                    value if np.isfinite(value) else None for value in fitness.tolist()
+                ],
+                "generation": generation,
+                "seed": seed,
+                "best": dict(
+                    zip(names, (lower + population[best] * (upper - lower)).tolist())
+                ),
+                "best_objective": float(fitness[best]),
+            },
+        )
+
+    best = int(np.argmin(fitness))
+    parameters = dict(zip(names, (lower + population[best] * (upper - lower)).tolist()))
+    return {
+        "parameters": parameters,
+        "evaluation": evaluate_parameters(histories, votes, parameters, template),
+        "generation": generation,
+    }
@@ -0,0 +1,315 @@
+from functools import lru_cache
+
+import numpy as np
+from batched_model import BatchedReceptorModel
+from model import calculate_heat_flux
+from spectral_tables import DEFAULT_WAVELENGTHS
+from spectrum_synthesis import align_transmission
+
+CLO = 0.155  # thermal insulation of 1 clo [m²K/W]
+
+
+class FabricLayer:
+    """
+    Optical and thermal properties of one fabric layer.
+
+    The spectral properties are the same on both sides of the fabric; the absorptance
+    is 1 - transmittance - reflectance.
+    """
+
+    def __init__(
+        self,
+        transmittance,
+        reflectance,
+        heat_capacity=250,
+        emissivity=0.9,
+        wavelengths=DEFAULT_WAVELENGTHS,
+    ):
+        """
+        Parameters:
+        - transmittance (float, numpy.ndarray or pd.Series): Spectral transmittance [-],
+          a constant (gray fabric), an array on the wavelength grid, or a Series indexed
+          by wavelength [nm] (see spectrum_synthesis.align_transmission).
+        - reflectance (float, numpy.ndarray or pd.Series): Spectral reflectance [-].
+        - heat_capacity (float): Heat capacity of the fabric [J/m²K].
+        - emissivity (float): Long wavelength emissivity of the outer surface [-].
+        - wavelengths (numpy.ndarray): Wavelength grid of the model [nm].
+
+        Raises:
+        - ValueError: If the properties are outside [0, 1] or their sum exceeds one.
+        """
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        self.transmittance = np.broadcast_to(
+            align_transmission(transmittance, wavelengths), wavelengths.shape
+        ).copy()
+        self.reflectance = np.broadcast_to(
+            align_transmission(reflectance, wavelengths), wavelengths.shape
+        ).copy()
+        self.absorptance = 1 - self.transmittance - self.reflectance
+        if (
+            np.any(self.transmittance < 0)
+            or np.any(self.reflectance < 0)
+            or np.any(self.absorptance < -1e-12)
+        ):
+            raise ValueError(
+                "transmittance and reflectance must be non-negative with a sum of at "
+                "most one."
+            )
+        self.absorptance = np.maximum(self.absorptance, 0)
+        self.heat_capacity = heat_capacity
+        self.emissivity = emissivity
+
+
+def calculate_stack_kernel(skin_kernel, skin_reflectance, layers):
+    """
+    Combine fabric layers with the skin kernel by the adding method.
+
+    The multiple reflections between the layers and the skin are summed per wavelength
+    in closed form: going outwards, the reflectance of a layer over the stack below it
+    is ρ + τ² R / (1 - ρ R); going inwards, the downward flux under a layer is
+    τ d / (1 - ρ R).
+
+    Parameters:
+    - skin_kernel (numpy.ndarray): Attenuation kernel of the bare skin, shape
+      (n, wavelengths), core side first.
+    - skin_reflectance (numpy.ndarray): Spectral reflectance of the skin [-].
+    - layers (list): FabricLayer instances from the skin outwards.
+
+    Returns:
+    - numpy.ndarray: Kernel of shape (n + layers, wavelengths): the absorbed fraction
+      of the irradiance on the outer layer at each skin node (core side first), then
+      at each fabric layer from the skin outwards.
+    """
+    # Reflectance of the stack below each layer, from the skin outwards
+    below = [np.asarray(skin_reflectance, dtype=float)]
+    for layer in layers:
+        R = below[-1]
+        below.append(
+            layer.reflectance + layer.transmittance**2 * R / (1 - layer.reflectance * R)
+        )
+
+    # Downward fluxes from the outer layer inwards
+    down = np.ones_like(below[0])
+    absorbed = [None] * len(layers)
+    for k in reversed(range(len(layers))):
+        layer = layers[k]
+        R = below[k]
+        down_below = layer.transmittance * down / (1 - layer.reflectance * R)
+        absorbed[k] = layer.absorptance * (down + R * down_below)
+        down = down_below
+
+    return np.vstack([skin_kernel * down] + absorbed)
+
+
+@lru_cache(maxsize=32)
+def _get_cached_stack_kernel(skin_kernel, n, skin_reflectance, layers):
+    """
+    Calculate a stack kernel from hashable arguments (see get_stack_kernel).
+    """
+    kernel = calculate_stack_kernel(
+        np.frombuffer(skin_kernel).reshape(n, -1),
+        np.frombuffer(skin_reflectance),
+        [
+            FabricLayer(np.frombuffer(transmittance), np.frombuffer(reflectance))
+            for transmittance, reflectance in layers
+        ],
+    )
+    kernel.flags.writeable = False
+    return kernel
+
+
+def get_stack_kernel(layers, tables):
+    """
+    Get the kernel of fabric layers over the skin, cached by the stack definition and
+    the skin kernel and reflectance.
+
+    Parameters:
+    - layers (list): FabricLayer instances from the skin outwards, on the wavelength
+      grid of the tables.
+    - tables (SpectralTables): Spectral tables of the skin for its node grid (e.g. the
+      spectral_tables of a ReceptorModel).
+
+    Returns:
+    - numpy.ndarray: Read-only kernel (see calculate_stack_kernel).
+    """
+    key = tuple(
+        (layer.transmittance.tobytes(), layer.reflectance.tobytes()) for layer in layers
+    )
+    skin_kernel = np.ascontiguousarray(tables.attenuation_kernel, dtype=float)
+    return _get_cached_stack_kernel(
+        skin_kernel.tobytes(),
+        skin_kernel.shape[0],
+        np.ascontiguousarray(tables.reflectance, dtype=float).tobytes(),
+        key,
+    )
+
+
+class ClothedReceptorModel(BatchedReceptorModel):
+    """
+    A batch of skin patches covered by fabric layers.
+
+    The irradiance reaches the skin through the optical stack of the fabric layers
+    (see calculate_stack_kernel), and each layer is a thermal node that absorbs
+    irradiance. Heat flows from the skin surface through the layers, with the
+    clothing insulation of each patch split evenly between them, and the outer layer
+    exchanges heat with the environment by convection and long wavelength radiation.
+    Patches without clothing (clo = 0) are bare skin.
+
+    The stack kernel is computed once per stack and skin grid, so a clothed run costs
+    the same as a bare-skin run with a few more nodes.
+
+    Usage:
+        shirt = FabricLayer(transmittance=0.1, reflectance=0.4)
+        model = ClothedReceptorModel.from_jos3_outputs(
+            outputs, layers=[shirt], clo=condition["clo"]
+        )
+        model.set_spectrum(spectrum)
+        model.add_phase(duration_in_sec=1000, t_db=25, t_r=25, q_irradiance=0)
+        model.add_phase(duration_in_sec=20, t_db=25, t_r=25, q_irradiance=300)
+        results = model.simulate()
+    """
+
+    def __init__(self, labels, layers, clo, template=None, **parameters):
+        """
+        Parameters:
+        - labels (list): Name of each skin patch (e.g. JOS3 body segment names).
+        - layers (list): FabricLayer instances from the skin outwards.
+        - clo (float, array-like or dict): Clothing insulation of each patch [clo], e.g.
+          the "clo" of a JOS3 condition.
+        - template (ReceptorModel): Model providing the default parameters.
+        - parameters: Per-patch parameters (see BatchedReceptorModel).
+
+        Raises:
+        - ValueError: If there are no layers, a parameter does not match the batch, or
+          the time step is too long for the explicit update of the fabric layers.
+        """
+        if not layers:
+            raise ValueError("At least one fabric layer is required.")
+        self.layers = list(layers)
+        super().__init__(labels, template=template, **parameters)
+        self.clo = self._per_patch(clo, "clo")
+        self.clothed = self.clo > 0
+
+        # Resistances of the links from the skin surface through the layers [m²K/W]
+        # (unused for bare patches)
+        m = len(self.layers)
+        gap = CLO * np.where(self.clothed, self.clo, 1)[:, np.newaxis] / m
+        self.r_links = np.repeat(gap, m, axis=1)
+        self.r_links[:, 0] += self.dx / (2 * self.conductance)
+        self.emissivity = self.layers[-1].emissivity
+
+        # The explicit Euler step of a fabric layer is stable (and free of
+        # oscillations) if dt is at most its heat capacity over its total conductance;
+        # the radiation of the outer layer is linearized at 60 °C.
+        conductance = 1 / self.r_links
+        conductance[:, :-1] += 1 / self.r_links[:, 1:]
+        conductance[:, -1] += (
+            self.hc + 4 * self.sigma * self.emissivity * (60 + 273.15) ** 3
+        )
+        fabric = np.array([layer.heat_capacity for layer in self.layers], dtype=float)
+        time_constant = (fabric / conductance)[self.clothed]
+        if np.any(time_constant < self.dt):
+            raise ValueError(
+                f"The time step of {self.dt} s exceeds the time constant of a fabric "
+                f"layer ({time_constant.min():.3g} s); increase the heat capacity or "
+                "the insulation of the layers."
+            )
+
+        self.absorbed_profiles = np.zeros((self.batch_size, self.n + m))
+
+    def set_spectrum(self, q_spectrum):
+        """
+        Set the spectral irradiance on the patches and compute their absorbed profiles.
+
+        Parameters:
+        - q_spectrum (pd.Series or numpy.ndarray): One spectrum for all patches, or an
+          array of shape (batch, wavelengths) with one spectrum per patch.
+        """
+        q_spectrum = np.asarray(self.template._align_spectrum(q_spectrum))
+        if q_spectrum.ndim == 1:
+            q_spectrum = np.broadcast_to(q_spectrum, (self.batch_size, len(q_spectrum)))
+
+        self.absorbed_profiles[:] = 0
+        for length in np.unique(self.length):
+            tables = self._get_spectral_tables(length)
+            patches = (self.length == length) & self.clothed
+            kernel = get_stack_kernel(self.layers, tables)
+            self.absorbed_profiles[patches] = q_spectrum[patches] @ kernel.T
+
+            patches = (self.length == length) & ~self.clothed
+            kernel = tables.attenuation_kernel
+            self.absorbed_profiles[patches, : self.n] = q_spectrum[patches] @ kernel.T
+
+    def set_absorbed_profiles(self, absorbed_profiles):
+        """
+        Set the absorbed irradiance per unit total irradiance of each patch directly.
+
+        Parameters:
+        - absorbed_profiles (numpy.ndarray): Profiles of shape (batch, n + layers) or
+          (n + layers,), skin nodes (core side first), then fabric layers.
+        """
+        self.absorbed_profiles = np.array(
+            np.broadcast_to(
+                absorbed_profiles, (self.batch_size, self.n + len(self.layers))
+            ),
+            dtype=float,
+        )
+
+    def _heat_capacity(self):
+        """
+        Heat capacity of the skin nodes and the fabric layers of each patch.
+
+        Returns:
+        - numpy.ndarray: Heat capacities of shape (batch, n + layers) [J/m²K].
+        """
+        fabric = np.array([layer.heat_capacity for layer in self.layers], dtype=float)
+        return np.hstack(
+            [
+                super()._heat_capacity(),
+                np.broadcast_to(fabric, (self.batch_size, len(self.layers))),
+            ]
+        )
+
+    def _calculate_heat_flux(self, T, q_irradiance_nodes, T_db, T_r, T_core):
+        """
+        Calculate the heat flux for the skin nodes and the fabric layers.
+
+        Parameters:
+        - T (numpy.ndarray): Temperatures of shape (batch, n + layers) (°C).
+        - q_irradiance_nodes (numpy.ndarray): Absorbed irradiance of shape (batch, n +
+          layers) (W/m²).
+        - T_db, T_r, T_core (numpy.ndarray): Conditions of each patch (°C).
+
+        Returns:
+        - numpy.ndarray: Heat flux of shape (batch, n + layers) (W/m²).
+        """
+        skin, fabric = T[:, : self.n], T[:, self.n :]
+
+        # The innermost layer replaces the environment of the clothed skin surface
+        q_skin = calculate_heat_flux(
+            skin,
+            q_irradiance_nodes[:, : self.n],
+            np.where(self.clothed, fabric[:, 0], T_db),
+            T_r,
+            T_core,
+            self.r_skin2skin[:, np.newaxis],
+            self.r_skin2core,
+            np.where(self.clothed, self.r_links[:, 0], self.r_skin2amb_convection),
+            np.where(self.clothed, 0, self.absorption_lw),
+            self.sigma,
+        )
+
+        # Conduction from the skin surface through the layers
+        q_links = (np.hstack([skin[:, -1:], fabric[:, :-1]]) - fabric) / self.r_links
+        q_fabric = q_irradiance_nodes[:, self.n :] + q_links
+        q_fabric[:, :-1] -= q_links[:, 1:]
+
+        # Convection and radiation at the outer layer
+        q_fabric[:, -1] += (T_db - fabric[:, -1]) * self.hc + (
+            self.sigma
+            * self.emissivity
+            * ((T_r + 273.15) ** 4 - (fabric[:, -1] + 273.15) ** 4)
+        )
+        q_fabric[~self.clothed] = 0
+
+        return np.hstack([q_skin, q_fabric])
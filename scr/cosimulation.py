@@ -0,0 +1,183 @@
+import math
+
+import numpy as np
+
+
+class CoupledSimulation:
+    """
+    Multirate co-simulation of the JOS3 whole-body model and ReceptorModel instances.
+
+    JOS3 is advanced with its macro time step (60 s by default) under the ambient
+    conditions of each phase. Each ReceptorModel keeps its own time step: its core
+    temperature is linearly interpolated between the JOS3 macro steps of its body
+    segment, and it sees the same ambient conditions as JOS3. The coupling is one-way
+    (the skin patches do not feed back into JOS3), so the body model is run first and
+    each skin model is then integrated over the whole exposure.
+
+    Usage:
+        jos3_model = jos3_simulation.create_jos3_model(
+            jos3_simulation.Nomoto2021("male")
+        )
+        simulation = CoupledSimulation(
+            jos3_model, {"chest": ReceptorModel(), "left_hand": ReceptorModel()}
+        )
+        simulation.add_phase(duration_in_sec=3600, tdb=25, tr=25, rh=50, v=0.1)
+        simulation.add_phase(duration_in_sec=600, tdb=25, tr=25, rh=50, v=0.1,
+                             q_irradiance={"chest": 200})
+        body, skin = simulation.simulate()
+    """
+
+    def __init__(
+        self, jos3_model, receptor_models, macro_dt=60, core_temperature="t_core"
+    ):
+        """
+        Parameters:
+        - jos3_model (JOS3): Whole-body model, set to its initial condition.
+        - receptor_models (dict): ReceptorModel instances by JOS3 body segment name.
+        - macro_dt (float): Time step of JOS3 [s].
+        - core_temperature (str): JOS3 property used as the core temperature of the
+          skin models (e.g. "t_core" or "t_muscle").
+
+        Raises:
+        - ValueError: If a segment name is not a JOS3 body segment.
+        """
+        unknown_segments = set(receptor_models) - set(jos3_model.body_names)
+        if unknown_segments:
+            raise ValueError(f"Unknown body segments: {sorted(unknown_segments)}")
+
+        self.jos3_model = jos3_model
+        self.receptor_models = receptor_models
+        self.macro_dt = macro_dt  # time step of JOS3 [s]
+        self.core_temperature = core_temperature
+        self.phases = []  # list to store different simulation phases
+
+    def add_phase(self, duration_in_sec, tdb, tr, rh, v, q_irradiance=0):
+        """
+        Add a simulation phase with specific environmental conditions.
+
+        Parameters:
+        - duration_in_sec (int): Duration of the phase in seconds.
+        - tdb (float): Dry bulb temperature (°C).
+        - tr (float): Radiant temperature (°C).
+        - rh (float): Relative humidity (%).
+        - v (float): Air velocity (m/s).
+        - q_irradiance (float or dict): Total irradiance on the skin models (W/m²),
+          or a dict of irradiance by body segment (0 for missing segments).
+
+        Raises:
+        - ValueError: If any parameter is out of a reasonable range.
+        """
+        # Validate input parameters
+        if duration_in_sec <= 0:
+            raise ValueError("Duration must be positive.")
+
+        self.phases.append(
+            {
+                "duration_in_sec": duration_in_sec,
+                "tdb": tdb,
+                "tr": tr,
+                "rh": rh,
+                "v": v,
+                "q_irradiance": q_irradiance,
+            }
+        )
+
+    def _simulate_body(self):
+        """
+        Advance JOS3 over all phases with its macro time step.
+
+        The number of macro steps of a phase is rounded up and the step is shortened
+        so that the phase boundaries fall on macro steps.
+
+        Returns:
+        - dict: "time" [s] of each macro step (starting at 0) and the core temperature
+          of each body segment at these times (°C).
+        """
+        times = [0.0]
+        core_temperatures = [getattr(self.jos3_model, self.core_temperature)]
+
+        for phase in self.phases:
+            self.jos3_model.tdb = phase["tdb"]
+            self.jos3_model.tr = phase["tr"]
+            self.jos3_model.rh = phase["rh"]
+            self.jos3_model.v = phase["v"]
+
+            macro_steps = math.ceil(phase["duration_in_sec"] / self.macro_dt)
+            dtime = phase["duration_in_sec"] / macro_steps
+            for _ in range(macro_steps):
+                self.jos3_model.simulate(1, dtime=dtime, output=False)
+                times.append(times[-1] + dtime)
+                core_temperatures.append(
+                    getattr(self.jos3_model, self.core_temperature)
+                )
+
+        core_temperatures = np.array(core_temperatures)
+        trajectory = {"time": np.array(times)}
+        for index, segment in enumerate(self.jos3_model.body_names):
+            trajectory[segment] = core_temperatures[:, index]
+        return trajectory
+
+    def _receptor_phases(self, model, segment, trajectory):
+        """
+        Create the phases of a skin model with its core temperature interpolated
+        between the JOS3 macro steps.
+
+        Parameters:
+        - model (ReceptorModel): The skin model of the segment.
+        - segment (str): JOS3 body segment name.
+        - trajectory (dict): Result of _simulate_body.
+
+        Returns:
+        - list: Phases for ReceptorModel.simulate.
+        """
+        phases = []
+        start_time = 0  # start of the phase on the clock of the skin model [s]
+        for phase in self.phases:
+            q_irradiance = phase["q_irradiance"]
+            if isinstance(q_irradiance, dict):
+                q_irradiance = q_irradiance.get(segment, 0)
+
+            phases.append(
+                {
+                    "duration_in_sec": phase["duration_in_sec"],
+                    "t_db": phase["tdb"],
+                    "t_r": phase["tr"],
+                    "q_irradiance": q_irradiance,
+                    "T_core": (trajectory["time"] - start_time, trajectory[segment]),
+                }
+            )
+            start_time += (int(phase["duration_in_sec"] / model.dt) + 1) * model.dt
+        return phases
+
+    def simulate(self, show_input=False):
+        """
+        Run the co-simulation over all phases.
+
+        JOS3 is advanced from its current state, so call simulate once per model.
+
+        Parameters:
+        - show_input (bool): If True, include input conditions in the skin results.
+
+        Returns:
+        - tuple: (pd.DataFrame of the JOS3 core temperatures by segment at the macro
+          steps, dict of ReceptorModel results by segment).
+
+        Raises:
+        - ValueError: If no phases have been added before simulation.
+        """
+        import pandas as pd
+
+        if not self.phases:
+            raise ValueError("At least one phase must be added before simulation.")
+
+        trajectory = self._simulate_body()
+
+        skin_results = {}
+        for segment, model in self.receptor_models.items():
+            skin_results[segment] = model.simulate(
+                show_input=show_input,
+                phases=self._receptor_phases(model, segment, trajectory),
+            )
+
+        body_results = pd.DataFrame(trajectory).set_index("time")
+        return body_results, skin_results
@@ -0,0 +1,128 @@
+import configration as config
+
+# Define summary dictionary including experimental infomation
+# main.py sets "hc" and "hr" after ReceptorModel has built its thermal resistances, so
+# the simulations of main.py (and their CSV files in the data directory) run with the
+# default hc of ReceptorModel (4 W/m²K), not with these values. The other analyses
+# follow the same convention and do not apply them, so their PSI matches main.py.
+experiments_summary_dict = {
+    "Narita_1999": {
+        "q_total": 1220,
+        "t_db": 24.7,
+        "t_r": 25.5,
+        "t_core": 35.9,
+        "hc": 6.4,
+        "hr": 5.1,
+        "data_path": config.NARITA_EXP_SPECTRUM_DATA_PATH,
+        "rad_names": [
+            "Visible (0.30–0.84 µm)",
+            "Near-infrared (0.80 – 1.35 µm)",
+            "Mid-infrared (1.70 – 2.30 µm)",
+        ],
+        "figure_configuration": {
+            "y_axis_temperature_range": [34, 38],
+            "y_axis_temperature_ticks": list(range(34, 39, 1)),
+            "y_axis_absorbed_irradiance_range": [0, 400],
+            "y_axis_absorbed_irradiance_ticks": list(range(0, 500, 100)),
+            "y_axis_impulse_frequency_range": [0, 20],
+            "y_axis_impulse_frequency_ticks": list(range(0, 25, 5)),
+        },
+    },
+    "Matsui_1986": {
+        "q_total": 2000,
+        "t_db": 19.5,
+        "t_r": 19.5,
+        "t_core": 32.5,
+        "hc": 4.5,
+        "hr": 5.1,
+        "data_path": config.MATSUI_EXP_SPECTRUM_DATA_PATH,
+        "rad_names": [
+            "Near- to mid-infrared  (0.72 - 2.7µm)",
+            "Mid- to far-infrared (1.5 - 4.8µm)",
+            "Far-infrared  (6 - 20µm)",
+        ],
+        "figure_configuration": {
+            "y_axis_temperature_range": [30, 40],
+            "y_axis_temperature_ticks": list(range(30, 41, 2)),
+            "y_axis_absorbed_irradiance_range": [0, 2000],
+            "y_axis_absorbed_irradiance_ticks": list(range(0, 2500, 500)),
+            "y_axis_impulse_frequency_range": [0, 25],
+            "y_axis_impulse_frequency_ticks": list(range(0, 30, 5)),
+        },
+    },
+    "Nomoto_2021": {
+        "q_a": 228,
+        "q_b": 184,
+        "q_c": 211,
+        "t_db": 25.3,
+        "t_r": 25.2,
+        "t_core": 35.5,
+        "hc": 4.5,
+        "hr": 5.1,
+        "data_path": config.NOMOTO_EXP_SPECTRUM_DATA_PATH,
+        "rad_names": [
+            "A (0.8 - 1.4 µm)",
+            "B (2.3 - 5.0 µm)",
+            "C (2.3 µm and above)",
+        ],
+        "figure_configuration": {
+            "y_axis_temperature_range": [33, 36],
+            "y_axis_temperature_ticks": list(range(33, 37, 1)),
+            "y_axis_absorbed_irradiance_range": [0, 250],
+            "y_axis_absorbed_irradiance_ticks": list(range(0, 300, 50)),
+            "y_axis_impulse_frequency_range": [0, 8],
+            "y_axis_impulse_frequency_ticks": list(range(0, 9, 2)),
+        },
+    },
+}
+detailed_wavelength_analysis_dict = {
+    "q_total": 100,
+    "t_db": 24.7,
+    "t_r": 25.5,
+    "t_core": 34.3,
+    "hc": 6.4,
+    "hr": 5.1,
+    "data_path": config.NARITA_EXP_SPECTRUM_DATA_PATH,
+    "wavelengths": list(range(300, 20001, 100)),
+}
+
+
+def load_experiment_spectra(which_experiment):
+    """
+    Load the spectral irradiance conditions of an experiment.
+
+    Parameters:
+    - which_experiment (str): Key of experiments_summary_dict (e.g. "Nomoto_2021").
+
+    Returns:
+    - pd.DataFrame: Spectral irradiance of each radiation (columns "rad_names"),
+      indexed by wavelength [nm].
+    """
+    import pandas as pd
+
+    experiment_dict = experiments_summary_dict[which_experiment]
+    df = pd.read_csv(experiment_dict["data_path"])
+    df.columns = ["wavelength_nm"] + experiment_dict["rad_names"]
+    df.index = df["wavelength_nm"]
+    return df[experiment_dict["rad_names"]]
+
+
+def get_total_irradiance(which_experiment, rad_name):
+    """
+    Get the total irradiance of a radiation of an experiment.
+
+    Measured irradiance is used for Nomoto's experiment, and the common irradiance of
+    the experiment otherwise.
+
+    Parameters:
+    - which_experiment (str): Key of experiments_summary_dict.
+    - rad_name (str): One of the "rad_names" of the experiment.
+
+    Returns:
+    - float: Total irradiance [W/m²].
+    """
+    experiment_dict = experiments_summary_dict[which_experiment]
+    if "q_total" in experiment_dict:
+        return experiment_dict["q_total"]
+    suffix = "abc"[experiment_dict["rad_names"].index(rad_name)]
+    return experiment_dict[f"q_{suffix}"]
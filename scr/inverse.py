@@ -0,0 +1,309 @@
+import numpy as np
+from batched_model import BatchedReceptorModel, align_spectra
+from model import ReceptorModel, calculate_receptor_response
+
+# Outcomes that can be targeted by the inverse solver
+OUTPUTS = ["PSI", "T_warm", "T_surface"]
+
+
+class InverseSolver:
+    """
+    Solve for the irradiance or exposure duration giving a target outcome.
+
+    The warm-up without irradiation is simulated once when the solver is created; every
+    evaluation then continues from its final state, so an iteration only simulates the
+    exposure. All spectra of a query are lanes of one BatchedReceptorModel, and the
+    irradiance is found by bracketing with the secant method, which converges in a few
+    iterations since the outcomes are nearly linear in the irradiance.
+
+    Usage:
+        solver = InverseSolver(t_db=25.3, t_r=25.2, T_core=35.5, hc=4.5)
+        result = solver.solve_irradiance(spectra, target=2.0, output="PSI")
+        result = solver.solve_duration(
+            spectra, target=40, q_irradiance=500, output="T_surface"
+        )
+    """
+
+    def __init__(
+        self,
+        t_db,
+        t_r,
+        T_core=None,
+        hc=None,
+        warm_up_duration=1000,
+        records=21,
+        template=None,
+    ):
+        """
+        Parameters:
+        - t_db (float): Dry bulb temperature (°C).
+        - t_r (float): Radiant temperature (°C).
+        - T_core (float): Core temperature (°C). Uses the template if None.
+        - hc (float): Convection heat transfer coefficient (W/m²K). Uses the template if
+          None.
+        - warm_up_duration (int): Duration of the phase without irradiation [s].
+        - records (int): Number of last records averaged into PSI, as in main.py.
+        - template (ReceptorModel): Model providing the other parameters.
+        """
+        if template is None:
+            template = ReceptorModel()
+        self.template = template
+        self.t_db = t_db
+        self.t_r = t_r
+        self.T_core = template.T_core if T_core is None else T_core
+        self.hc = template.hc if hc is None else hc
+        self.records = records
+
+        # Warm-up state shared by all evaluations
+        model = self._create_model(1)
+        model.add_phase(warm_up_duration, t_db, t_r, q_irradiance=0)
+        results = model.simulate()
+        self.warm_up = {
+            "T_warm": results["T_warm"][0],
+            "T_surface": results["T_surface"][0],
+            "final_temperature": results["final_temperature"][0],
+            "final_time": results["final_time"],
+        }
+
+    def _create_model(self, lanes):
+        """
+        Create a batch of skin patches under the conditions of the solver.
+        """
+        return BatchedReceptorModel(
+            range(lanes), template=self.template, T_core=self.T_core, hc=self.hc
+        )
+
+    def simulate_exposure(self, spectra, q_irradiance, duration):
+        """
+        Simulate exposures continuing from the warm-up state.
+
+        Parameters:
+        - spectra (numpy.ndarray, pd.Series, pd.DataFrame or list): Spectral irradiance
+          (see batched_model.align_spectra).
+        - q_irradiance (float or numpy.ndarray): Total irradiance of each spectrum
+          (W/m²).
+        - duration (int): Duration of the exposure [s].
+
+        Returns:
+        - dict: "time" (records,) from the end of the warm-up [s], and "PSI", "T_warm"
+          and "T_surface" of shape (spectra, records), starting with the last record
+          of the warm-up. The records are those of a single simulation of the warm-up
+          and the exposure.
+        """
+        spectra = align_spectra(self.template, spectra)
+        lanes = len(spectra)
+        model = self._create_model(lanes)
+        model.set_spectrum(spectra)
+        model.add_phase(
+            duration, self.t_db, self.t_r, np.broadcast_to(q_irradiance, lanes)
+        )
+        results = model.simulate(
+            initial_temperature=self.warm_up["final_temperature"],
+            start_time=self.warm_up["final_time"],
+        )
+
+        # The first record of the exposure is its initial state, not a record of a
+        # single simulation, so the warm-up records are continued from the second one
+        warm_up_T_warm = self.warm_up["T_warm"]
+        T_warm = np.hstack(
+            [
+                np.broadcast_to(warm_up_T_warm, (lanes, len(warm_up_T_warm))),
+                results["T_warm"][:, 1:],
+            ]
+        )
+        response = calculate_receptor_response(
+            T_warm,
+            self.template.dt,
+            self.template.coef_static_warm_receptor,
+            self.template.coef_dynamic_warm_receptor,
+            self.template.T_no_static_discharge,
+            self.template.time_to_integrate,
+        )
+
+        exposure_records = results["T_warm"].shape[1]  # last warm-up record included
+        time = results["time"][1:] - results["time"][0]
+        return {
+            "time": np.concatenate([[0], time]),
+            "PSI": response["PSI"][:, -exposure_records:],
+            "T_warm": T_warm[:, -exposure_records:],
+            "T_surface": np.hstack(
+                [
+                    np.full((lanes, 1), self.warm_up["T_surface"][-1]),
+                    results["T_surface"][:, 1:],
+                ]
+            ),
+        }
+
+    def evaluate(self, spectra, q_irradiance, duration=20, output="PSI"):
+        """
+        Evaluate an outcome of exposures.
+
+        Parameters:
+        - spectra: Spectral irradiance (see simulate_exposure).
+        - q_irradiance (float or numpy.ndarray): Total irradiance of each spectrum
+          (W/m²).
+        - duration (int): Duration of the exposure [s].
+        - output (str): "PSI" (mean over the last records, Hz), or "T_warm" or
+          "T_surface" (maximum during the exposure, °C).
+
+        Returns:
+        - numpy.ndarray: The outcome of each spectrum.
+
+        Raises:
+        - ValueError: If the output is unknown.
+        """
+        if output not in OUTPUTS:
+            raise ValueError(f"output must be one of {OUTPUTS}.")
+        results = self.simulate_exposure(spectra, q_irradiance, duration)
+        if output == "PSI":
+            return results["PSI"][:, -self.records :].mean(axis=1)
+        return results[output].max(axis=1)
+
+    def solve_irradiance(
+        self,
+        spectra,
+        target,
+        output="PSI",
+        duration=20,
+        q_initial=100,
+        q_max=10000,
+        tolerance=1e-3,
+        max_iterations=30,
+    ):
+        """
+        Solve for the total irradiance of each spectrum giving a target outcome.
+
+        Each iteration simulates the unconverged spectra together. The irradiance is
+        extrapolated linearly from the baseline until the target is bracketed, then
+        refined by the secant method (Illinois variant) within the bracket.
+
+        Parameters:
+        - spectra: Spectral irradiance (see simulate_exposure).
+        - target (float or numpy.ndarray): Target outcome of each spectrum.
+        - output (str): Outcome to reach (see evaluate).
+        - duration (int): Duration of the exposure [s].
+        - q_initial (float): First irradiance tried (W/m²).
+        - q_max (float): Largest irradiance considered (W/m²).
+        - tolerance (float): Absolute tolerance on the outcome.
+        - max_iterations (int): Maximum number of batched evaluations.
+
+        Returns:
+        - dict: "q_irradiance" (W/m², NaN where the target cannot be reached within
+          [0, q_max]), "value" (outcome at this irradiance), "converged" and
+          "iterations".
+        """
+        spectra = align_spectra(self.template, spectra)
+        lanes = len(spectra)
+        target = np.broadcast_to(np.asarray(target, dtype=float), lanes).copy()
+
+        # Baseline without irradiation
+        baseline = self.evaluate(spectra[:1], 0, duration, output)[0]
+        lower_q = np.zeros(lanes)
+        lower_f = np.full(lanes, baseline)
+        upper_q = np.full(lanes, np.nan)
+        upper_f = np.full(lanes, np.nan)
+
+        q = np.minimum(np.full(lanes, float(q_initial)), q_max)
+        value = np.full(lanes, baseline)
+        converged = np.abs(baseline - target) <= tolerance
+        q[converged] = 0
+        unreachable = ~converged & (target < baseline)
+        active = ~converged & ~unreachable
+        previous_side = np.zeros(lanes, dtype=int)
+
+        iterations = 0
+        while np.any(active) and iterations < max_iterations:
+            iterations += 1
+            index = np.flatnonzero(active)
+            value[index] = self.evaluate(spectra[index], q[index], duration, output)
+
+            for i in index:
+                if abs(value[i] - target[i]) <= tolerance:
+                    converged[i] = True
+                    continue
+                if value[i] < target[i]:
+                    lower_q[i], lower_f[i] = q[i], value[i]
+                    # Illinois: halve the retained end when the same end moves twice
+                    if previous_side[i] == -1 and np.isfinite(upper_f[i]):
+                        upper_f[i] = target[i] + (upper_f[i] - target[i]) / 2
+                    previous_side[i] = -1
+                else:
+                    upper_q[i], upper_f[i] = q[i], value[i]
+                    if previous_side[i] == 1:
+                        lower_f[i] = target[i] + (lower_f[i] - target[i]) / 2
+                    previous_side[i] = 1
+
+                if np.isnan(upper_q[i]):
+                    if lower_q[i] >= q_max:
+                        unreachable[i] = True
+                        continue
+                    # Linear extrapolation from the baseline, slightly beyond the target
+                    slope = (lower_f[i] - baseline) / lower_q[i]
+                    guess = (
+                        1.1 * (target[i] - baseline) / slope
+                        if slope > 0
+                        else 2 * lower_q[i]
+                    )
+                    q[i] = min(max(guess, 1.5 * lower_q[i]), q_max)
+                else:
+                    # Secant within the bracket, bisection as a safeguard
+                    guess = lower_q[i] + (target[i] - lower_f[i]) * (
+                        upper_q[i] - lower_q[i]
+                    ) / (upper_f[i] - lower_f[i])
+                    if not lower_q[i] < guess < upper_q[i]:
+                        guess = (lower_q[i] + upper_q[i]) / 2
+                    q[i] = guess
+
+            active = ~converged & ~unreachable
+
+        q[unreachable] = np.nan
+        return {
+            "q_irradiance": q,
+            "value": value,
+            "converged": converged,
+            "iterations": iterations,
+        }
+
+    def solve_duration(
+        self, spectra, target, q_irradiance, output="T_surface", max_duration=600
+    ):
+        """
+        Solve for the exposure duration at which an outcome first reaches a target.
+
+        One exposure of max_duration is simulated for all spectra, and the first
+        crossing is interpolated linearly between records.
+
+        Parameters:
+        - spectra: Spectral irradiance (see simulate_exposure).
+        - target (float or numpy.ndarray): Target outcome of each spectrum.
+        - q_irradiance (float or numpy.ndarray): Total irradiance of each spectrum
+          (W/m²).
+        - output (str): "PSI" (Hz), "T_warm" or "T_surface" (°C), recorded every second.
+        - max_duration (int): Longest exposure considered [s].
+
+        Returns:
+        - numpy.ndarray: Duration of each spectrum [s], NaN if the target is not
+          reached.
+
+        Raises:
+        - ValueError: If the output is unknown.
+        """
+        if output not in OUTPUTS:
+            raise ValueError(f"output must be one of {OUTPUTS}.")
+        results = self.simulate_exposure(spectra, q_irradiance, max_duration)
+        values = results[output]
+        time = results["time"]
+        target = np.broadcast_to(np.asarray(target, dtype=float), len(values))
+
+        durations = np.full(len(values), np.nan)
+        for i, (series, goal) in enumerate(zip(values, target)):
+            reached = np.flatnonzero(series >= goal)
+            if len(reached) == 0:
+                continue
+            j = reached[0]
+            if j == 0 or np.isnan(series[j - 1]):
+                durations[i] = time[j]
+            else:
+                fraction = (goal - series[j - 1]) / (series[j] - series[j - 1])
+                durations[i] = time[j - 1] + fraction * (time[j] - time[j - 1])
+        return durations
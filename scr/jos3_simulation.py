@@ -1,215 +1,357 @@
+import hashlib
+import json
 import os.path
-
-import numpy as np
-import pandas as pd
-from pythermalcomfort.models import JOS3
-from pythermalcomfort.jos3_functions.utilities import local_clo_typical_ensembles
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import version
+from itertools import repeat
 
 import configration
 
+# Outputs extracted from JOS3 by default (core and skin temperatures by segment)
+DEFAULT_OUTPUTS = ["t_core", "t_skin", "t_skin_mean"]
+
+# Wig, facemask, T-shirt, underwears, short pants, socks (No shoes)
+CLOTHING_T_SHIRT_SHORT_PANTS = {
+    "head": 0.70,
+    "neck": 0.65,
+    "chest": 0.96,
+    "back": 0.85,
+    "pelvis": 1.30,
+    "left_shoulder": 0.56,
+    "left_arm": 0.03,
+    "left_hand": 0.16,
+    "right_shoulder": 0.56,
+    "right_arm": 0.03,
+    "right_hand": 0.16,
+    "left_thigh": 0.39,
+    "left_leg": 0.14,
+    "left_foot": 0.38,
+    "right_thigh": 0.39,
+    "right_leg": 0.14,
+    "right_foot": 0.38,
+}
+
+# Y-shirt, underwears, long pants, socks (No shoes) #En. F
+CLOTHING_Y_SHIRT_LONG_PANTS = {
+    "head": 0.50,
+    "neck": 0,
+    "chest": 0.86,
+    "back": 0.86,
+    "pelvis": 1.50,
+    "left_shoulder": 0.82,
+    "left_arm": 0.6,
+    "left_hand": 0,
+    "right_shoulder": 0.82,
+    "right_arm": 0.60,
+    "right_hand": 0,
+    "left_thigh": 0.65,
+    "left_leg": 0.66,
+    "left_foot": 0.10,
+    "right_thigh": 0.65,
+    "right_leg": 0.66,
+    "right_foot": 0.10,
+}
+
 
 def Nomoto2021(sex):
-    # Mean Subject's anthropometric data
+    """
+    Define the JOS3 condition of the mean subject of Nomoto et al. (2021).
+
+    Parameters:
+    - sex (str): "male" or "female".
+
+    Returns:
+    - dict: The JOS3 condition (see run_jos3_condition).
+    """
+    # Mean Subject's anthropometric data (mean measured value)
     if sex == "male":
-        # Mean measured value
-        model = JOS3(
-            height=1.73,
-            weight=64.9,
-            fat=15,
-            age=23,
-            sex="male",
-        )
+        anthropometrics = {"height": 1.73, "weight": 64.9, "fat": 15, "age": 23}
     else:  # Female
-        # Mean measured value
-        model = JOS3(
-            height=1.59,
-            weight=49.7,
-            fat=15,
-            age=22,
-            sex="female",
-        )
-
-    # Constant values
-    model.posture = "sitting"
-    model.par = 1.2  # presented in FAO/WHO/UNU
-
-    # Phase 1
-    # Sitting quietly for 60 min before irradiation
-    model.tdb = 25.3  # Mean measured value
-    model.tr = 25.0  # Mean measured value
-    model.rh = 51  # Mean measured value
-    model.v = 0.0  # Mean measured value
-    # Wig, facemask, T-shirt, underwears, short pants, socks (No shoes)
-    model.clo = {
-        "head": 0.70,
-        "neck": 0.65,
-        "chest": 0.96,
-        "back": 0.85,
-        "pelvis": 1.30,
-        "left_shoulder": 0.56,
-        "left_arm": 0.03,
-        "left_hand": 0.16,
-        "right_shoulder": 0.56,
-        "right_arm": 0.03,
-        "right_hand": 0.16,
-        "left_thigh": 0.39,
-        "left_leg": 0.14,
-        "left_foot": 0.38,
-        "right_thigh": 0.39,
-        "right_leg": 0.14,
-        "right_foot": 0.38,
+        anthropometrics = {"height": 1.59, "weight": 49.7, "fat": 15, "age": 22}
+
+    return {
+        **anthropometrics,
+        "sex": "male" if sex == "male" else "female",
+        # Constant values
+        "posture": "sitting",
+        "par": 1.2,  # presented in FAO/WHO/UNU
+        # Phase 1
+        # Sitting quietly for 60 min before irradiation
+        "tdb": 25.3,  # Mean measured value
+        "tr": 25.0,  # Mean measured value
+        "rh": 51,  # Mean measured value
+        "v": 0.0,  # Mean measured value
+        "clo": CLOTHING_T_SHIRT_SHORT_PANTS,
+        "cycles": 1000,
     }
-    model.simulate(1000)
 
-    df = pd.DataFrame(model.dict_results())
-    df = df.tail(1).copy()  # Get only the last row
-    df["experiment"] = "Nomoto_2021"
 
+def Narita2001(sex):
+    """
+    Define the JOS3 condition of the mean subject of Narita et al. (2001).
+
+    Parameters:
+    - sex (str): "male" or "female".
+
+    Returns:
+    - dict: The JOS3 condition (see run_jos3_condition).
+    """
+    # Mean Subject's anthropometric data
     if sex == "male":
-        sex = "male"
+        anthropometrics = {"height": 1.73, "weight": 57.6, "fat": 15, "age": 22}
     else:  # Female
-        sex = "female"
+        anthropometrics = {"height": 1.62, "weight": 52.1, "fat": 15, "age": 22.7}
+
+    return {
+        **anthropometrics,
+        "sex": "male" if sex == "male" else "female",
+        "posture": "sitting",
+        "par": None,  # JOS3 default (the original script set an unused PAR attribute)
+        # Phase 1
+        # Sitting quietly for 60 min before irradiation
+        "tdb": 25.6,  # Mean measured value
+        "tr": 26,  # Mean measured value
+        "rh": 60,  # Mean measured value
+        "v": 0.1,  # Mean measured value
+        "clo": CLOTHING_Y_SHIRT_LONG_PANTS,
+        "cycles": 1000,
+    }
 
-    df["sex"] = sex
 
-    return df.copy()
+def Matsui1986(sex):
+    """
+    Define the JOS3 condition of the mean subject of Matsui et al. (1986).
 
+    Parameters:
+    - sex (str): "male" or "female".
 
-def Narita2001(sex):
+    Returns:
+    - dict: The JOS3 condition (see run_jos3_condition).
+    """
     # Mean Subject's anthropometric data
     if sex == "male":
-        model = JOS3(
-            height=1.73,
-            weight=57.6,
-            fat=15,
-            age=22,
-            sex="male",
-        )
+        anthropometrics = {"height": 1.73, "weight": 57.6, "fat": 15, "age": 22}
     else:  # Female
-        model = JOS3(
-            height=1.62,
-            weight=52.1,
-            fat=15,
-            age=22.7,
-            sex="female",
-        )
-
-    model.posture = "sitting"
-    model.PAR = 1.2
-
-    # Phase 1
-    # Sitting quietly for 60 min before irradiation
-    model.tdb = 25.6  # Mean measured value
-    model.tr = 26  # Mean measured value
-    model.rh = 60  # Mean measured value
-    model.v = 0.1  # Mean measured value
-    # Y-shirt, underwears, long pants, socks (No shoes) #En. F
-    model.clo = {
-        "head": 0.50,
-        "neck": 0,
-        "chest": 0.86,
-        "back": 0.86,
-        "pelvis": 1.50,
-        "left_shoulder": 0.82,
-        "left_arm": 0.6,
-        "left_hand": 0,
-        "right_shoulder": 0.82,
-        "right_arm": 0.60,
-        "right_hand": 0,
-        "left_thigh": 0.65,
-        "left_leg": 0.66,
-        "left_foot": 0.10,
-        "right_thigh": 0.65,
-        "right_leg": 0.66,
-        "right_foot": 0.10,
+        anthropometrics = {"height": 1.62, "weight": 52.1, "fat": 15, "age": 22.7}
+
+    return {
+        **anthropometrics,
+        "sex": "male" if sex == "male" else "female",
+        "posture": "sitting",
+        "par": None,  # JOS3 default (the original script set an unused PAR attribute)
+        # Phase 1
+        # Sitting quietly for 60 min before irradiation
+        "tdb": 19.5,  # Mean measured value
+        "tr": 19.5,  # Mean measured value
+        "rh": 60,  # Mean measured value
+        "v": 0.1,  # Mean measured value
+        "clo": CLOTHING_Y_SHIRT_LONG_PANTS,
+        "cycles": 1000,
     }
-    model.simulate(1000)
 
-    df = pd.DataFrame(model.dict_results())
-    df = df.tail(1).copy()  # Get only the last row
-    df["experiment"] = "Narita_2001"
 
-    if sex == "male":
-        sex = "male"
-    else:  # Female
-        sex = "female"
+def create_jos3_model(condition):
+    """
+    Create a JOS3 model set to a condition, importing pythermalcomfort on first use.
 
-    df["sex"] = sex
+    Parameters:
+    - condition (dict): The JOS3 condition (see run_jos3_condition).
 
-    return df.copy()
+    Returns:
+    - JOS3: The JOS3 model.
+    """
+    from pythermalcomfort.models import JOS3
 
+    model = JOS3(
+        height=condition["height"],
+        weight=condition["weight"],
+        fat=condition["fat"],
+        age=condition["age"],
+        sex=condition["sex"],
+    )
+    model.posture = condition["posture"]
+    if condition.get("par") is not None:
+        model.par = condition["par"]
+    model.tdb = condition["tdb"]
+    model.tr = condition["tr"]
+    model.rh = condition["rh"]
+    model.v = condition["v"]
+    model.clo = condition["clo"]
+    return model
 
-def Matsui1986(sex):
-    # Mean Subject's anthropometric data
-    if sex == "male":
-        model = JOS3(height=1.73, weight=57.6, fat=15, age=22, sex="male")
-    else:  # Female
-        model = JOS3(
-            height=1.62,
-            weight=52.1,
-            fat=15,
-            age=22.7,
-            sex="female",
-        )
-
-    model.posture = "sitting"
-    model.PAR = 1.2
-
-    # Phase 1
-    # Sitting quietly for 60 min before irradiation
-    model.tdb = 19.5  # Mean measured value
-    model.tr = 19.5  # Mean measured value
-    model.rh = 60  # Mean measured value
-    model.v = 0.1  # Mean measured value
-    # Y-shirt, underwears, long pants, socks (No shoes) #En. F
-    model.clo = {
-        "head": 0.50,
-        "neck": 0,
-        "chest": 0.86,
-        "back": 0.86,
-        "pelvis": 1.50,
-        "left_shoulder": 0.82,
-        "left_arm": 0.6,
-        "left_hand": 0,
-        "right_shoulder": 0.82,
-        "right_arm": 0.60,
-        "right_hand": 0,
-        "left_thigh": 0.65,
-        "left_leg": 0.66,
-        "left_foot": 0.10,
-        "right_thigh": 0.65,
-        "right_leg": 0.66,
-        "right_foot": 0.10,
-    }
-    model.simulate(1000)
 
-    df = pd.DataFrame(model.dict_results())
-    df = df.tail(1).copy()  # Get only the last row
-    df["experiment"] = "Matsui_1986"
+def extract_outputs(model, outputs):
+    """
+    Extract outputs from the current state of a JOS3 model.
+
+    Segment outputs are named as in JOS3.dict_results (e.g. "t_core_left_hand").
+
+    Parameters:
+    - model (JOS3): The JOS3 model.
+    - outputs (list): Names of JOS3 properties (e.g. "t_core", "t_skin_mean").
+
+    Returns:
+    - dict: Output values by name.
+    """
+    result = {}
+    for name in outputs:
+        value = getattr(model, name)
+        if hasattr(value, "__len__"):
+            for body_name, segment_value in zip(model.body_names, value):
+                result[f"{name}_{body_name}"] = float(segment_value)
+        else:
+            result[name] = float(value)
+    return result
+
+
+def run_jos3_condition(condition, outputs=DEFAULT_OUTPUTS):
+    """
+    Run JOS3 for a condition and extract only the requested outputs of the last cycle.
+
+    The history of the simulation is not recorded, so no results DataFrame is built.
+
+    Parameters:
+    - condition (dict): Anthropometric data ("height", "weight", "fat", "age", "sex"),
+      "posture", "par" (None for the JOS3 default), environment ("tdb", "tr", "rh",
+      "v"), clothing insulation "clo" by segment and number of 60 s "cycles".
+    - outputs (list): Names of JOS3 properties to extract.
+
+    Returns:
+    - dict: Output values by name.
+    """
+    model = create_jos3_model(condition)
+    model.simulate(condition["cycles"], output=False)
+    return extract_outputs(model, outputs)
+
+
+def condition_key(condition, outputs):
+    """
+    Create a cache key from a condition, the requested outputs and the JOS3 version.
+
+    Parameters:
+    - condition (dict): The JOS3 condition.
+    - outputs (list): Names of the requested outputs.
+
+    Returns:
+    - str: The cache key.
+    """
+    content = json.dumps(
+        {
+            "condition": condition,
+            "outputs": list(outputs),
+            "pythermalcomfort_version": version("pythermalcomfort"),
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _load_cached_result(cache_directory, key):
+    """
+    Load a cached result, or return None if it does not exist.
+    """
+    path = os.path.join(cache_directory, key + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["result"]
+
+
+def _save_cached_result(cache_directory, key, condition, result):
+    """
+    Save a result atomically, so that an interrupted run leaves no partial file.
+    """
+    os.makedirs(cache_directory, exist_ok=True)
+    path = os.path.join(cache_directory, key + ".json")
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump({"condition": condition, "result": result}, file)
+    os.replace(temporary_path, path)
+
+
+def precondition(
+    conditions,
+    outputs=DEFAULT_OUTPUTS,
+    processes=None,
+    cache_directory=configration.JOS3_CACHE_DIRECTORY,
+):
+    """
+    Run JOS3 for many conditions in a process pool, reusing cached results.
+
+    Results are cached by anthropometrics, clothing, environment and the requested
+    outputs, so a rerun only simulates new or changed conditions.
+
+    Parameters:
+    - conditions (list): JOS3 conditions (see run_jos3_condition).
+    - outputs (list): Names of JOS3 properties to extract.
+    - processes (int): Number of worker processes. Uses all CPUs if None.
+    - cache_directory (str): Directory of the cached results. No cache is used if None.
+
+    Returns:
+    - list: Output values (dict) in the order of the conditions.
+    """
+    keys = [condition_key(condition, outputs) for condition in conditions]
+
+    results = {}
+    if cache_directory is not None:
+        for key in set(keys):
+            result = _load_cached_result(cache_directory, key)
+            if result is not None:
+                results[key] = result
+
+    missing = {}
+    for key, condition in zip(keys, conditions):
+        if key not in results:
+            missing[key] = condition
+
+    # Simulate the missing conditions, in parallel when there are several
+    if len(missing) > 1 and processes != 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            new_results = executor.map(
+                run_jos3_condition, missing.values(), repeat(outputs)
+            )
+            new_results = dict(zip(missing, new_results))
+    else:
+        new_results = {
+            key: run_jos3_condition(condition, outputs)
+            for key, condition in missing.items()
+        }
+
+    for key, result in new_results.items():
+        if cache_directory is not None:
+            _save_cached_result(cache_directory, key, missing[key], result)
+        results[key] = result
+
+    return [results[key] for key in keys]
 
-    if sex == "male":
-        sex = "male"
-    else:  # Female
-        sex = "female"
 
-    df["sex"] = sex
+def main():
+    """
+    Simulate the core temperatures of the mean subjects of each study with JOS3
+    and write them into a CSV file.
+    """
+    import pandas as pd
 
-    return df.copy()
+    labels = []
+    conditions = []
+    for experiment, define_condition in [
+        ("Nomoto_2021", Nomoto2021),
+        ("Narita_2001", Narita2001),
+        ("Matsui_1986", Matsui1986),
+    ]:
+        for sex in ["male", "female"]:
+            labels.append({"experiment": experiment, "sex": sex})
+            conditions.append(define_condition(sex=sex))
 
+    results = precondition(conditions)
+    sim = pd.DataFrame([{**result, **label} for result, label in zip(results, labels)])
 
-dfs = []
-dfs.append(Nomoto2021(sex="male"))
-dfs.append(Nomoto2021(sex="female"))
-dfs.append(Narita2001(sex="male"))
-dfs.append(Narita2001(sex="female"))
-dfs.append(Matsui1986(sex="male"))
-dfs.append(Matsui1986(sex="female"))
+    csv_path_name = "core_temperature_summary_simulated_by_JOS3.csv"
+    sim.to_csv(
+        os.path.join(configration.DATA_DIRECTORY, csv_path_name)
+    )  # Write csv file (only new conditions are simulated)
+    print(sim["t_core_left_hand"])
 
-sim = pd.concat(dfs)
-sim = sim.reset_index(drop=True)
 
-csv_path_name = "core_temperature_summary_simulated_by_JOS3.csv"
-sim.to_csv(
-    os.path.join(configration.DATA_DIRECTORY, csv_path_name)
-)  # Write csv file (it takes some time)
-print(sim["t_core_left_hand"])
+if __name__ == "__main__":
+    main()
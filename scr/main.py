@@ -3,139 +3,35 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from model import ReceptorModel
+from experiments import experiments_summary_dict, detailed_wavelength_analysis_dict
 import configration as config
+from sweep_runner import create_manifest, merge_results, run_sweep
+from wavelength_sweep import adaptive_wavelength_sweep
 
 # Constants
 plt.rcParams["font.family"] = "Arial"
 plt.rcParams["axes.prop_cycle"] = plt.cycler("color", plt.get_cmap("Set1").colors)
 run_detail_simulation = False
+run_adaptive_detail_simulation = False
 
-# Define summary dictionary including experimental infomation
-experiments_summary_dict = {
-    "Narita_1999": {
-        "q_total": 1220,
-        "t_db": 24.7,
-        "t_r": 25.5,
-        "t_core": 35.9,
-        "hc": 6.4,
-        "hr": 5.1,
-        "data_path": config.NARITA_EXP_SPECTRUM_DATA_PATH,
-        "rad_names": [
-            "Visible (0.30–0.84 µm)",
-            "Near-infrared (0.80 – 1.35 µm)",
-            "Mid-infrared (1.70 – 2.30 µm)",
-        ],
-        "figure_configuration": {
-            "y_axis_temperature_range": [34, 38],
-            "y_axis_temperature_ticks": list(range(34, 39, 1)),
-            "y_axis_absorbed_irradiance_range": [0, 400],
-            "y_axis_absorbed_irradiance_ticks": list(range(0, 500, 100)),
-            "y_axis_impulse_frequency_range": [0, 20],
-            "y_axis_impulse_frequency_ticks": list(range(0, 25, 5)),
-        },
-    },
-    "Matsui_1986": {
-        "q_total": 2000,
-        "t_db": 19.5,
-        "t_r": 19.5,
-        "t_core": 32.5,
-        "hc": 4.5,
-        "hr": 5.1,
-        "data_path": config.MATSUI_EXP_SPECTRUM_DATA_PATH,
-        "rad_names": [
-            "Near- to mid-infrared  (0.72 - 2.7µm)",
-            "Mid- to far-infrared (1.5 - 4.8µm)",
-            "Far-infrared  (6 - 20µm)",
-        ],
-        "figure_configuration": {
-            "y_axis_temperature_range": [30, 40],
-            "y_axis_temperature_ticks": list(range(30, 41, 2)),
-            "y_axis_absorbed_irradiance_range": [0, 2000],
-            "y_axis_absorbed_irradiance_ticks": list(range(0, 2500, 500)),
-            "y_axis_impulse_frequency_range": [0, 25],
-            "y_axis_impulse_frequency_ticks": list(range(0, 30, 5)),
-        },
-    },
-    "Nomoto_2021": {
-        "q_a": 228,
-        "q_b": 184,
-        "q_c": 211,
-        "t_db": 25.3,
-        "t_r": 25.2,
-        "t_core": 35.5,
-        "hc": 4.5,
-        "hr": 5.1,
-        "data_path": config.NOMOTO_EXP_SPECTRUM_DATA_PATH,
-        "rad_names": [
-            "A (0.8 - 1.4 µm)",
-            "B (2.3 - 5.0 µm)",
-            "C (2.3 µm and above)",
-        ],
-        "figure_configuration": {
-            "y_axis_temperature_range": [33, 36],
-            "y_axis_temperature_ticks": list(range(33, 37, 1)),
-            "y_axis_absorbed_irradiance_range": [0, 250],
-            "y_axis_absorbed_irradiance_ticks": list(range(0, 300, 50)),
-            "y_axis_impulse_frequency_range": [0, 8],
-            "y_axis_impulse_frequency_ticks": list(range(0, 9, 2)),
-        },
-    },
-}
-detailed_wavelength_analysis_dict = {
-    "q_total": 100,
-    "t_db": 24.7,
-    "t_r": 25.5,
-    "t_core": 34.3,
-    "hc": 6.4,
-    "hr": 5.1,
-    "data_path": config.NARITA_EXP_SPECTRUM_DATA_PATH,
-    "wavelengths": list(range(300, 20001, 100)),
-}
-
-
-def conduct_detailed_wavelength_simulation():
-    result = {}
-    psi = []
-    for wavelength in detailed_wavelength_analysis_dict["wavelengths"]:  # [W/m2/10nm]
-        # Define receptor model instance
-        model = ReceptorModel()
 
-        # Set experimental conditions
-        model._reset_simulation()
-        model.T_core = detailed_wavelength_analysis_dict["t_core"]
-        model.hc = detailed_wavelength_analysis_dict["hc"]
-        model.hr = detailed_wavelength_analysis_dict["hr"]
-        model.T_db = detailed_wavelength_analysis_dict["t_db"]
-        model.T_r = detailed_wavelength_analysis_dict["t_r"]
-        model.q_total_irradiance = 100
-        # Create a Series with 1 for rad_name and 0 for others in "spectral irradiance"
-        model.q_spectrum = pd.Series(
-            [1 if name == wavelength else 0 for name in model.wavelengths],
-            index=model.wavelengths,
-        )
-        print(model.q_spectrum)
-
-        # Initialize the model by running a long time
-        model.add_phase(
-            duration_in_sec=1000,
-            t_db=model.T_db,
-            t_r=model.T_r,
-            q_irradiance=0,
-        )
-
-        # Add irradiation period
-        model.add_phase(
-            duration_in_sec=20,
-            t_db=model.T_db,
-            t_r=model.T_r,
-            q_irradiance=round(model.q_total_irradiance, 2),
-        )
-        # Define simulation results
-        df_simulation_results = model.simulate(show_input=True)
-
-        ser = df_simulation_results["PSI"][-21:]
-        ser = ser.mean()
-        psi.append(ser)
+def conduct_detailed_wavelength_simulation(processes=1):
+    # Run the wavelengths as a resumable sweep: each task is saved as soon as it
+    # finishes, so an interrupted run continues where it stopped when run again.
+    # The model keeps its default hc, as the previous serial loop did (see
+    # experiments.py), so the results match the published CSV file.
+    title = "wavelength_dependence_from_0.3_to_20_µm"
+    directory = os.path.join(config.SWEEP_DIRECTORY, title)
+    grid = {
+        "wavelength": detailed_wavelength_analysis_dict["wavelengths"],
+        "t_db": detailed_wavelength_analysis_dict["t_db"],
+        "t_r": detailed_wavelength_analysis_dict["t_r"],
+        "T_core": detailed_wavelength_analysis_dict["t_core"],
+        "q_irradiance": detailed_wavelength_analysis_dict["q_total"],
+    }
+    create_manifest(directory, grid, chunk_size=16)
+    print(run_sweep(directory, processes=processes))
+    psi = merge_results(directory)["PSI"].to_numpy()
 
     df = pd.DataFrame({"PSI": psi})
     df["Ratio"] = df["PSI"] / df["PSI"].max()
@@ -146,7 +42,6 @@ def conduct_detailed_wavelength_simulation():
     df.index = wavelengths_array * 10**-3  # convert nm to µm
 
     # Save as CSV file
-    title = "wavelength_dependence_from_0.3_to_20_µm"
     csv_path = title + ".csv"
     df.to_csv(os.path.join(config.DATA_DIRECTORY, csv_path))
 
@@ -196,6 +91,22 @@ def conduct_detailed_wavelength_simulation():
     plt.savefig(os.path.join(config.FIGURE_DIRECTORY, fig_path))
 
 
+def conduct_adaptive_wavelength_simulation(tolerance=0.01):
+    # Refine the wavelengths only where the PSI ratio is not linear, with the same
+    # conditions and effective hc (see experiments.py) as
+    # conduct_detailed_wavelength_simulation
+    df = adaptive_wavelength_sweep(
+        detailed_wavelength_analysis_dict, tolerance=tolerance
+    )
+    df.index = df.index * 10**-3  # convert nm to µm
+    df.index.name = "wavelength_µm"
+
+    # Save as CSV file
+    title = "adaptive_wavelength_dependence_from_0.3_to_20_µm"
+    df.to_csv(os.path.join(config.DATA_DIRECTORY, title + ".csv"))
+    return df
+
+
 def simulate_experiment_and_get_dataframe(experiments_summary_dict, which_experiment):
     # Get an experimental information from summary dictionary
     experiment_dict = experiments_summary_dict[which_experiment]
@@ -243,13 +154,16 @@ def simulate_experiment_and_get_dataframe(experiments_summary_dict, which_experi
             elif rad_name == "C (2.3 µm and above)":
                 model.q_total_irradiance = experiment_dict["q_c"]
         elif which_experiment == "Matsui_1986":
-            # It was assumed that the irradiation of 2000 W/m2 included the radiation from the ambient environment,
-            # so, ambient radiant temperature is set to -273.15 so that radiant heat transfer to the ambient environment can be set to 0 W/m2.
+            # It was assumed that the irradiation of 2000 W/m2 included the radiation
+            # from the ambient environment, so, ambient radiant temperature is set to
+            # -273.15 so that radiant heat transfer to the ambient environment can be
+            # set to 0 W/m2.
             model.q_radiation = 0
             model.q_total_irradiance = experiment_dict["q_total"]
         else:
-            # Since Naria's experiment focuses on solar radiation, longwave radiation heat transfer happens.
-            # Only parameter to change is external heat load by irradiance.
+            # Since Naria's experiment focuses on solar radiation, longwave radiation
+            # heat transfer happens. Only parameter to change is external heat load by
+            # irradiance.
             model.q_total_irradiance = experiment_dict["q_total"]
 
         # Add irradiation period
@@ -474,3 +388,5 @@ if __name__ == "__main__":
         )
     if run_detail_simulation == True:
         conduct_detailed_wavelength_simulation()
+    if run_adaptive_detail_simulation == True:
+        conduct_adaptive_wavelength_simulation()
@@ -1,22 +1,167 @@
+import sys
+
 import numpy as np
-import pandas as pd
-import pythermalcomfort.models.jos3
-from scipy.sparse import diags
-from scipy.sparse.linalg import spsolve
-import matplotlib.pyplot as plt
-from pythermalcomfort.models import JOS3
-from pythermalcomfort.jos3_functions.parameters import Default
-
-# Define constants
-DATA_FILE_PATH = (
-    "C:\\Users\\monyo\\PycharmProjects\\wavelength\\data\\skin-spectral-properties.csv"
+from spectral_tables import (
+    RADIATIVE_TRANSFER_MODELS,
+    calculate_absorbed_profiles,
+    get_default_tables,
+    get_tables_for_grid,
+    get_worker_tables,
 )
-df = pd.read_csv(DATA_FILE_PATH)
 
-# Get EXP data and plot（below 2.5µm）
-df.index = df["wavelength_nm"]
-# data in coloums
-wavelength = df["wavelength_nm"] * 10**-3  # from nm to µm
+
+def _is_pandas_object(obj, class_name):
+    """
+    Check whether an object is a pandas Series or DataFrame without importing pandas.
+
+    Parameters:
+    - obj (object): The object to check.
+    - class_name (str): "Series" or "DataFrame".
+
+    Returns:
+    - bool: True if the object is an instance of the pandas class.
+    """
+    pd = sys.modules.get("pandas")
+    return pd is not None and isinstance(obj, getattr(pd, class_name))
+
+
+def calculate_heat_flux(
+    T,
+    q_irradiance_nodes,
+    T_db,
+    T_r,
+    T_core,
+    r_skin2skin,
+    r_skin2core,
+    r_skin2amb_convection,
+    absorption_lw,
+    sigma=5.67e-8,
+):
+    """
+    Calculate the heat flux for each skin layer of one or more skin patches.
+
+    The last axis of T is the node axis (core side first). For a batch of patches,
+    pass per-patch parameters as arrays of shape (batch,), except r_skin2skin which
+    must be of shape (batch, 1).
+
+    Parameters:
+    - T (numpy.ndarray): Temperatures of the skin layers (°C), shape (..., n).
+    - q_irradiance_nodes (numpy.ndarray): Absorbed irradiance at each layer (W/m²),
+      shape (..., n).
+    - T_db (float or numpy.ndarray): Dry bulb temperature (°C).
+    - T_r (float or numpy.ndarray): Radiant temperature (°C).
+    - T_core (float or numpy.ndarray): Core temperature (°C).
+    - r_skin2skin (float or numpy.ndarray): Resistance between layers (m²K/W).
+    - r_skin2core (float or numpy.ndarray): Resistance from the first layer to the core
+      (m²K/W).
+    - r_skin2amb_convection (float or numpy.ndarray): Convective resistance to ambient
+      (m²K/W).
+    - absorption_lw (float or numpy.ndarray): Long wavelength absorption rate (-).
+    - sigma (float): Stefan-Boltzmann constant (W/m²K⁴).
+
+    Returns:
+    - numpy.ndarray: Heat flux for each skin layer (W/m²), shape (..., n).
+    """
+    q_total_flux = np.array(q_irradiance_nodes, dtype=float)
+
+    # Conduction between neighbouring skin layers
+    q_conduction = (T[..., 1:] - T[..., :-1]) / r_skin2skin
+    q_total_flux[..., :-1] += q_conduction
+    q_total_flux[..., 1:] -= q_conduction
+
+    # Equations at the boundaries
+    q_total_flux[..., 0] += (T_core - T[..., 0]) / r_skin2core
+
+    q_convection = (T_db - T[..., -1]) / r_skin2amb_convection
+    q_radiation = (
+        sigma * absorption_lw * (T_r + 273.15) ** 4
+        - sigma * absorption_lw * (T[..., -1] + 273.15) ** 4
+    )
+    q_total_flux[..., -1] += q_convection + q_radiation
+
+    return q_total_flux
+
+
+def calculate_receptor_weights(node_coordinates, length, receptor_depth):
+    """
+    Calculate the weights of the nodes that interpolate the temperature at the receptor.
+
+    Parameters:
+    - node_coordinates (numpy.ndarray): Distance of each node from the core (m), shape
+      (..., n).
+    - length (float or numpy.ndarray): Thickness of the skin layer (m).
+    - receptor_depth (float or numpy.ndarray): Depth of the receptor from the surface
+      (m).
+
+    Returns:
+    - numpy.ndarray: Weights of shape (..., n) that sum to one.
+    """
+    position = np.asarray(length - receptor_depth, dtype=float)[..., np.newaxis]
+    shape = np.broadcast_shapes(np.shape(node_coordinates), position.shape)
+    node_coordinates = np.broadcast_to(node_coordinates, shape)
+    position = np.broadcast_to(position, shape[:-1] + (1,))
+
+    # Linear interpolation between the two nodes around the receptor
+    n = shape[-1]
+    lower_index = (node_coordinates <= position).sum(axis=-1, keepdims=True) - 1
+    lower_index = np.clip(lower_index, 0, n - 2)
+    lower = np.take_along_axis(node_coordinates, lower_index, axis=-1)
+    upper = np.take_along_axis(node_coordinates, lower_index + 1, axis=-1)
+    fraction = np.clip((position - lower) / (upper - lower), 0, 1)
+
+    weights = np.zeros(shape)
+    np.put_along_axis(weights, lower_index, 1 - fraction, axis=-1)
+    np.put_along_axis(weights, lower_index + 1, fraction, axis=-1)
+    return weights
+
+
+def calculate_receptor_response(
+    T_warm,
+    dt,
+    coef_static_warm_receptor,
+    coef_dynamic_warm_receptor,
+    T_no_static_discharge,
+    time_to_integrate=20,
+):
+    """
+    Calculate the warm receptor response from the warm receptor temperature.
+
+    The temperatures are recorded every second along the last axis. As in the
+    original model, the PSI window spans int(time_to_integrate / dt) records.
+
+    Parameters:
+    - T_warm (numpy.ndarray): Warm receptor temperature (°C), shape (..., records).
+    - dt (float): Time step of the simulation (s).
+    - coef_static_warm_receptor (float or numpy.ndarray): Static coefficient (Hz/K),
+      shape (..., 1).
+    - coef_dynamic_warm_receptor (float or numpy.ndarray): Dynamic coefficient (Hz·s/K),
+      shape (..., 1).
+    - T_no_static_discharge (float or numpy.ndarray): Threshold of static discharge
+      (°C), shape (..., 1).
+    - time_to_integrate (float): Integration time of PSI (s).
+
+    Returns:
+    - dict: "dT_warm", "R", "dR" and "PSI", each of the shape of T_warm.
+    """
+    T_warm = np.asarray(T_warm, dtype=float)
+    nan_column = np.full(T_warm.shape[:-1] + (1,), np.nan)
+
+    # Derivative of warm receptor temperature
+    dT_warm = np.diff(T_warm, axis=-1, prepend=nan_column) * dt
+    # Thermal response
+    R = (
+        coef_static_warm_receptor * np.maximum(0, T_warm - T_no_static_discharge)
+        + coef_dynamic_warm_receptor * dT_warm / dt
+    )
+    # Derivative of thermal response
+    dR = np.diff(R, axis=-1, prepend=nan_column)
+
+    # Integral of dR over a window (the sum of dR telescopes)
+    window = int(time_to_integrate / dt)
+    PSI = np.full(T_warm.shape, np.nan)
+    PSI[..., window:] = R[..., window:] - R[..., :-window]
+
+    return {"dT_warm": dT_warm, "R": R, "dR": dR, "PSI": PSI}
 
 
 class ReceptorModel:
@@ -28,7 +173,16 @@ class ReceptorModel:
     processes, as well as the distribution of radiation within skin layers.
     """
 
-    def __init__(self):
+    def __init__(self, spectral_tables=None, radiative_transfer="beer_lambert"):
+        """
+        Parameters:
+        - spectral_tables (SpectralTables): Skin optical properties and attenuation
+          kernel. If None, the tables attached by a pool worker or the per-process
+          default tables are used.
+        - radiative_transfer (str): Radiative transfer model of the attenuation kernel,
+          "beer_lambert" (scattering as extinction) or "two_flux" (Kubelka-Munk).
+          Ignored if spectral_tables is given.
+        """
         # Basic physical properties of the skin
         self.length = 5.4e-3  # thickness of skin layer [m]
         self.n = 36  # number of discretized skin layers
@@ -51,9 +205,9 @@ class ReceptorModel:
         self.wavelengths = np.arange(
             300, 50001, 10
         )  # wavelengths from 300nm to 50000nm
-        self.q_spectrum = pd.Series(
-            np.zeros(len(self.wavelengths)), index=self.wavelengths
-        )  # spectral irradiance
+        self.q_spectrum = np.zeros(
+            len(self.wavelengths)
+        )  # spectral irradiance on the wavelength grid
 
         # Heat transfer coefficients
         self.hc = 4  # convection heat transfer coefficient [W/m²K]
@@ -65,9 +219,21 @@ class ReceptorModel:
         self.coef_dynamic_warm_receptor = 56  # Hz·s/K
         self.coef_dynamic_cold_receptor = -62  # Hz·s/K
         self.T_no_static_discharge = 33
+        self.receptor_depth = 0.5e-3  # depth of the warm receptor from the surface [m]
+        self.time_to_integrate = 20  # integration time of PSI [s]
+
+        # Radiative transfer model of the attenuation kernel
+        if spectral_tables is not None:
+            radiative_transfer = spectral_tables.radiative_transfer
+        if radiative_transfer not in RADIATIVE_TRANSFER_MODELS:
+            raise ValueError(
+                f"radiative_transfer must be one of {RADIATIVE_TRANSFER_MODELS}."
+            )
+        self.radiative_transfer = radiative_transfer
 
         # Initialize additional parameters
         self._initialize_parameters()
+        self._set_skin_properties(spectral_tables)
 
         # Simulation results and phases
         self.simulation_results = {}  # dict results of the simulation
@@ -112,26 +278,98 @@ class ReceptorModel:
         # Stefan-Boltzmann constant
         self.sigma = 5.67e-8  # [W/m²K⁴]
 
-    def _set_skin_properties(self, df):
+        # Keep the attenuation kernel on the node grid if the grid has changed
+        if hasattr(self, "spectral_tables"):
+            self._set_skin_properties()
+
+    def _set_skin_properties(self, spectral_tables=None):
         """
-        Set skin properties from a provided DataFrame and align them with the wavelengths in self.q_spectrum.
+        Set skin properties from spectral tables aligned with the wavelengths in
+        self.q_spectrum.
+
+        Tables of another node grid or radiative transfer model are rebuilt for the
+        model with their optical properties (see get_tables_for_grid).
 
         Parameters:
-        - df (DataFrame): A DataFrame containing spectral properties of the skin.
+        - spectral_tables (SpectralTables): Tables to use. If None, the current tables
+          of the model, the tables attached by a pool worker or the per-process default
+          tables are used.
         """
-        # Ensure the spectral properties align with the wavelengths
-        self.spectral_reflectance = df["reflectance_nd"].reindex(
-            self.wavelengths, fill_value=0
-        )
-        self.spectral_transmittance = df["transmittance_nd"].reindex(
-            self.wavelengths, fill_value=0
+        if spectral_tables is None:
+            spectral_tables = getattr(self, "spectral_tables", None)
+        if spectral_tables is None:
+            spectral_tables = get_worker_tables()
+        radiative_transfer = getattr(self, "radiative_transfer", "beer_lambert")
+        if spectral_tables is None or not np.array_equal(
+            spectral_tables.wavelengths, self.wavelengths
+        ):
+            spectral_tables = get_default_tables(
+                self.length, self.n, radiative_transfer
+            )
+        spectral_tables = get_tables_for_grid(
+            spectral_tables, self.node_coordinates, self.dx, radiative_transfer
         )
-        self.spectral_absorption_coefficient = df[
-            "absorption_coefficient_1/mm"
-        ].reindex(self.wavelengths, fill_value=0)
-        self.spectral_scattering_coefficient = df[
-            "scattering_coefficient_1/mm"
-        ].reindex(self.wavelengths, fill_value=0)
+        self.spectral_tables = spectral_tables
+
+        # Views on the tables (no copies are made)
+        self.spectral_reflectance = spectral_tables.reflectance
+        self.spectral_transmittance = spectral_tables.transmittance
+        self.spectral_absorption_coefficient = spectral_tables.absorption_coefficient
+        self.spectral_scattering_coefficient = spectral_tables.scattering_coefficient
+
+    def set_radiative_transfer(self, radiative_transfer):
+        """
+        Switch the radiative transfer model of the attenuation kernel.
+
+        The kernels are cached by model and grid, so switching back and forth is free.
+
+        Parameters:
+        - radiative_transfer (str): "beer_lambert" or "two_flux".
+
+        Raises:
+        - ValueError: If the radiative transfer model is unknown.
+        """
+        if radiative_transfer not in RADIATIVE_TRANSFER_MODELS:
+            raise ValueError(
+                f"radiative_transfer must be one of {RADIATIVE_TRANSFER_MODELS}."
+            )
+        self.radiative_transfer = radiative_transfer
+        self._set_skin_properties()
+
+    def _align_spectrum(self, q_spectrum):
+        """
+        Align a spectrum with the wavelengths of the spectral tables.
+
+        Parameters:
+        - q_spectrum (pd.Series or numpy.ndarray): Spectrum indexed by wavelength [nm],
+          or an array on the wavelength grid of the model.
+
+        Returns:
+        - numpy.ndarray: The spectrum on the wavelength grid, with missing values as
+          zero.
+        """
+        if _is_pandas_object(q_spectrum, "Series"):
+            q_spectrum = q_spectrum.reindex(self.spectral_tables.wavelengths)
+        q_spectrum = np.array(q_spectrum, dtype=float)
+        q_spectrum[np.isnan(q_spectrum)] = 0
+        return q_spectrum
+
+    def __getstate__(self):
+        # The spectral tables are not pickled with the model; a worker re-attaches them
+        state = self.__dict__.copy()
+        for name in [
+            "spectral_tables",
+            "spectral_reflectance",
+            "spectral_transmittance",
+            "spectral_absorption_coefficient",
+            "spectral_scattering_coefficient",
+        ]:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._set_skin_properties()
 
     def _replace_nan_with_zero(self, lst):
         """
@@ -176,122 +414,271 @@ class ReceptorModel:
             }
         )
 
-    def _reset_simulation(self):
+    def add_schedule(self, duration_in_sec, t_db, t_r, q_irradiance, T_core=None):
         """
-        Reset the simulation to its initial state.
+        Add a simulation phase with time-varying environmental conditions.
+
+        Each condition can be a constant, a function of the time since the start of
+        the phase (evaluated on an array of times), a (times, values) tuple or a
+        pd.Series indexed by time. Tuples and Series are linearly interpolated.
+        The schedules are evaluated on the time step grid once before the simulation.
+
+        Parameters:
+        - duration_in_sec (int): Duration of the phase in seconds.
+        - t_db (float, callable, tuple or pd.Series): Dry bulb temperature (°C).
+        - t_r (float, callable, tuple or pd.Series): Radiant temperature (°C).
+        - q_irradiance (float, callable, tuple or pd.Series): Total irradiance (W/m²).
+        - T_core (float, callable, tuple or pd.Series): Core temperature (°C). Uses
+          self.T_core if None.
+
+        Raises:
+        - ValueError: If the duration is not positive.
+
+        Usage:
+            # Lamp warm-up ramp over 5 s followed by constant irradiance
+            model.add_schedule(
+                duration_in_sec=20,
+                t_db=25,
+                t_r=25,
+                q_irradiance=([0, 5, 20], [0, 200, 200]),
+            )
         """
-        # Resetting simulation time and temperature distribution
-        self.simulation_time = 0
-        self.T = np.ones(self.n) * self.initial_temperature
+        # Validate input parameters
+        if duration_in_sec <= 0:
+            raise ValueError("Duration must be positive.")
 
-        # Clearing all phases
-        self.phases = []
+        # Add the phase to the simulation
+        self.phases.append(
+            {
+                "duration_in_sec": duration_in_sec,
+                "t_db": t_db,
+                "t_r": t_r,
+                "q_irradiance": q_irradiance,
+                "T_core": T_core,
+            }
+        )
 
-    def _update_environmental_conditions(self, phase):
+    def add_spectral_series(
+        self,
+        duration_in_sec,
+        t_db,
+        t_r,
+        spectra,
+        frame_times=None,
+        q_irradiance=1,
+        T_core=None,
+    ):
         """
-        Update the environmental conditions based on a given phase.
+        Add a simulation phase whose spectral irradiance changes over time.
+
+        Each spectrum (frame) is held from its frame time until the next frame time.
+        The absorbed profiles of all frames are computed in one batched product with
+        the attenuation kernel before the time integration.
 
         Parameters:
-        - phase (dict): A dictionary containing environmental conditions for a phase.
+        - duration_in_sec (int): Duration of the phase in seconds.
+        - t_db (float, callable, tuple or pd.Series): Dry bulb temperature (°C).
+        - t_r (float, callable, tuple or pd.Series): Radiant temperature (°C).
+        - spectra (numpy.ndarray, str, pd.DataFrame or list): Spectral irradiance of
+          shape (frames, wavelengths) on the wavelength grid of the model [W/m²], the
+          path to such an array saved with numpy.save (memory-mapped), a DataFrame
+          indexed by time with wavelengths [nm] as columns, or a list with one Series
+          or array per frame.
+        - frame_times (array-like): Start time of each frame since the start of the
+          phase [s]. Uses the index of the DataFrame if None.
+        - q_irradiance (float, callable, tuple or pd.Series): Scale factor of the
+          spectra.
+        - T_core (float, callable, tuple or pd.Series): Core temperature (°C). Uses
+          self.T_core if None.
+
+        Raises:
+        - ValueError: If the duration is not positive or the frames do not match.
         """
-        # Update temperatures and irradiance based on the current phase
-        self.T_db = phase["t_db"]
-        self.T_r = phase["t_r"]
-        self.q_total_irradiance = phase["q_irradiance"]
+        # Validate input parameters
+        if duration_in_sec <= 0:
+            raise ValueError("Duration must be positive.")
+
+        if isinstance(spectra, str):
+            spectra = np.load(spectra, mmap_mode="r")
+        if _is_pandas_object(spectra, "DataFrame"):
+            if frame_times is None:
+                frame_times = spectra.index.to_numpy(dtype=float)
+            spectra = spectra.reindex(
+                columns=self.spectral_tables.wavelengths
+            ).to_numpy(dtype=float)
+        elif isinstance(spectra, (list, tuple)):
+            spectra = np.array([self._align_spectrum(spectrum) for spectrum in spectra])
+        else:
+            spectra = np.asarray(spectra)
+        if frame_times is None:
+            raise ValueError("frame_times must be given for an array of spectra.")
+
+        frame_times = np.asarray(frame_times, dtype=float)
+        if spectra.ndim != 2 or spectra.shape[1] != len(
+            self.spectral_tables.wavelengths
+        ):
+            raise ValueError("spectra must be of shape (frames, wavelengths).")
+        if len(frame_times) != len(spectra):
+            raise ValueError("frame_times must have one entry per frame.")
 
-    def _calculate_radiation_distribution(self):
+        # Add the phase to the simulation
+        self.phases.append(
+            {
+                "duration_in_sec": duration_in_sec,
+                "t_db": t_db,
+                "t_r": t_r,
+                "q_irradiance": q_irradiance,
+                "T_core": T_core,
+                "spectra": spectra,
+                "frame_times": frame_times,
+            }
+        )
+
+    def _evaluate_schedule(self, schedule, times):
         """
-        Calculate the distribution of radiation within the skin layers based on
-        spectral irradiance and the optical properties of the skin.
+        Evaluate a schedule on the time step grid of a phase.
+
+        Parameters:
+        - schedule (float, callable, tuple or pd.Series): The schedule.
+        - times (numpy.ndarray): Times since the start of the phase [s].
 
         Returns:
-        - numpy.ndarray: An array representing the distribution of radiation across the skin layers.
+        - numpy.ndarray: The values of the schedule at the given times.
+        """
+        if callable(schedule):
+            values = schedule(times)
+        elif _is_pandas_object(schedule, "Series"):
+            values = np.interp(times, schedule.index.to_numpy(dtype=float), schedule)
+        elif isinstance(schedule, tuple):
+            schedule_times, schedule_values = schedule
+            values = np.interp(times, schedule_times, schedule_values)
+        else:
+            values = schedule
+        return np.broadcast_to(np.asarray(values, dtype=float), times.shape)
+
+    def _compile_phases(self, phases, q_spectrum=None):
         """
-        # Set skin properties
-        self.properties = self._set_skin_properties(df=df)
+        Evaluate the conditions of all phases on the time step grid.
 
-        # Calculate the irradiance at each node
-        self.q_spectral_irradiance = self.q_total_irradiance * self.q_spectrum
+        Parameters:
+        - phases (list): Phases as created by add_phase, add_schedule or
+          add_spectral_series.
+        - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance of the phases
+          without spectral series. Uses self.q_spectrum if None.
 
-        if isinstance(self.q_spectral_irradiance, np.ndarray):
-            self.q_spectral_irradiance = pd.Series(
-                self.q_spectral_irradiance, index=self.q_spectrum.index
-            )
+        Returns:
+        - dict: Arrays of "T_core", "t_db", "t_r", "q_irradiance" and "profile" (row of
+          "profiles" used) for each time step, and the absorbed "profiles" per unit
+          irradiance.
 
-        self.q_irradiance_nodes = []
-        for x_cord in self.node_coordinates:
-            irradiance_at_node = (
-                self.q_spectral_irradiance
-                * (1 - self.spectral_reflectance)
-                * (
-                    np.exp(
-                        -(
-                            self.spectral_absorption_coefficient
-                            + self.spectral_scattering_coefficient
-                        )
-                        * (x_cord - self.dx / 2)
-                        * 1e3
-                    )
-                    - np.exp(
-                        -(
-                            self.spectral_absorption_coefficient
-                            + self.spectral_scattering_coefficient
-                        )
-                        * (x_cord + self.dx / 2)
-                        * 1e3
-                    )
+        Raises:
+        - ValueError: If the irradiance is negative at any time step.
+        """
+        # The absorbed profile is linear in the total irradiance, so it is computed
+        # once per unit irradiance and only rescaled during the simulation
+        profiles = [self._calculate_radiation_distribution(1, q_spectrum)[np.newaxis]]
+        n_profiles = 1
+
+        steps = {"T_core": [], "t_db": [], "t_r": [], "q_irradiance": [], "profile": []}
+        for phase in phases:
+            # Number of iterations for the current phase
+            iteration_number = int(phase["duration_in_sec"] / self.dt)
+            times = np.arange(iteration_number + 1) * self.dt
+
+            T_core = phase.get("T_core")
+            steps["T_core"].append(
+                self._evaluate_schedule(
+                    self.T_core if T_core is None else T_core, times
                 )
             )
-            # irradiance_at_node = (
-            #     irradiance_at_node + irradiance_at_node * self.dt / self.capacity
-            # )
-            self.q_irradiance_nodes.append(irradiance_at_node.sum())
+            for name in ["t_db", "t_r", "q_irradiance"]:
+                steps[name].append(self._evaluate_schedule(phase[name], times))
+
+            if "spectra" in phase:
+                # Absorbed profiles of all frames in one batched product
+                profiles.append(
+                    calculate_absorbed_profiles(
+                        self.spectral_tables.attenuation_kernel, phase["spectra"]
+                    )
+                )
+                frame = np.searchsorted(phase["frame_times"], times, side="right") - 1
+                steps["profile"].append(n_profiles + np.maximum(frame, 0))
+                n_profiles += len(phase["spectra"])
+            else:
+                steps["profile"].append(np.zeros(len(times), dtype=int))
+
+        steps = {name: np.concatenate(values) for name, values in steps.items()}
+        steps["profiles"] = np.concatenate(profiles)
+        if np.any(steps["q_irradiance"] < 0):
+            raise ValueError("q_irradiance must be non-negative.")
+        return steps
 
-        # Reverse the array to align with the core side
-        self.q_distribution_nodes = np.array(self.q_irradiance_nodes[::-1])
-        return self.q_distribution_nodes
+    def _reset_simulation(self):
+        """
+        Reset the simulation to its initial state.
+        """
+        # Resetting simulation time and temperature distribution
+        self.simulation_time = 0
+        self.T = np.ones(self.n) * self.initial_temperature
 
-    def _calculate_heat_flux(self, T):
+        # Clearing all phases
+        self.phases = []
+
+    def _calculate_radiation_distribution(
+        self, q_total_irradiance=None, q_spectrum=None
+    ):
         """
-        Calculate the heat flux for each skin layer.
+        Calculate the distribution of radiation within the skin layers based on
+        spectral irradiance and the optical properties of the skin.
 
         Parameters:
-        - T (numpy.ndarray): Array of temperatures for each skin layer.
+        - q_total_irradiance (float): Total irradiance (W/m²). Uses
+          self.q_total_irradiance if None.
+        - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance. Uses
+          self.q_spectrum if None.
 
         Returns:
-        - numpy.ndarray: Array of heat flux for each skin layer.
+        - numpy.ndarray: An array representing the distribution of radiation across the
+          skin layers.
         """
-        q_total_flux = np.zeros(self.n)
+        if q_total_irradiance is None:
+            q_total_irradiance = self.q_total_irradiance
+        if q_spectrum is None:
+            q_spectrum = self.q_spectrum
 
-        # Heat balance equations except the boundaries
-        for i in range(1, self.n - 1):
-            q_total_flux[i] = (
-                (T[i - 1] - T[i]) / self.r_skin2skin
-                + (T[i + 1] - T[i]) / self.r_skin2skin
-                + self.q_irradiance_nodes[i]
-            )
+        # Project the spectral irradiance onto the nodes with the attenuation kernel
+        q_spectral_irradiance = q_total_irradiance * self._align_spectrum(q_spectrum)
 
-        # Equations at the boundaries
-        q_total_flux[0] = (
-            (T[1] - T[0]) / self.r_skin2skin
-            + (self.T_core - T[0]) / self.r_skin2core
-            + self.q_irradiance_nodes[0]
-        )
+        # The rows of the kernel are already aligned with the core side
+        return self.spectral_tables.attenuation_kernel @ q_spectral_irradiance
 
-        self.q_convection = (self.T_db - T[self.n - 1]) / self.r_skin2amb_convection
-        # self.q_radiation = (self.T_r - T[self.n - 1]) / self.r_skin2amb_radiation
-        self.q_radiation = (
-            self.sigma * self.absorption_lw * (self.T_r + 273.15) ** 4
-            - self.sigma * self.absorption_lw * (T[self.n - 1] + 273.15) ** 4
-        )
-        q_total_flux[self.n - 1] = (
-            (T[self.n - 2] - T[self.n - 1]) / self.r_skin2skin
-            + self.q_convection
-            + self.q_radiation
-            + self.q_irradiance_nodes[self.n - 1]
-        )
+    def _calculate_heat_flux(self, T, q_irradiance_nodes, T_db, T_r, T_core):
+        """
+        Calculate the heat flux for each skin layer.
 
-        return q_total_flux
+        Parameters:
+        - T (numpy.ndarray): Array of temperatures for each skin layer.
+        - q_irradiance_nodes (numpy.ndarray): Absorbed irradiance at each skin layer
+          (W/m²).
+        - T_db (float): Dry bulb temperature (°C).
+        - T_r (float): Radiant temperature (°C).
+        - T_core (float): Core temperature (°C).
+
+        Returns:
+        - numpy.ndarray: Array of heat flux for each skin layer.
+        """
+        return calculate_heat_flux(
+            T,
+            q_irradiance_nodes,
+            T_db,
+            T_r,
+            T_core,
+            self.r_skin2skin,
+            self.r_skin2core,
+            self.r_skin2amb_convection,
+            self.absorption_lw,
+            self.sigma,
+        )
 
     def _prepare_dataframe(
         self, T_history, q_irradiance_history, input_conditions, show_input
@@ -303,30 +690,36 @@ class ReceptorModel:
         - T_history (list): List containing the history of temperatures.
         - q_irradiance_history (list): List containing the history of irradiance nodes.
         - input_conditions (list): List containing the input conditions.
-        - show_input (bool): Indicates whether to include input conditions in the DataFrame.
+        - show_input (bool): Indicates whether to include input conditions in the
+          DataFrame.
 
         Returns:
         - pd.DataFrame: DataFrame containing the simulation results.
         """
+        import pandas as pd
+
         # Create DataFrame from temperature history
         columns = ["Current_Time", "dt"] + ["T_" + str(i) for i in range(self.n)]
         df = pd.DataFrame(T_history, columns=columns)
 
         # Additional Calculations
-        df["T_warm"] = (df["T_33"] + 5 * df["T_32"]) / 6  # Warm receptor temperature
-        df["dT_warm"] = (
-            df["T_warm"].diff() * self.dt
-        )  # Derivative of warm receptor temperature
-        df["R"] = (
-            self.coef_static_warm_receptor
-            * np.maximum(0, df["T_warm"] - self.T_no_static_discharge)
-            + self.coef_dynamic_warm_receptor * (df["dT_warm"]) / self.dt
-        )  # Thermal response
-        df["dR"] = df["R"].diff()  # Derivative of thermal response
-        time_to_integrate = 20
-        df["PSI"] = (
-            df["dR"].rolling(int(time_to_integrate / self.dt)).sum()
-        )  # Integral of dRt over a window
+        weights = calculate_receptor_weights(
+            self.node_coordinates, self.length, self.receptor_depth
+        )
+        T_warm = df[columns[2:]].to_numpy() @ weights  # Warm receptor temperature
+        response = calculate_receptor_response(
+            T_warm,
+            self.dt,
+            self.coef_static_warm_receptor,
+            self.coef_dynamic_warm_receptor,
+            self.T_no_static_discharge,
+            self.time_to_integrate,
+        )
+        df["T_warm"] = T_warm
+        df["dT_warm"] = response["dT_warm"]  # Derivative of warm receptor temperature
+        df["R"] = response["R"]  # Thermal response
+        df["dR"] = response["dR"]  # Derivative of thermal response
+        df["PSI"] = response["PSI"]  # Integral of dRt over a window
 
         # Include input conditions if requested
         if show_input:
@@ -344,21 +737,35 @@ class ReceptorModel:
 
         return df
 
-    def simulate(self, show_input=False):
+    def simulate(self, show_input=False, phases=None, q_spectrum=None):
         """
         Simulate the thermal response of skin receptors over defined phases.
 
+        The conditions of constant phases (add_phase), schedules (add_schedule) and
+        spectral series (add_spectral_series) are evaluated on the time step grid
+        before the time integration. The model itself
+        is not modified by a simulation: all per-run state is kept in local variables,
+        so one model can run several simulations concurrently
+        (see batch.simulate_in_thread_pool).
+
         Parameters:
         - show_input (bool): If True, include input conditions in the output DataFrame.
+        - phases (list): Phases to simulate. Uses the phases added with add_phase,
+          add_schedule and add_spectral_series if None.
+        - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance of the phases
+          without spectral series. Uses self.q_spectrum if None.
 
         Returns:
-        - pd.DataFrame: A DataFrame containing the simulation results, including temperatures and thermal responses.
+        - pd.DataFrame: A DataFrame containing the simulation results, including
+          temperatures and thermal responses.
 
         Raises:
         - ValueError: If no phases have been added before simulation.
         """
+        phases = list(self.phases if phases is None else phases)
+
         # Check if at least one phase is added
-        if not self.phases:
+        if not phases:
             raise ValueError("At least one phase must be added before simulation.")
 
         # Initialize variables for simulation
@@ -371,30 +778,41 @@ class ReceptorModel:
         # Record initial conditions
         T_history.append(np.append([current_time, self.dt], T.copy()))
 
-        # Iterate over each phase
-        for phase in self.phases:
-            self._update_environmental_conditions(phase)
-            self.q_irradiance_nodes = self._calculate_radiation_distribution()
+        # Evaluate the conditions and absorbed profiles on the time step grid once
+        steps = self._compile_phases(phases, q_spectrum)
+        profiles = steps["profiles"]
+        q_total_irradiance = None
+        profile = None
+
+        for T_core, T_db, T_r, q_step, profile_step in zip(
+            steps["T_core"].tolist(),
+            steps["t_db"].tolist(),
+            steps["t_r"].tolist(),
+            steps["q_irradiance"].tolist(),
+            steps["profile"].tolist(),
+        ):
+            # Rescale the absorbed profile only when the input changes
+            if q_step != q_total_irradiance or profile_step != profile:
+                q_total_irradiance = q_step
+                profile = profile_step
+                q_irradiance_nodes = profiles[profile] * q_total_irradiance
+
+            # Calculate heat flux for each layer
+            q_total_flux = self._calculate_heat_flux(
+                T, q_irradiance_nodes, T_db, T_r, T_core
+            )
 
-            # Number of iterations for the current phase
-            iteration_number = int(phase["duration_in_sec"] / self.dt)
-            for _ in range(iteration_number + 1):
-                # Calculate heat flux for each layer
-                q_total_flux = self._calculate_heat_flux(T)
-
-                # Update temperatures based on heat flux
-                T += q_total_flux * self.dt / self.capacity
-                current_time += self.dt
-
-                # Record data at regular intervals
-                if current_time % 1.0 < self.dt:
-                    T_history.append(np.append([int(current_time), self.dt], T.copy()))
-
-                    if show_input:
-                        q_irradiance_history.append(self.q_irradiance_nodes.copy())
-                        input_conditions.append(
-                            [self.T_core, self.T_db, self.T_r, self.q_total_irradiance]
-                        )
+            # Update temperatures based on heat flux
+            T += q_total_flux * self.dt / self.capacity
+            current_time += self.dt
+
+            # Record data at regular intervals
+            if current_time % 1.0 < self.dt:
+                T_history.append(np.append([int(current_time), self.dt], T.copy()))
+
+                if show_input:
+                    q_irradiance_history.append(q_irradiance_nodes.copy())
+                    input_conditions.append([T_core, T_db, T_r, q_total_irradiance])
 
         # Convert simulation data to DataFrame
         df = self._prepare_dataframe(
@@ -0,0 +1,169 @@
+import numpy as np
+from model import calculate_receptor_response
+
+
+def add_pwm_cycle(model, period, duty_cycle, q_irradiance, t_db, t_r, q_off=0):
+    """
+    Add one cycle of pulse-width modulated irradiation to a model.
+
+    A phase of d seconds runs int(d / dt) + 1 time steps, so the durations are set for
+    the on and off phases to take exactly duty_cycle * period and the rest of the
+    period (rounded to time steps).
+
+    Parameters:
+    - model (BatchedReceptorModel): Model to which the phases are added.
+    - period (float): Duration of the cycle [s].
+    - duty_cycle (float): Fraction of the cycle with irradiation, in (0, 1).
+    - q_irradiance (float, array-like or dict): Irradiance during the pulse (W/m²).
+    - t_db (float, array-like or dict): Dry bulb temperature (°C).
+    - t_r (float, array-like or dict): Radiant temperature (°C).
+    - q_off (float, array-like or dict): Irradiance between the pulses (W/m²).
+
+    Raises:
+    - ValueError: If the duty cycle leaves a phase shorter than one time step.
+    """
+    steps = int(round(period / model.dt))
+    on_steps = int(round(duty_cycle * steps))
+    if not 0 < on_steps < steps:
+        raise ValueError("Both phases of the cycle must last at least one time step.")
+    model.add_phase((on_steps - 0.5) * model.dt, t_db, t_r, q_irradiance)
+    model.add_phase((steps - on_steps - 0.5) * model.dt, t_db, t_r, q_off)
+
+
+def solve_periodic_state(
+    model,
+    phases=None,
+    initial_temperature=None,
+    tolerance=1e-6,
+    max_iterations=10,
+    perturbation=0.01,
+):
+    """
+    Solve for the temperatures that repeat after one cycle of the phases.
+
+    The periodic state is a fixed point of the one-cycle propagator P, found by
+    Newton's method on P(T) - T. The Jacobian of P is estimated by finite differences
+    from one batched run, with a lane per perturbed node of each patch. Since the heat
+    balance is linear except for the T⁴ radiation at the surface, a few iterations
+    replace the hundreds of cycles needed to reach the periodic regime by time stepping.
+
+    Parameters:
+    - model (BatchedReceptorModel): Model with the spectrum set and the phases of one
+      cycle added (e.g. with add_pwm_cycle).
+    - phases (list): Phases of one cycle. Uses the phases of the model if None.
+    - initial_temperature (numpy.ndarray): First guess of shape (batch, n). Uses the
+      initial temperature of the model if None.
+    - tolerance (float): Largest change of any temperature over a cycle (°C).
+    - max_iterations (int): Maximum number of Newton iterations.
+    - perturbation (float): Temperature perturbation of the finite differences (°C).
+
+    Returns:
+    - dict: "temperature" (batch, n) at the start of a cycle, "residual" (largest
+      change of a temperature over the cycle, °C), "converged" and "iterations".
+    """
+    phases = list(model.phases if phases is None else phases)
+    n = model.n
+    batch = model.batch_size
+    if initial_temperature is None:
+        initial_temperature = model.initial_temperature[:, np.newaxis]
+    T = np.array(np.broadcast_to(initial_temperature, (batch, n)), dtype=float)
+
+    # One lane without perturbation and one per perturbed node, for each patch
+    lanes = model.select(np.repeat(np.arange(batch), n + 1), phases)
+    offsets = np.vstack([np.zeros(n), perturbation * np.eye(n)])
+
+    residual = np.inf
+    iterations = 0
+    while iterations < max_iterations:
+        iterations += 1
+        results = lanes.simulate(
+            initial_temperature=(T[:, np.newaxis] + offsets).reshape(-1, n),
+        )
+        final = results["final_temperature"].reshape(batch, n + 1, n)
+
+        change = final[:, 0] - T
+        residual = np.abs(change).max()
+        if residual <= tolerance:
+            break
+
+        # Newton step on P(T) - T with the Jacobian of P (batch, n, n)
+        jacobian = np.swapaxes(final[:, 1:] - final[:, :1], 1, 2) / perturbation
+        T = T - np.linalg.solve(jacobian - np.eye(n), change[:, :, np.newaxis])[..., 0]
+
+    return {
+        "temperature": T,
+        "residual": residual,
+        "converged": residual <= tolerance,
+        "iterations": iterations,
+    }
+
+
+def simulate_periodic_response(model, phases=None, **solver_options):
+    """
+    Simulate the receptor response over one cycle of the periodic regime.
+
+    One cycle is simulated from the periodic state, and its records are repeated
+    over the PSI window, so R and PSI are those of the periodic regime without
+    simulating the cycles before it. The cycle must last a whole number of seconds
+    (see add_pwm_cycle) for its records, one per second, to repeat exactly.
+
+    Parameters:
+    - model (BatchedReceptorModel): Model with the spectrum set and the phases of one
+      cycle added (e.g. with add_pwm_cycle).
+    - phases (list): Phases of one cycle. Uses the phases of the model if None.
+    - solver_options: Options of solve_periodic_state.
+
+    Returns:
+    - dict: "time" (records,) since the start of the cycle [s], and "T_warm",
+      "T_surface", "R" and "PSI" of shape (batch, records) over one cycle (the first
+      record is the start of the cycle), plus the results of solve_periodic_state.
+
+    Raises:
+    - ValueError: If the time steps of the cycle do not add up to a whole number of
+      seconds.
+    """
+    phases = list(model.phases if phases is None else phases)
+    # A phase of d seconds runs int(d / dt) + 1 time steps (see add_pwm_cycle)
+    steps = sum(int(phase["duration_in_sec"] / model.dt) + 1 for phase in phases)
+    cycle_duration = steps * model.dt
+    if round(cycle_duration) < 1 or not np.isclose(
+        cycle_duration, round(cycle_duration)
+    ):
+        raise ValueError(
+            f"The cycle lasts {cycle_duration:g} s; it must last a whole number of "
+            "seconds for its records to repeat."
+        )
+    solution = solve_periodic_state(model, phases, **solver_options)
+    # Half a time step of offset keeps the records on the same time steps in every
+    # cycle, where rounding errors of the simulation time could shift one of them
+    results = model.simulate(
+        phases=phases,
+        initial_temperature=solution["temperature"],
+        start_time=model.dt / 2,
+    )
+
+    # Repeat the records of the cycle over the PSI window
+    records = len(results["time"]) - 1
+    window = int(model.time_to_integrate / model.dt)
+    cycles = int(np.ceil((window + 1) / records)) + 1
+    T_warm = np.hstack(
+        [results["T_warm"][:, :1], np.tile(results["T_warm"][:, 1:], cycles)]
+    )
+    response = calculate_receptor_response(
+        T_warm,
+        model.dt,
+        model.coef_static_warm_receptor[:, np.newaxis],
+        model.coef_dynamic_warm_receptor[:, np.newaxis],
+        model.T_no_static_discharge[:, np.newaxis],
+        model.time_to_integrate,
+    )
+
+    cycle = slice(-records - 1, None)
+    return {
+        "time": results["time"],
+        "T_warm": T_warm[:, cycle],
+        "T_surface": results["T_surface"],
+        "R": response["R"][:, cycle],
+        "PSI": response["PSI"][:, cycle],
+        **solution,
+    }
@@ -0,0 +1,254 @@
+import numpy as np
+from batched_model import BatchedReceptorModel
+from jos3_simulation import Nomoto2021, precondition
+
+# Distributions of the virtual subjects as (mean, standard deviation, minimum, maximum)
+DEFAULT_DISTRIBUTIONS = {
+    "male": {
+        "height": (1.71, 0.06, 1.50, 1.95),  # [m]
+        "weight": (64.0, 8.0, 45.0, 100.0),  # [kg]
+        "fat": (15.0, 4.0, 5.0, 35.0),  # [%]
+        "age": (22.0, 2.0, 18.0, 40.0),  # [years]
+    },
+    "female": {
+        "height": (1.59, 0.05, 1.40, 1.80),  # [m]
+        "weight": (52.0, 6.0, 38.0, 85.0),  # [kg]
+        "fat": (22.0, 4.0, 10.0, 40.0),  # [%]
+        "age": (22.0, 2.0, 18.0, 40.0),  # [years]
+    },
+}
+# Scale factor of the clothing insulation of every segment
+DEFAULT_CLOTHING_SCALE = (1.0, 0.15, 0.5, 1.5)
+
+
+class StreamingPercentiles:
+    """
+    Streaming estimate of percentiles over many samples, one set per output cell.
+
+    Samples are counted in fixed bins, so memory depends on the number of cells and
+    bins only, not on the number of samples: 4 bytes per cell and bin (e.g. 35 MB for
+    17 segments × 1021 records × 500 bins), plus twice as much during an update.
+    Percentiles are interpolated linearly inside a bin, so their resolution is the
+    bin width. Missing values (NaN) are ignored.
+    """
+
+    def __init__(self, shape, value_range, bins=1000):
+        """
+        Parameters:
+        - shape (tuple): Shape of the output cells (e.g. (segments, records)).
+        - value_range (tuple): (minimum, maximum) covered by the bins. Values outside
+          are counted at the edges.
+        - bins (int): Number of bins.
+        """
+        self.shape = tuple(shape)
+        self.edges = np.linspace(value_range[0], value_range[1], bins + 1)
+        self.bins = bins
+        self.counts = np.zeros((int(np.prod(self.shape)), bins), dtype=np.int32)
+        self.sum = np.zeros(self.shape)
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.out_of_range = 0  # number of values clipped to the edges
+
+    def update(self, values):
+        """
+        Add samples.
+
+        Parameters:
+        - values (numpy.ndarray): Samples of shape (samples,) + shape.
+        """
+        values = np.asarray(values, dtype=float).reshape(-1, int(np.prod(self.shape)))
+        valid = ~np.isnan(values)
+
+        self.out_of_range += int(
+            np.sum(valid & ((values < self.edges[0]) | (values > self.edges[-1])))
+        )
+        bin_index = np.clip(
+            np.searchsorted(self.edges, values, side="right") - 1, 0, self.bins - 1
+        )
+        cell_index = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+        flat_index = (cell_index * self.bins + bin_index)[valid]
+        self.counts += np.bincount(flat_index, minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+
+        self.sum += np.where(valid, values, 0).sum(axis=0).reshape(self.shape)
+        self.count += valid.sum(axis=0).reshape(self.shape)
+
+    def mean(self):
+        """
+        Returns:
+        - numpy.ndarray: Mean of each cell (NaN for cells without samples).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sum / self.count
+
+    def percentiles(self, percentiles):
+        """
+        Estimate percentiles of each cell.
+
+        Parameters:
+        - percentiles (list): Percentiles between 0 and 100.
+
+        Returns:
+        - numpy.ndarray: Values of shape (len(percentiles),) + shape (NaN for cells
+          without samples).
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        total = cumulative[:, -1]
+        results = np.full((len(percentiles), len(total)), np.nan)
+        for i, percentile in enumerate(percentiles):
+            target = percentile / 100 * total
+            bin_index = np.minimum(
+                (cumulative < target[:, np.newaxis]).sum(axis=1), self.bins - 1
+            )
+            cells = np.arange(len(total))
+            below = np.where(
+                bin_index > 0, cumulative[cells, np.maximum(bin_index - 1, 0)], 0
+            )
+            in_bin = self.counts[cells, bin_index]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                fraction = np.where(in_bin > 0, (target - below) / in_bin, 0)
+            value = self.edges[bin_index] + fraction * (
+                self.edges[bin_index + 1] - self.edges[bin_index]
+            )
+            results[i] = np.where(total > 0, value, np.nan)
+        return results.reshape((len(percentiles),) + self.shape)
+
+
+def _sample_truncated_normal(rng, size, mean, sd, minimum, maximum):
+    """
+    Sample a normal distribution clipped to [minimum, maximum].
+    """
+    return np.clip(rng.normal(mean, sd, size), minimum, maximum)
+
+
+def sample_population(
+    size,
+    base_condition=None,
+    distributions=DEFAULT_DISTRIBUTIONS,
+    clothing_scale=DEFAULT_CLOTHING_SCALE,
+    male_fraction=0.5,
+    seed=0,
+):
+    """
+    Sample JOS3 conditions of virtual subjects.
+
+    Parameters:
+    - size (int): Number of subjects.
+    - base_condition (dict): JOS3 condition providing the environment, posture and
+      clothing (see jos3_simulation.run_jos3_condition). Nomoto2021("male") if None.
+    - distributions (dict): Anthropometric distributions by sex as
+      (mean, standard deviation, minimum, maximum).
+    - clothing_scale (tuple): Distribution of the clothing insulation scale factor.
+    - male_fraction (float): Fraction of male subjects.
+    - seed (int): Seed of the random number generator.
+
+    Returns:
+    - list: JOS3 conditions, one per subject.
+    """
+    if base_condition is None:
+        base_condition = Nomoto2021("male")
+    rng = np.random.default_rng(seed)
+
+    is_male = rng.random(size) < male_fraction
+    scales = _sample_truncated_normal(rng, size, *clothing_scale)
+    samples = {}
+    for sex in ["male", "female"]:
+        samples[sex] = {
+            name: np.round(_sample_truncated_normal(rng, size, *distribution), 3)
+            for name, distribution in distributions[sex].items()
+        }
+
+    conditions = []
+    for i in range(size):
+        sex = "male" if is_male[i] else "female"
+        condition = dict(base_condition)
+        condition["sex"] = sex
+        for name in distributions[sex]:
+            condition[name] = float(samples[sex][name][i])
+        condition["clo"] = {
+            segment: round(float(value * scales[i]), 3)
+            for segment, value in base_condition["clo"].items()
+        }
+        conditions.append(condition)
+    return conditions
+
+
+def simulate_population(
+    conditions,
+    q_spectrum,
+    phases,
+    segments=("chest",),
+    batch_size=500,
+    processes=None,
+    percentiles=(5, 25, 50, 75, 95),
+    psi_range=(-50, 50),
+    bins=500,
+    template=None,
+    **parameters,
+):
+    """
+    Simulate the receptor response of a population and aggregate PSI percentiles.
+
+    The subjects are processed in batches: JOS3 preconditioning runs in a process pool
+    (with the cache of jos3_simulation.precondition), then the skin patches of all
+    subjects and segments of the batch are integrated at once. Only the streaming
+    aggregates are kept between batches, never the individual time series.
+
+    Parameters:
+    - conditions (list): JOS3 conditions of the subjects (e.g. from sample_population).
+    - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance.
+    - phases (list): Phases of the receptor simulation, as dicts with
+      "duration_in_sec", "t_db", "t_r" and "q_irradiance".
+    - segments (tuple): JOS3 body segments simulated for each subject.
+    - batch_size (int): Number of subjects per batch.
+    - processes (int): Number of JOS3 worker processes. Uses all CPUs if None.
+    - percentiles (tuple): Percentiles of PSI to report.
+    - psi_range (tuple): Range of the PSI bins (Hz).
+    - bins (int): Number of PSI bins. The PSI percentiles hold segments × records ×
+      bins counts of 4 bytes (see StreamingPercentiles).
+    - template (ReceptorModel): Model providing the default parameters.
+    - parameters: Per-patch parameters passed to BatchedReceptorModel.
+
+    Returns:
+    - dict: "time" (records,) [s], "percentiles" of shape
+      (len(percentiles), segments, records), "mean" of shape (segments, records),
+      "final_psi" (StreamingPercentiles of the PSI at the last record by segment)
+      and "out_of_range" (number of PSI values outside psi_range).
+    """
+    segments = list(segments)
+    psi = None
+    final_psi = StreamingPercentiles((len(segments),), psi_range, bins)
+    time = None
+
+    for start in range(0, len(conditions), batch_size):
+        batch = conditions[start : start + batch_size]
+        outputs = precondition(batch, outputs=["t_core"], processes=processes)
+
+        # One skin patch per subject and segment
+        labels = [f"{i}_{segment}" for i in range(len(batch)) for segment in segments]
+        T_core = [
+            output[f"t_core_{segment}"] for output in outputs for segment in segments
+        ]
+        model = BatchedReceptorModel(
+            labels, template=template, T_core=T_core, **parameters
+        )
+        model.set_spectrum(q_spectrum)
+        for phase in phases:
+            model.add_phase(**phase)
+        results = model.simulate()
+
+        # (subjects, segments, records)
+        batch_psi = results["PSI"].reshape(len(batch), len(segments), -1)
+        if psi is None:
+            time = results["time"]
+            psi = StreamingPercentiles(batch_psi.shape[1:], psi_range, bins)
+        psi.update(batch_psi)
+        final_psi.update(batch_psi[:, :, -1])
+
+    return {
+        "time": time,
+        "percentiles": psi.percentiles(percentiles),
+        "mean": psi.mean(),
+        "final_psi": final_psi,
+        "out_of_range": psi.out_of_range,
+    }
@@ -0,0 +1,366 @@
+import numpy as np
+from model import (
+    calculate_heat_flux,
+    calculate_receptor_response,
+    calculate_receptor_weights,
+)
+
+# Parameters of the heat balance that the reduced model is built for
+THERMAL_PARAMETERS = [
+    "length",
+    "hc",
+    "conductance",
+    "capacity",
+    "absorption_lw",
+    "receptor_depth",
+]
+
+
+class ReducedOrderModel:
+    """
+    A reduced-order model of the skin conduction of BatchedReceptorModel.
+
+    The temperatures are approximated as T_ref + V z, where the columns of V are the
+    leading POD modes of temperature snapshots of full simulations, and the explicit
+    Euler update of the full model is projected onto them (Galerkin). The linear
+    operator, with the T⁴ radiation linearized around the reference surface
+    temperature, and the inputs (T_core, t_db, t_r and the absorbed profile of each
+    patch) are projected once. Between two records (one per second), the inputs are
+    constant and the remainder of the radiation is held, so the time steps are
+    combined into one propagator of a few modes. Only T_warm and the surface
+    temperature are reconstructed.
+
+    The error estimate is the difference of the outputs from those of the reduced model
+    with a few more POD modes, which is much closer to the full model. Patches whose
+    estimate exceeds the tolerance are simulated again with the full model. Both
+    models hold the same remainder of the radiation between records, so the estimate
+    only covers the truncation of the modes, not the error of holding that remainder.
+
+    Usage:
+        training = BatchedReceptorModel(range(4), T_core=[35, 36, 37, 36.5])
+        training.set_spectrum(spectrum)
+        t_db, t_r = [20, 25, 30, 25], [20, 25, 30, 28]
+        training.add_phase(1000, t_db=t_db, t_r=t_r, q_irradiance=0)
+        training.add_phase(60, t_db=t_db, t_r=t_r, q_irradiance=[0, 300, 600, 150])
+        rom = ReducedOrderModel.build(training, modes=8)
+        model = BatchedReceptorModel(range(2), T_core=[36, 37])
+        model.set_spectrum(spectrum)
+        model.add_phase(600, t_db=[22, 28], t_r=[22, 30], q_irradiance=[200, 400])
+        results = rom.simulate(model)
+    """
+
+    def __init__(
+        self, modes, reference, parameters, singular_values, template, error_modes=2
+    ):
+        """
+        Parameters:
+        - modes (numpy.ndarray): POD modes of shape (n, modes + error_modes),
+          orthonormal, in order of decreasing singular value.
+        - reference (numpy.ndarray): Reference temperatures T_ref of shape (n,).
+        - parameters (dict): Values of THERMAL_PARAMETERS the model is built for.
+        - singular_values (numpy.ndarray): Singular values of all snapshots.
+        - template (ReceptorModel): Model providing the time step and the receptor.
+        - error_modes (int): Number of the last modes used only for the error estimate.
+
+        Raises:
+        - ValueError: If there are no modes left for the solution.
+        """
+        if error_modes < 0 or modes.shape[1] <= error_modes:
+            raise ValueError("At least one mode must be left besides the error modes.")
+        self.modes = modes
+        self.reference = reference
+        self.parameters = parameters
+        self.singular_values = singular_values
+        self.template = template
+        self.error_modes = error_modes
+        self.dt = template.dt
+
+        p = parameters
+        n = len(reference)
+        self.radiation = template.sigma * p["absorption_lw"]
+        self.radiation_slope = 4 * self.radiation * (reference[-1] + 273.15) ** 3
+        node_coordinates = (np.arange(n) + 0.5) * p["length"] / n
+        receptor_weights = calculate_receptor_weights(
+            node_coordinates, p["length"], p["receptor_depth"]
+        )
+        self.output_weights = np.vstack([receptor_weights, np.eye(n)[-1]])
+
+        # Solution, and the richer model of the error estimate
+        rank = modes.shape[1] - error_modes
+        self.systems = [self._project(modes[:, :rank])]
+        if error_modes:
+            self.systems.append(self._project(modes))
+
+    @classmethod
+    def build(cls, training, modes=8, phases=None, error_modes=2):
+        """
+        Build a reduced model from the snapshots of a batch of full simulations.
+
+        Parameters:
+        - training (BatchedReceptorModel): Patches with the same thermal parameters (see
+          THERMAL_PARAMETERS), with spectra and phases covering the conditions of use.
+        - modes (int): Number of POD modes of the solution.
+        - phases (list): Phases of the training. Uses the phases of the model if None.
+        - error_modes (int): Number of additional POD modes of the error estimate.
+
+        Returns:
+        - ReducedOrderModel: The reduced model.
+
+        Raises:
+        - ValueError: If the thermal parameters differ between the patches.
+        """
+        parameters = {}
+        for name in THERMAL_PARAMETERS:
+            values = getattr(training, name)
+            if np.ptp(values) > 0:
+                raise ValueError(f"{name} must be the same for all training patches.")
+            parameters[name] = float(values[0])
+
+        snapshots = training.simulate(phases=phases, record_temperature=True)["T"]
+        snapshots = snapshots.reshape(-1, training.n)
+        reference = snapshots.mean(axis=0)
+        _, singular_values, vectors = np.linalg.svd(
+            snapshots - reference, full_matrices=False
+        )
+        return cls(
+            vectors[: modes + error_modes].T,
+            reference,
+            parameters,
+            singular_values,
+            training.template,
+            error_modes,
+        )
+
+    def _project(self, V):
+        """
+        Project the full update onto modes.
+
+        Parameters:
+        - V (numpy.ndarray): Orthonormal modes of shape (n, r).
+
+        Returns:
+        - dict: The reduced update z ← M z + g, with g = "constant" + "inputs" @
+          [T_core, T_db] + "surface" * surface flux (see _surface_flux) + q * the
+          projected absorbed profile, and the outputs (T_warm, T_surface) = "offset" +
+          "output_modes" @ z. "propagators" caches the updates over several steps.
+        """
+        n, r = V.shape
+        p = self.parameters
+        dx = p["length"] / n
+        step = self.dt / p["capacity"]
+
+        def flux(T, T_core=0, T_db=0):
+            # Linear part of the heat balance (no irradiance, no radiation)
+            return calculate_heat_flux(
+                T,
+                np.zeros(n),
+                T_db,
+                0,
+                T_core,
+                dx / p["conductance"],
+                dx / (2 * p["conductance"]),
+                dx / (2 * p["conductance"]) + 1 / p["hc"],
+                0,
+            )
+
+        # Full update T += step * (A T + B [T_core, T_db] + surface flux + q profile),
+        # where A includes the slope of the linearized radiation
+        A = np.column_stack([flux(column) for column in np.eye(n)])
+        A[-1, -1] -= self.radiation_slope
+        B = np.column_stack([flux(np.zeros(n), T_core=1), flux(np.zeros(n), T_db=1)])
+
+        return {
+            "modes": V,
+            "operator": np.eye(r) + step * V.T @ A @ V,
+            "constant": step * V.T @ A @ self.reference,
+            "inputs": step * V.T @ B,
+            "surface": step * V[-1],
+            "offset": self.output_weights @ self.reference,
+            "output_modes": self.output_weights @ V,
+            "propagators": {},
+        }
+
+    @staticmethod
+    def _propagator(system, steps):
+        """
+        Get the reduced update over several time steps with constant inputs.
+
+        Returns:
+        - tuple: M^steps and the sum of M^j for j < steps.
+        """
+        propagators = system["propagators"]
+        if steps not in propagators:
+            r = len(system["operator"])
+            power, total = np.eye(r), np.zeros((r, r))
+            for _ in range(steps):
+                total += power
+                power = system["operator"] @ power
+            propagators[steps] = (power, total)
+        return propagators[steps]
+
+    def _surface_flux(self, T_surface, radiant):
+        """
+        Surface flux outside the linearized radiation of the reduced operator.
+
+        Parameters:
+        - T_surface (numpy.ndarray): Surface temperatures (°C).
+        - radiant (numpy.ndarray): Long wavelength radiation absorbed from the
+          environment (W/m²).
+
+        Returns:
+        - numpy.ndarray: radiant - σ a (T_surface + 273.15)⁴ + slope * T_surface (W/m²).
+        """
+        return (
+            radiant
+            - self.radiation * (T_surface + 273.15) ** 4
+            + self.radiation_slope * T_surface
+        )
+
+    @staticmethod
+    def _record_segments(phases, dt):
+        """
+        Split the time steps of the phases between the records of the full model.
+
+        Returns:
+        - list: For each phase, a list of (steps, time) with the recorded time [s] at
+          the end of the segment, or None if the phase ends between records.
+        """
+        current_time = 0
+        segments = []
+        for phase in phases:
+            phase_segments = []
+            steps = 0
+            for _ in range(int(phase["duration_in_sec"] / dt) + 1):
+                current_time += dt
+                steps += 1
+                # Record data at regular intervals
+                if current_time % 1.0 < dt:
+                    phase_segments.append((steps, int(current_time)))
+                    steps = 0
+            if steps:
+                phase_segments.append((steps, None))
+            segments.append(phase_segments)
+        return segments
+
+    def _integrate(self, system, model, phases):
+        """
+        Integrate a reduced system over the phases.
+
+        Returns:
+        - tuple: The recorded times (records,) and outputs (records, batch, 2).
+        """
+        profiles = model.absorbed_profiles * self.dt / self.parameters["capacity"]
+        reduced_profiles = profiles @ system["modes"]
+        output_modes = system["output_modes"]
+        surface_mode = system["modes"][-1]
+        surface_offset = self.reference[-1]
+
+        deviation = model.initial_temperature[:, np.newaxis] - self.reference
+        z = deviation @ system["modes"]
+        time_history = [0]
+        output_history = [z @ output_modes.T + system["offset"]]
+
+        for phase, phase_segments in zip(
+            phases, self._record_segments(phases, model.dt)
+        ):
+            T_core = model.T_core if phase["T_core"] is None else phase["T_core"]
+            source = (
+                system["constant"]
+                + np.column_stack([T_core, phase["t_db"]]) @ system["inputs"].T
+                + reduced_profiles * phase["q_irradiance"][:, np.newaxis]
+            )
+            radiant = self.radiation * (phase["t_r"] + 273.15) ** 4
+
+            # Between records, the inputs are constant and the remainder of the
+            # linearized radiation is held at its value at the start of the segment
+            for steps, record_time in phase_segments:
+                surface_flux = self._surface_flux(
+                    surface_offset + z @ surface_mode, radiant
+                )
+                power, total = self._propagator(system, steps)
+                forcing = source + surface_flux[:, np.newaxis] * system["surface"]
+                z = z @ power.T + forcing @ total.T
+
+                if record_time is not None:
+                    time_history.append(record_time)
+                    output_history.append(z @ output_modes.T + system["offset"])
+
+        return np.array(time_history), np.array(output_history)
+
+    def check_parameters(self, model):
+        """
+        Check whether a batch has the thermal parameters of the reduced model.
+
+        Parameters:
+        - model (BatchedReceptorModel): The batch.
+
+        Returns:
+        - bool: True if every patch matches.
+        """
+        return model.n == len(self.reference) and all(
+            np.allclose(getattr(model, name), value)
+            for name, value in self.parameters.items()
+        )
+
+    def simulate(self, model, phases=None, tolerance=0.05, fallback=True):
+        """
+        Simulate a batch with the reduced model.
+
+        Parameters:
+        - model (BatchedReceptorModel): Patches with the thermal parameters of the
+          reduced model, with the spectra set and the phases added.
+        - phases (list): Phases to simulate. Uses the phases of the model if None.
+        - tolerance (float): Largest estimated error of T_warm and T_surface (°C).
+        - fallback (bool): If True, simulate the patches above the tolerance with the
+          full model.
+
+        Returns:
+        - dict: "time", "T_warm", "T_surface", "R" and "PSI" as
+          BatchedReceptorModel.simulate, "error_estimate" (batch, records) (°C), zero
+          without error modes, and "reduced" (batch,), False for the patches simulated
+          with the full model.
+
+        Raises:
+        - ValueError: If the thermal parameters of the batch differ from the reduced
+          model, or no phases have been added before simulation.
+        """
+        if not self.check_parameters(model):
+            raise ValueError(
+                "The batch does not have the parameters of the reduced model."
+            )
+        phases = list(model.phases if phases is None else phases)
+        if not phases:
+            raise ValueError("At least one phase must be added before simulation.")
+
+        time, outputs = self._integrate(self.systems[0], model, phases)
+        error = np.zeros(outputs.shape[:2])
+        if len(self.systems) > 1:
+            _, richer_outputs = self._integrate(self.systems[1], model, phases)
+            error = np.abs(richer_outputs - outputs).max(axis=2)
+
+        T_warm = outputs[:, :, 0].T
+        response = calculate_receptor_response(
+            T_warm,
+            model.dt,
+            model.coef_static_warm_receptor[:, np.newaxis],
+            model.coef_dynamic_warm_receptor[:, np.newaxis],
+            model.T_no_static_discharge[:, np.newaxis],
+            model.time_to_integrate,
+        )
+        results = {
+            "time": time,
+            "T_warm": T_warm,
+            "T_surface": outputs[:, :, 1].T,
+            "R": response["R"],
+            "PSI": response["PSI"],
+            "error_estimate": error.T,
+            "reduced": np.ones(model.batch_size, dtype=bool),
+        }
+
+        exceeded = np.flatnonzero(results["error_estimate"].max(axis=1) > tolerance)
+        if fallback and len(exceeded):
+            full = model.select(exceeded, phases).simulate()
+            for name in ["T_warm", "T_surface", "R", "PSI"]:
+                results[name][exceeded] = full[name]
+            results["reduced"][exceeded] = False
+        return results
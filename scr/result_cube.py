@@ -0,0 +1,454 @@
+import itertools
+import json
+import os
+import socket
+import time
+
+import numpy as np
+from sweep_runner import claim_file, load_manifest, load_task_results, release_claim
+
+METADATA_NAME = "cube.json"
+CHUNKS_DIRECTORY_NAME = "chunks"
+LOCKS_DIRECTORY_NAME = "locks"
+DEFAULT_CHUNK_SIZE = 64  # coordinates per chunk along each axis
+
+
+def _to_list(values):
+    """
+    Convert coordinates into a list of JSON-serializable values.
+    """
+    return [
+        value.item() if isinstance(value, np.generic) else value
+        for value in (
+            values.tolist() if isinstance(values, np.ndarray) else list(values)
+        )
+    ]
+
+
+class ResultCube:
+    """
+    A chunked, compressed N-dimensional array store with labeled axes.
+
+    The cube is a directory with the axes (name and coordinates of each), the variable
+    names and the chunk shape in cube.json, and one compressed .npz file per variable
+    and chunk. Chunks that were never written read as the fill value, so a sweep can
+    fill the cube in any order.
+
+    Reads and writes select by coordinates and only touch the chunks that overlap the
+    selection, so a PSI-vs-wavelength slice at one condition is read without loading
+    the study. A write locks each chunk it changes (see sweep_runner.claim_file) and
+    replaces the chunk file atomically, so sweep workers on several processes or
+    machines sharing the directory can write at once, and readers never see a partial
+    chunk.
+
+    Usage:
+        cube = ResultCube.create(
+            path,
+            axes={
+                "wavelength": wavelengths,
+                "q_irradiance": [100, 300],
+                "t_db": [20, 25, 30],
+            },
+            variables=["PSI"],
+        )
+        cube.write("PSI", psi, q_irradiance=300, t_db=25)  # psi of shape (wavelengths,)
+        psi = ResultCube(path).read("PSI", q_irradiance=300, t_db=25)
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+        - path (str): Directory of an existing cube (see create).
+        """
+        with open(os.path.join(path, METADATA_NAME), encoding="utf-8") as file:
+            metadata = json.load(file)
+        self.path = path
+        self.axes = {
+            axis["name"]: np.array(axis["coordinates"]) for axis in metadata["axes"]
+        }
+        self.variables = metadata["variables"]
+        self.chunks = tuple(metadata["chunks"])
+        self.dtype = np.dtype(metadata["dtype"])
+        self.fill_value = (
+            np.nan if metadata["fill_value"] is None else metadata["fill_value"]
+        )
+        self.shape = tuple(len(coordinates) for coordinates in self.axes.values())
+
+    @classmethod
+    def create(
+        cls, path, axes, variables, chunks=None, dtype="float64", fill_value=None
+    ):
+        """
+        Create an empty cube, or open the identical cube of a directory.
+
+        Parameters:
+        - path (str): Directory of the cube.
+        - axes (dict): Coordinates of each axis by name, in the order of the axes.
+        - variables (list): Names of the variables, each an array over all the axes.
+        - chunks (dict): Chunk size along each axis by name. Missing axes use
+          DEFAULT_CHUNK_SIZE.
+        - dtype (str): Data type of the variables.
+        - fill_value (float): Value of unwritten elements. NaN if None.
+
+        Returns:
+        - ResultCube: The cube.
+
+        Raises:
+        - ValueError: If the directory holds a different cube, or a chunk size or axis
+          is invalid.
+        """
+        chunks = chunks or {}
+        unknown_axes = set(chunks) - set(axes)
+        if unknown_axes:
+            raise ValueError(f"Unknown axes: {sorted(unknown_axes)}")
+        metadata = {
+            "axes": [
+                {"name": name, "coordinates": _to_list(coordinates)}
+                for name, coordinates in axes.items()
+            ],
+            "variables": list(variables),
+            "chunks": [
+                min(int(chunks.get(name, DEFAULT_CHUNK_SIZE)), max(len(coordinates), 1))
+                for name, coordinates in axes.items()
+            ],
+            "dtype": np.dtype(dtype).str,
+            "fill_value": fill_value,
+        }
+        if any(len(axis["coordinates"]) == 0 for axis in metadata["axes"]) or any(
+            size < 1 for size in metadata["chunks"]
+        ):
+            raise ValueError("Axes must have coordinates and chunks a positive size.")
+
+        metadata_path = os.path.join(path, METADATA_NAME)
+        if os.path.exists(metadata_path):
+            with open(metadata_path, encoding="utf-8") as file:
+                if json.load(file) != json.loads(json.dumps(metadata)):
+                    raise ValueError(f"{path} holds a different cube.")
+            return cls(path)
+
+        for variable in variables:
+            os.makedirs(
+                os.path.join(path, CHUNKS_DIRECTORY_NAME, variable), exist_ok=True
+            )
+        os.makedirs(os.path.join(path, LOCKS_DIRECTORY_NAME), exist_ok=True)
+        temporary_path = f"{metadata_path}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        os.replace(temporary_path, metadata_path)
+        return cls(path)
+
+    def _locate(self, name, value):
+        """
+        Index of a coordinate along an axis.
+
+        Raises:
+        - ValueError: If the axis has no such coordinate.
+        """
+        coordinates = self.axes[name]
+        if coordinates.dtype.kind in "biuf" and not isinstance(value, str):
+            matches = np.flatnonzero(np.isclose(coordinates, value, rtol=1e-9, atol=0))
+        else:
+            matches = np.flatnonzero(coordinates == value)
+        if not len(matches):
+            raise ValueError(f"{name} has no coordinate {value!r}.")
+        return matches[0]
+
+    def _select(self, selection):
+        """
+        Convert a selection by coordinates into indices along each axis.
+
+        Parameters:
+        - selection (dict): For each axis, a coordinate (the axis is dropped), a list of
+          coordinates, a slice of coordinates (bounds included), or None for all.
+
+        Returns:
+        - tuple: The indices along each axis (list of numpy.ndarray), and for each axis
+          whether it is kept in the result.
+        """
+        unknown_axes = set(selection) - set(self.axes)
+        if unknown_axes:
+            raise ValueError(f"Unknown axes: {sorted(unknown_axes)}")
+        indices, kept = [], []
+        for name, coordinates in self.axes.items():
+            value = selection.get(name)
+            if value is None:
+                indices.append(np.arange(len(coordinates)))
+            elif isinstance(value, slice):
+                inside = np.ones(len(coordinates), dtype=bool)
+                if value.start is not None:
+                    inside &= coordinates >= value.start
+                if value.stop is not None:
+                    inside &= coordinates <= value.stop
+                indices.append(np.flatnonzero(inside)[:: value.step])
+            elif np.ndim(value) == 0:
+                indices.append(np.array([self._locate(name, value)]))
+            else:
+                indices.append(np.array([self._locate(name, item) for item in value]))
+            kept.append(value is None or isinstance(value, slice) or np.ndim(value) > 0)
+        return indices, kept
+
+    def _chunk_path(self, variable, chunk):
+        name = ".".join(str(index) for index in chunk) + ".npz"
+        return os.path.join(self.path, CHUNKS_DIRECTORY_NAME, variable, name)
+
+    def _chunk_shape(self, chunk):
+        return tuple(
+            min(size, length - index * size)
+            for index, size, length in zip(chunk, self.chunks, self.shape)
+        )
+
+    def _load_chunk(self, variable, chunk):
+        """
+        Load a chunk, or None if it was never written.
+        """
+        try:
+            with np.load(self._chunk_path(variable, chunk)) as data:
+                return data["values"]
+        except FileNotFoundError:
+            return None
+
+    def _overlapping_chunks(self, indices):
+        """
+        Chunks overlapping a selection, with the positions of the selected elements in
+        the selection and in the chunk along each axis.
+        """
+        return self._overlapping_chunks_of(range(len(self.axes)), indices)
+
+    def _overlapping_chunks_of(self, axes, indices):
+        """
+        Chunks overlapping a selection along some axes (see _overlapping_chunks).
+        """
+        per_axis = []
+        for axis, axis_indices in zip(axes, indices):
+            size = self.chunks[axis]
+            chunk_indices = axis_indices // size
+            per_axis.append(
+                [
+                    (
+                        chunk,
+                        np.flatnonzero(chunk_indices == chunk),
+                        axis_indices[chunk_indices == chunk] - chunk * size,
+                    )
+                    for chunk in np.unique(chunk_indices)
+                ]
+            )
+        for combination in itertools.product(*per_axis):
+            chunk, positions, local = zip(*combination) if combination else ((), (), ())
+            yield tuple(int(index) for index in chunk), positions, local
+
+    def _check_variable(self, variable):
+        if variable not in self.variables:
+            raise ValueError(f"Unknown variable: {variable}")
+
+    def read(self, variable, **selection):
+        """
+        Read a selection of a variable, loading only the chunks that overlap it.
+
+        Parameters:
+        - variable (str): Name of the variable.
+        - selection: Selection by coordinates of each axis (see _select). Axes selected
+          by one coordinate are dropped from the result.
+
+        Returns:
+        - numpy.ndarray: The values, with the remaining axes in the order of the cube.
+
+        Raises:
+        - ValueError: If the variable, an axis or a coordinate is unknown.
+        """
+        self._check_variable(variable)
+        indices, kept = self._select(selection)
+        values = np.full([len(index) for index in indices], self.fill_value, self.dtype)
+        for chunk, positions, local in self._overlapping_chunks(indices):
+            data = self._load_chunk(variable, chunk)
+            if data is not None:
+                values[np.ix_(*positions)] = data[np.ix_(*local)]
+        return values.reshape(
+            [len(index) for index, keep in zip(indices, kept) if keep]
+        )
+
+    def write(self, variable, values, stale_after=None, **selection):
+        """
+        Write values into a selection of a variable, locking each chunk it changes.
+
+        Parameters:
+        - variable (str): Name of the variable.
+        - values (numpy.ndarray): Values broadcastable to the shape of the selection
+          (as returned by read).
+        - stale_after (float): Age [s] after which a lock of another host is taken over.
+        - selection: Selection by coordinates of each axis (see _select).
+
+        Raises:
+        - ValueError: If the variable, an axis or a coordinate is unknown.
+        """
+        self._check_variable(variable)
+        indices, kept = self._select(selection)
+        shape = [len(index) for index, keep in zip(indices, kept) if keep]
+        values = np.broadcast_to(np.asarray(values, dtype=self.dtype), shape).reshape(
+            [len(index) for index in indices]
+        )
+        for chunk, positions, local in self._overlapping_chunks(indices):
+
+            def update(data, positions=positions, local=local):
+                data[np.ix_(*local)] = values[np.ix_(*positions)]
+
+            self._update_chunk(variable, chunk, update, stale_after)
+
+    def _update_chunk(self, variable, chunk, update, stale_after=None):
+        """
+        Update a chunk under its lock and replace its file atomically.
+
+        Parameters:
+        - variable (str): Name of the variable.
+        - chunk (tuple): Index of the chunk along each axis.
+        - update (callable): Function modifying the chunk array in place.
+        - stale_after (float): Age [s] after which a lock of another host is taken over.
+        """
+        lock_path = os.path.join(
+            self.path, LOCKS_DIRECTORY_NAME, f"{variable}.{'.'.join(map(str, chunk))}"
+        )
+        while not claim_file(lock_path, stale_after):
+            time.sleep(0.01)
+        try:
+            data = self._load_chunk(variable, chunk)
+            if data is None:
+                data = np.full(self._chunk_shape(chunk), self.fill_value, self.dtype)
+            update(data)
+
+            # Replace the chunk atomically, so readers never see a partial file
+            path = self._chunk_path(variable, chunk)
+            temporary_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp.npz"
+            np.savez_compressed(temporary_path, values=data)
+            os.replace(temporary_path, path)
+        finally:
+            release_claim(lock_path)
+
+    def write_rows(self, rows, results, stale_after=None):
+        """
+        Write the results of sweep rows, one lock per chunk changed.
+
+        Parameters:
+        - rows (list): Rows with a coordinate for some of the axes (see
+          sweep_runner.expand_grid). The other axes are written whole.
+        - results (list): Results of each row, a dict of values by variable, each of
+          the shape of the other axes.
+        - stale_after (float): Age [s] after which a lock of another host is taken over.
+
+        Raises:
+        - ValueError: If the rows select different axes, or a coordinate is unknown.
+        """
+        if not rows:
+            return
+        names = [name for name in self.axes if name in rows[0]]
+        if not names or any(set(row) & set(self.axes) != set(names) for row in rows):
+            raise ValueError("All rows must select the same axes, at least one.")
+
+        axes = list(self.axes)
+        row_axes = [axes.index(name) for name in names]
+        other_axes = [axis for axis in range(len(axes)) if axis not in row_axes]
+        other_indices = [np.arange(self.shape[axis]) for axis in other_axes]
+
+        # Rows in the same chunks along their axes are written together
+        groups = {}
+        for row, result in zip(rows, results):
+            position = [self._locate(name, row[name]) for name in names]
+            chunk = tuple(
+                index // self.chunks[axis] for index, axis in zip(position, row_axes)
+            )
+            groups.setdefault(chunk, []).append((position, result))
+
+        for row_chunk, group in groups.items():
+            local_rows = [
+                np.array([position[k] for position, _ in group])
+                - row_chunk[k] * self.chunks[axis]
+                for k, axis in enumerate(row_axes)
+            ]
+            for variable in self.variables:
+                present = [
+                    (k, result[variable])
+                    for k, (_, result) in enumerate(group)
+                    if variable in result
+                ]
+                if not present:
+                    continue
+                selected = [k for k, _ in present]
+                row_index = tuple(local_row[selected] for local_row in local_rows)
+                values = np.broadcast_to(
+                    np.array([value for _, value in present], dtype=self.dtype),
+                    (len(present), *[len(index) for index in other_indices]),
+                )
+
+                # The other axes are written whole, chunk by chunk
+                for other_chunk, positions, local in self._overlapping_chunks_of(
+                    other_axes, other_indices
+                ):
+                    chunk = [0] * len(axes)
+                    for index, axis in zip(row_chunk, row_axes):
+                        chunk[axis] = index
+                    for index, axis in zip(other_chunk, other_axes):
+                        chunk[axis] = index
+
+                    def update(data, positions=positions, local=local):
+                        # Rows first; the other axes are contiguous in the chunk
+                        view = np.moveaxis(data, row_axes, range(len(row_axes)))
+                        view[
+                            row_index + tuple(slice(i[0], i[-1] + 1) for i in local)
+                        ] = values[
+                            (slice(None),)
+                            + tuple(slice(i[0], i[-1] + 1) for i in positions)
+                        ]
+
+                    self._update_chunk(variable, tuple(chunk), update, stale_after)
+
+
+def create_sweep_cube(
+    directory, path, variables=("PSI",), extra_axes=None, chunks=None, **options
+):
+    """
+    Create the result cube of a sweep, with an axis for each parameter of its grid.
+
+    Usage:
+        create_manifest(directory, grid, "sweep_runner:simulate_sweep_history_task")
+        create_sweep_cube(directory, path, extra_axes={"time": np.arange(21)})
+        run_sweep(directory, processes=4, cube_path=path)
+        psi = ResultCube(path).read("PSI", q_irradiance=300, t_db=25, time=20)
+
+    Parameters:
+    - directory (str): Directory of the sweep, with its manifest.
+    - path (str): Directory of the cube.
+    - variables (list): Names of the results of the task function.
+    - extra_axes (dict): Coordinates of the axes of each result after the parameter
+      axes, e.g. {"time": ...} for a history of records. None for scalar results.
+    - chunks (dict): Chunk size along each axis by name (see ResultCube.create).
+    - options: Other options of ResultCube.create.
+
+    Returns:
+    - ResultCube: The cube.
+    """
+    axes = dict(load_manifest(directory)["grid"])
+    axes.update(extra_axes or {})
+    return ResultCube.create(path, axes, variables, chunks=chunks, **options)
+
+
+def write_sweep_results(directory, path, stale_after=None):
+    """
+    Write the finished tasks of a sweep into its result cube.
+
+    Fills a cube created after the sweep ran, or without cube_path (see
+    sweep_runner.run_sweep).
+
+    Parameters:
+    - directory (str): Directory of the sweep.
+    - path (str): Directory of the cube (see create_sweep_cube).
+    - stale_after (float): Age [s] after which a lock of another host is taken over.
+
+    Returns:
+    - int: Number of tasks written.
+    """
+    cube = ResultCube(path)
+    written = 0
+    for task in load_manifest(directory)["tasks"]:
+        results = load_task_results(directory, task)
+        if results is not None:
+            cube.write_rows(task["rows"], results, stale_after)
+            written += 1
+    return written
@@ -0,0 +1,260 @@
+import numpy as np
+from model import (
+    calculate_heat_flux,
+    calculate_receptor_response,
+    calculate_receptor_weights,
+)
+
+# Parameters of the heat balance, differentiated along the time integration
+THERMAL_PARAMETERS = [
+    "hc",
+    "hr",
+    "absorption_lw",
+    "conductance",
+    "volumetric_capacity",
+    "T_core",
+]
+# Parameters of the receptor equations, differentiated after the time integration
+RECEPTOR_PARAMETERS = [
+    "receptor_depth",
+    "coef_static_warm_receptor",
+    "coef_dynamic_warm_receptor",
+    "T_no_static_discharge",
+]
+SENSITIVITY_PARAMETERS = THERMAL_PARAMETERS + RECEPTOR_PARAMETERS
+
+
+def _parameter_forcing(model, name, T, q_total_flux, T_db, T_r, T_core):
+    """
+    Calculate the partial derivative of the heat flux with respect to a parameter.
+
+    Parameters:
+    - model (ReceptorModel): The model.
+    - name (str): Name of a thermal parameter (see THERMAL_PARAMETERS).
+    - T (numpy.ndarray): Temperatures of the skin layers (°C).
+    - q_total_flux (numpy.ndarray): Heat flux of the skin layers (W/m²).
+    - T_db (float): Dry bulb temperature (°C).
+    - T_r (float): Radiant temperature (°C).
+    - T_core (float): Core temperature (°C).
+
+    Returns:
+    - numpy.ndarray: Derivative of the heat flux of each layer.
+    """
+    forcing = np.zeros(model.n)
+    if name == "hc":
+        # r_skin2amb_convection = dx / (2 * conductance) + 1 / hc
+        forcing[-1] = (T_db - T[-1]) / (model.r_skin2amb_convection * model.hc) ** 2
+    elif name == "absorption_lw":
+        forcing[-1] = model.sigma * ((T_r + 273.15) ** 4 - (T[-1] + 273.15) ** 4)
+    elif name == "conductance":
+        # Every resistance is divided by the conductance, except 1 / hc
+        forcing = calculate_heat_flux(
+            T,
+            forcing,
+            T_db,
+            T_r,
+            T_core,
+            model.dx,
+            model.dx / 2,
+            2 * (model.conductance * model.r_skin2amb_convection) ** 2 / model.dx,
+            0,
+        )
+    elif name == "volumetric_capacity":
+        # The time step is divided by the capacity
+        forcing = -q_total_flux / (model.capacity / model.dx)
+    elif name == "T_core":
+        forcing[0] = 1 / model.r_skin2core
+    # hr does not enter the heat balance, so its forcing is zero
+    return forcing
+
+
+def _receptor_depth_weights(node_coordinates, length, receptor_depth):
+    """
+    Calculate the derivative of the receptor weights with respect to the receptor depth.
+
+    Returns:
+    - numpy.ndarray: Derivative of the weights of calculate_receptor_weights [1/m].
+    """
+    position = length - receptor_depth
+    n = len(node_coordinates)
+    lower_index = int(np.clip((node_coordinates <= position).sum() - 1, 0, n - 2))
+    spacing = node_coordinates[lower_index + 1] - node_coordinates[lower_index]
+
+    derivative = np.zeros(n)
+    fraction = (position - node_coordinates[lower_index]) / spacing
+    if 0 < fraction < 1:
+        # A deeper receptor moves the interpolation towards the lower (core side) node
+        derivative[lower_index] = 1 / spacing
+        derivative[lower_index + 1] = -1 / spacing
+    return derivative
+
+
+def _window_difference(values, window):
+    """
+    Difference of values over a window of records, as PSI in
+    calculate_receptor_response.
+    """
+    difference = np.full(values.shape, np.nan)
+    difference[..., window:] = values[..., window:] - values[..., :-window]
+    return difference
+
+
+def simulate_sensitivities(
+    model, phases=None, q_spectrum=None, parameters=SENSITIVITY_PARAMETERS
+):
+    """
+    Simulate a ReceptorModel together with the sensitivities of T_warm and PSI.
+
+    The forward sensitivity equations of the explicit Euler scheme are integrated
+    alongside the temperatures, so the derivatives are those of the discrete model
+    (they match finite differences of simulate up to their own truncation error).
+    All sensitivities are integrated in one pass as a (parameters × n) array.
+    The receptor parameters do not enter the heat balance and are differentiated from
+    the recorded temperatures.
+
+    Parameters:
+    - model (ReceptorModel): The model. Its parameters are not modified.
+    - phases (list): Phases to simulate. Uses the phases of the model if None.
+    - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance of the phases
+      without spectral series. Uses model.q_spectrum if None.
+    - parameters (list): Parameters to differentiate (see SENSITIVITY_PARAMETERS).
+      "volumetric_capacity" is the heat capacity per volume (capacity / dx) and
+      "T_core" a uniform shift of the core temperature.
+
+    Returns:
+    - dict: "results" (pd.DataFrame of "Current_Time", "T_warm", "R" and "PSI"),
+      "T_warm" and "PSI" (pd.DataFrame of the derivatives, indexed by time, with one
+      column per parameter).
+
+    Raises:
+    - ValueError: If a parameter is unknown or no phases have been added.
+    """
+    import pandas as pd
+
+    unknown_parameters = set(parameters) - set(SENSITIVITY_PARAMETERS)
+    if unknown_parameters:
+        raise ValueError(f"Unknown parameters: {sorted(unknown_parameters)}")
+    phases = list(model.phases if phases is None else phases)
+    if not phases:
+        raise ValueError("At least one phase must be added before simulation.")
+
+    thermal_parameters = [name for name in parameters if name in THERMAL_PARAMETERS]
+
+    # Initialize variables for simulation
+    T = np.ones(model.n) * model.initial_temperature
+    S = np.zeros((len(thermal_parameters), model.n))  # dT / d(parameter)
+    time_step = model.dt / model.capacity
+    current_time = 0
+    time_history = [current_time]
+    T_history = [T.copy()]
+    S_history = [S.copy()]
+
+    steps = model._compile_phases(phases, q_spectrum)
+    profiles = steps["profiles"]
+    for T_core, T_db, T_r, q_step, profile_step in zip(
+        steps["T_core"].tolist(),
+        steps["t_db"].tolist(),
+        steps["t_r"].tolist(),
+        steps["q_irradiance"].tolist(),
+        steps["profile"].tolist(),
+    ):
+        q_irradiance_nodes = profiles[profile_step] * q_step
+        q_total_flux = model._calculate_heat_flux(
+            T, q_irradiance_nodes, T_db, T_r, T_core
+        )
+
+        # Jacobian of the heat flux times the sensitivities: the linear terms, then
+        # the linearized radiation at the surface
+        dq_total_flux = calculate_heat_flux(
+            S,
+            np.zeros_like(S),
+            0,
+            0,
+            0,
+            model.r_skin2skin,
+            model.r_skin2core,
+            model.r_skin2amb_convection,
+            0,
+        )
+        dq_total_flux[:, -1] -= (
+            4 * model.sigma * model.absorption_lw * (T[-1] + 273.15) ** 3 * S[:, -1]
+        )
+        for i, name in enumerate(thermal_parameters):
+            dq_total_flux[i] += _parameter_forcing(
+                model, name, T, q_total_flux, T_db, T_r, T_core
+            )
+
+        S += dq_total_flux * time_step
+        T += q_total_flux * time_step
+        current_time += model.dt
+
+        # Record data at regular intervals
+        if current_time % 1.0 < model.dt:
+            time_history.append(int(current_time))
+            T_history.append(T.copy())
+            S_history.append(S.copy())
+
+    T_history = np.array(T_history)  # (records, n)
+    S_history = np.array(S_history)  # (records, parameters, n)
+
+    weights = calculate_receptor_weights(
+        model.node_coordinates, model.length, model.receptor_depth
+    )
+    T_warm = T_history @ weights
+    response = calculate_receptor_response(
+        T_warm,
+        model.dt,
+        model.coef_static_warm_receptor,
+        model.coef_dynamic_warm_receptor,
+        model.T_no_static_discharge,
+        model.time_to_integrate,
+    )
+
+    # dT_warm / d(parameter) of each parameter, shape (parameters, records)
+    dT_warm = {
+        name: S_history[:, i] @ weights for i, name in enumerate(thermal_parameters)
+    }
+    if "receptor_depth" in parameters:
+        dT_warm["receptor_depth"] = T_history @ _receptor_depth_weights(
+            model.node_coordinates, model.length, model.receptor_depth
+        )
+
+    # dR / d(parameter), from R = static * max(0, T_warm - T_0) + dynamic * ΔT_warm
+    active = (T_warm > model.T_no_static_discharge).astype(float)
+    nan_column = np.full(1, np.nan)
+    dR = {
+        name: model.coef_static_warm_receptor * active * value
+        + model.coef_dynamic_warm_receptor * np.diff(value, prepend=nan_column)
+        for name, value in dT_warm.items()
+    }
+    receptor_derivatives = {
+        "coef_static_warm_receptor": np.maximum(
+            0, T_warm - model.T_no_static_discharge
+        ),
+        "coef_dynamic_warm_receptor": np.diff(T_warm, prepend=nan_column),
+        "T_no_static_discharge": -model.coef_static_warm_receptor * active,
+    }
+    for name, value in receptor_derivatives.items():
+        if name in parameters:
+            dT_warm[name] = np.zeros(len(T_warm))
+            dR[name] = value
+
+    window = int(model.time_to_integrate / model.dt)
+    index = pd.Index(time_history, name="Current_Time")
+    return {
+        "results": pd.DataFrame(
+            {
+                "Current_Time": time_history,
+                "T_warm": T_warm,
+                "R": response["R"],
+                "PSI": response["PSI"],
+            }
+        ),
+        "T_warm": pd.DataFrame(
+            {name: dT_warm[name] for name in parameters}, index=index
+        ),
+        "PSI": pd.DataFrame(
+            {name: _window_difference(dR[name], window) for name in parameters},
+            index=index,
+        ),
+    }
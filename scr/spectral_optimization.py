@@ -0,0 +1,261 @@
+import numpy as np
+from action_spectrum import ActionSpectrumEstimator
+from spectrum_synthesis import normalize_spectra, planck_spectra
+
+# Objectives of the optimization (all maximized)
+OBJECTIVES = ["psi_per_emitted", "psi_per_absorbed", "surface_temperature"]
+
+
+class BlackbodySpectrum:
+    """
+    Spectra of blackbody emitters, parameterized by the emitter temperature.
+    """
+
+    def __init__(self, wavelengths, temperature=(500, 3000)):
+        """
+        Parameters:
+        - wavelengths (numpy.ndarray): Wavelength grid of the model [nm].
+        - temperature (tuple): Bounds of the emitter temperature [K].
+        """
+        self.wavelengths = wavelengths
+        self.names = ["temperature"]
+        self.bounds = np.array([temperature], dtype=float)
+
+    def spectra(self, parameters):
+        """
+        Parameters:
+        - parameters (numpy.ndarray): Candidates of shape (candidates, 1).
+
+        Returns:
+        - numpy.ndarray: Spectra of 1 W/m², shape (candidates, wavelengths).
+        """
+        return normalize_spectra(planck_spectra(parameters[:, 0], self.wavelengths))
+
+
+class BandPassSpectrum:
+    """
+    Spectra of a source behind an ideal band-pass filter, parameterized by its edges.
+
+    Without a source, the source is a blackbody whose temperature is optimized too.
+    """
+
+    def __init__(
+        self,
+        wavelengths,
+        source=None,
+        lower_edge=(300, 20000),
+        upper_edge=(300, 20000),
+        temperature=(500, 3000),
+    ):
+        """
+        Parameters:
+        - wavelengths (numpy.ndarray): Wavelength grid of the model [nm].
+        - source (numpy.ndarray): Source spectrum on the wavelength grid. A blackbody if
+          None.
+        - lower_edge (tuple): Bounds of the lower edge of the pass band [nm].
+        - upper_edge (tuple): Bounds of the upper edge of the pass band [nm].
+        - temperature (tuple): Bounds of the blackbody temperature [K], without source.
+        """
+        self.wavelengths = wavelengths
+        self.source = source
+        self.names = ["lower_edge", "upper_edge"]
+        bounds = [lower_edge, upper_edge]
+        if source is None:
+            self.names.append("temperature")
+            bounds.append(temperature)
+        self.bounds = np.array(bounds, dtype=float)
+
+    def spectra(self, parameters):
+        """
+        Parameters:
+        - parameters (numpy.ndarray): Candidates of shape (candidates, parameters).
+
+        Returns:
+        - numpy.ndarray: Spectra of 1 W/m², shape (candidates, wavelengths). Candidates
+          with an empty pass band are zero.
+        """
+        if self.source is None:
+            source = planck_spectra(parameters[:, 2], self.wavelengths)
+        else:
+            source = self.source[np.newaxis]
+        transmission = (self.wavelengths >= parameters[:, :1]) & (
+            self.wavelengths <= parameters[:, 1:2]
+        )
+        return normalize_spectra(source * transmission)
+
+
+class MixtureSpectrum:
+    """
+    Mixtures of measured source spectra, parameterized by their shares of irradiance.
+    """
+
+    def __init__(self, sources):
+        """
+        Parameters:
+        - sources (numpy.ndarray): Source spectra on the wavelength grid, shape
+          (sources, wavelengths). Each source is normalized to 1 W/m².
+        """
+        self.sources = normalize_spectra(np.asarray(sources, dtype=float))
+        self.names = [f"share_{i}" for i in range(len(self.sources))]
+        self.bounds = np.tile([0.0, 1.0], (len(self.sources), 1))
+
+    def spectra(self, parameters):
+        """
+        Parameters:
+        - parameters (numpy.ndarray): Unnormalized shares of shape
+          (candidates, sources).
+
+        Returns:
+        - numpy.ndarray: Spectra of 1 W/m², shape (candidates, wavelengths).
+        """
+        return normalize_spectra(parameters @ self.sources)
+
+
+def score_spectra(
+    estimator,
+    spectra,
+    t_db,
+    t_r,
+    T_core=None,
+    hc=None,
+    objective="psi_per_emitted",
+    target_psi=None,
+):
+    """
+    Score many spectra with the linear action-spectrum estimate.
+
+    Parameters:
+    - estimator (ActionSpectrumEstimator): Estimator of the node responses.
+    - spectra (numpy.ndarray): Spectra on the wavelength grid, shape
+      (candidates, wavelengths).
+    - t_db, t_r, T_core, hc: Environmental conditions (see ActionSpectrumEstimator).
+    - objective (str): "psi_per_emitted" (PSI increase per W/m² of irradiance),
+      "psi_per_absorbed" (per W/m² absorbed by the skin), or "surface_temperature"
+      (minus the largest surface temperature rise at target_psi).
+    - target_psi (float): PSI to reach for the "surface_temperature" objective (Hz).
+
+    Returns:
+    - numpy.ndarray: Score of each spectrum (higher is better).
+
+    Raises:
+    - ValueError: If the objective is unknown or target_psi is missing.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}.")
+    responses = estimator.node_responses(t_db, t_r, T_core, hc)
+    kernel = estimator.template.spectral_tables.attenuation_kernel
+    absorbed_profiles = spectra @ kernel.T
+    psi_gain = absorbed_profiles @ responses["dPSI"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if objective == "psi_per_emitted":
+            score = psi_gain / spectra.sum(axis=1)
+        elif objective == "psi_per_absorbed":
+            score = psi_gain / absorbed_profiles.sum(axis=1)
+        else:
+            if target_psi is None:
+                raise ValueError("target_psi is required for this objective.")
+            q_irradiance = (target_psi - responses["PSI"]) / psi_gain
+            surface_rise = (absorbed_profiles @ responses["dT_surface"]).max(axis=1)
+            score = np.where(q_irradiance > 0, -q_irradiance * surface_rise, -np.inf)
+    return np.where(np.isfinite(score), score, -np.inf)
+
+
+def optimize_spectrum(
+    parameterization,
+    t_db,
+    t_r,
+    T_core=None,
+    hc=None,
+    objective="psi_per_emitted",
+    target_psi=None,
+    samples=4096,
+    rounds=6,
+    elite=0.02,
+    seed=0,
+    estimator=None,
+):
+    """
+    Search the parameters of a spectrum that maximize an objective.
+
+    Each round scores a batch of candidates at once with the linear estimate, then
+    samples the next batch within the box spanned by the best candidates.
+
+    Parameters:
+    - parameterization: BlackbodySpectrum, BandPassSpectrum or MixtureSpectrum.
+    - t_db, t_r, T_core, hc: Environmental conditions (see ActionSpectrumEstimator).
+    - objective (str): Objective to maximize (see score_spectra).
+    - target_psi (float): PSI to reach for the "surface_temperature" objective (Hz).
+    - samples (int): Number of candidates per round.
+    - rounds (int): Number of rounds.
+    - elite (float): Fraction of the best candidates defining the next box.
+    - seed (int): Seed of the random number generator.
+    - estimator (ActionSpectrumEstimator): Estimator of the node responses. A new one
+      if None.
+
+    Returns:
+    - dict: "parameters" (best parameters by name), "score", "spectrum" (1 W/m²),
+      "linear_psi" (PSI increase per W/m² of irradiance from the linear estimate) and
+      "psi" (the same, checked with ActionSpectrumEstimator.predict at the irradiance
+      reaching target_psi, or at 100 W/m²).
+    """
+    if estimator is None:
+        estimator = ActionSpectrumEstimator()
+    rng = np.random.default_rng(seed)
+    lower, upper = parameterization.bounds[:, 0], parameterization.bounds[:, 1]
+    box = parameterization.bounds.copy()
+
+    best_parameters = None
+    best_score = -np.inf
+    for _ in range(rounds):
+        candidates = box[:, 0] + rng.random((samples, len(box))) * (
+            box[:, 1] - box[:, 0]
+        )
+        scores = score_spectra(
+            estimator,
+            parameterization.spectra(candidates),
+            t_db,
+            t_r,
+            T_core,
+            hc,
+            objective,
+            target_psi,
+        )
+        order = np.argsort(scores)[::-1]
+        if scores[order[0]] > best_score:
+            best_score = scores[order[0]]
+            best_parameters = candidates[order[0]]
+
+        # Shrink the box around the best candidates
+        top = candidates[order[: max(2, int(elite * samples))]]
+        spread = top.max(axis=0) - top.min(axis=0)
+        box = np.column_stack(
+            [
+                np.maximum(top.min(axis=0) - 0.1 * spread, lower),
+                np.minimum(top.max(axis=0) + 0.1 * spread, upper),
+            ]
+        )
+
+    spectrum = parameterization.spectra(best_parameters[np.newaxis])[0]
+
+    # Check the best spectrum with the estimator (full solver if nonlinear)
+    responses = estimator.node_responses(t_db, t_r, T_core, hc)
+    linear_gain = float(
+        spectrum
+        @ estimator.template.spectral_tables.attenuation_kernel.T
+        @ responses["dPSI"]
+    )
+    q_irradiance = 100.0
+    if target_psi is not None and linear_gain > 0:
+        q_irradiance = (target_psi - responses["PSI"]) / linear_gain
+    checked = estimator.predict(
+        spectrum[np.newaxis], t_db, t_r, q_irradiance, T_core, hc
+    )
+
+    return {
+        "parameters": dict(zip(parameterization.names, best_parameters.tolist())),
+        "score": float(best_score),
+        "spectrum": spectrum,
+        "linear_psi": linear_gain,
+        "psi": float((checked["PSI"][0] - responses["PSI"]) / q_irradiance),
+    }
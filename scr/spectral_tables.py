@@ -0,0 +1,553 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+import configration as config
+
+# Define constants
+SKIN_PROPERTIES_PATH = os.path.join(
+    config.DATA_DIRECTORY, "skin-spectral-properties.csv"
+)
+DEFAULT_WAVELENGTHS = np.arange(300, 50001, 10)  # wavelengths from 300nm to 50000nm
+TABLE_NAMES = [
+    "wavelengths",
+    "reflectance",
+    "transmittance",
+    "absorption_coefficient",
+    "scattering_coefficient",
+    "node_coordinates",
+    "attenuation_kernel",
+]
+# Radiative transfer models of the attenuation kernel
+RADIATIVE_TRANSFER_MODELS = ["beer_lambert", "two_flux"]
+
+# Tables attached by a pool worker (see initialize_worker)
+_worker_tables = None
+
+
+class SpectralTables:
+    """
+    Read-only spectral tables used by ReceptorModel.
+
+    The tables hold the skin optical properties aligned with the wavelength grid and
+    the attenuation kernel, i.e. the fraction of the irradiance at each wavelength
+    that is absorbed by each skin node. The absorbed irradiance profile of a spectrum
+    is then a single matrix product with the kernel.
+    """
+
+    def __init__(
+        self,
+        wavelengths,
+        reflectance,
+        transmittance,
+        absorption_coefficient,
+        scattering_coefficient,
+        node_coordinates,
+        attenuation_kernel,
+        radiative_transfer="beer_lambert",
+    ):
+        self.wavelengths = wavelengths  # [nm]
+        self.reflectance = reflectance  # [-]
+        self.transmittance = transmittance  # [-]
+        self.absorption_coefficient = absorption_coefficient  # [1/mm]
+        self.scattering_coefficient = scattering_coefficient  # [1/mm]
+        self.node_coordinates = node_coordinates  # depth from the surface [m]
+        self.attenuation_kernel = (
+            attenuation_kernel  # (n, wavelengths), core side first
+        )
+        self.radiative_transfer = radiative_transfer  # model of the attenuation kernel
+
+        # Shared memory blocks backing the arrays (kept alive with the views)
+        self._shared_memory_blocks = []
+
+    def matches_grid(
+        self, wavelengths, node_coordinates, radiative_transfer="beer_lambert"
+    ):
+        """
+        Check whether the tables were built for the given wavelength and node grid.
+
+        Parameters:
+        - wavelengths (numpy.ndarray): Wavelength grid of the model [nm].
+        - node_coordinates (numpy.ndarray): Node coordinates of the model [m].
+        - radiative_transfer (str): Radiative transfer model of the model.
+
+        Returns:
+        - bool: True if the tables can be used as they are.
+        """
+        return (
+            self.radiative_transfer == radiative_transfer
+            and len(wavelengths) == len(self.wavelengths)
+            and len(node_coordinates) == len(self.node_coordinates)
+            and np.array_equal(wavelengths, self.wavelengths)
+            and np.allclose(node_coordinates, self.node_coordinates)
+        )
+
+
+def load_skin_properties(path=SKIN_PROPERTIES_PATH):
+    """
+    Load the spectral properties of the skin.
+
+    The file is read with NumPy only, so building the tables does not import pandas.
+
+    Parameters:
+    - path (str): Path to the CSV file of the skin spectral properties.
+
+    Returns:
+    - dict: Arrays of the CSV columns (e.g. "wavelength_nm", "reflectance_nd"); empty
+      cells are NaN.
+    """
+    with open(path, encoding="utf-8-sig") as file:
+        names = file.readline().strip().split(",")
+        values = np.genfromtxt(file, delimiter=",", ndmin=2)
+    return {name: values[:, i] for i, name in enumerate(names)}
+
+
+def _reindex(source_wavelengths, source_values, wavelengths):
+    """
+    Align values with a wavelength grid, filling missing wavelengths with zero.
+
+    Parameters:
+    - source_wavelengths (numpy.ndarray): Sorted wavelengths of the values [nm].
+    - source_values (numpy.ndarray): Values to align.
+    - wavelengths (numpy.ndarray): Wavelength grid [nm].
+
+    Returns:
+    - numpy.ndarray: Values on the wavelength grid.
+    """
+    source_wavelengths = np.asarray(source_wavelengths, dtype=float)
+    position = np.searchsorted(source_wavelengths, wavelengths)
+    position = np.minimum(position, len(source_wavelengths) - 1)
+    found = source_wavelengths[position] == wavelengths
+
+    values = np.zeros(len(wavelengths))
+    values[found] = np.asarray(source_values, dtype=float)[position[found]]
+    return values
+
+
+def calculate_attenuation_kernel(
+    node_coordinates, dx, reflectance, absorption_coefficient, scattering_coefficient
+):
+    """
+    Calculate the fraction of irradiance absorbed by each skin node per wavelength.
+
+    Scattering is treated as extinction in a Beer-Lambert law, as in
+    ReceptorModel._calculate_radiation_distribution.
+
+    Parameters:
+    - node_coordinates (numpy.ndarray): Depth of each node from the surface [m].
+    - dx (float): Thickness of each skin layer [m].
+    - reflectance (numpy.ndarray): Spectral reflectance of the skin [-].
+    - absorption_coefficient (numpy.ndarray): Spectral absorption coefficient [1/mm].
+    - scattering_coefficient (numpy.ndarray): Spectral scattering coefficient [1/mm].
+      The properties may have leading batch axes, e.g. (samples, wavelengths).
+
+    Returns:
+    - numpy.ndarray: Kernel of shape (..., n, wavelengths), ordered from the core side.
+    """
+    extinction = np.asarray(absorption_coefficient + scattering_coefficient)[
+        ..., np.newaxis, :
+    ]  # [1/mm]
+    transmitted = 1 - np.asarray(reflectance)[..., np.newaxis, :]
+    depth = np.asarray(node_coordinates)[:, np.newaxis]
+    kernel = transmitted * (
+        np.exp(-extinction * (depth - dx / 2) * 1e3)
+        - np.exp(-extinction * (depth + dx / 2) * 1e3)
+    )
+    kernel[np.isnan(kernel)] = 0
+
+    # Reverse the rows to align with the core side
+    return np.ascontiguousarray(kernel[..., ::-1, :])
+
+
+def calculate_two_flux_kernel(
+    node_coordinates, dx, reflectance, absorption_coefficient, scattering_coefficient
+):
+    """
+    Calculate the fraction of irradiance absorbed by each skin node per wavelength
+    with the two-flux (Kubelka-Munk) model.
+
+    The diffuse downward and upward fluxes I and J obey
+        dI/dz = -(K + S) I + S J,    dJ/dz = (K + S) J - S I,
+    with K the absorption and S the scattering coefficient, so scattered light is sent
+    back towards the surface instead of being deposited as in the Beer-Lambert kernel.
+    The skin layer is homogeneous, with the irradiance not reflected at the surface
+    entering at the top and no flux entering from below, which gives closed-form
+    fluxes for all wavelengths at once. Each node absorbs the net flux entering its
+    layer minus the net flux leaving it.
+
+    Parameters:
+    - node_coordinates (numpy.ndarray): Depth of each node from the surface [m].
+    - dx (float): Thickness of each skin layer [m].
+    - reflectance (numpy.ndarray): Spectral reflectance of the skin [-].
+    - absorption_coefficient (numpy.ndarray): Spectral absorption coefficient [1/mm].
+    - scattering_coefficient (numpy.ndarray): Spectral scattering coefficient [1/mm].
+      The properties may have leading batch axes, e.g. (samples, wavelengths).
+
+    Returns:
+    - numpy.ndarray: Kernel of shape (..., n, wavelengths), ordered from the core side.
+    """
+    # Coefficients [1/m]
+    K = np.asarray(absorption_coefficient, dtype=float)[..., np.newaxis, :] * 1e3
+    S = np.asarray(scattering_coefficient, dtype=float)[..., np.newaxis, :] * 1e3
+    transmitted = 1 - np.asarray(reflectance)[..., np.newaxis, :]
+    node_coordinates = np.asarray(node_coordinates, dtype=float)
+    thickness = node_coordinates[-1] + dx / 2
+    boundaries = np.append(node_coordinates - dx / 2, thickness)[:, np.newaxis]
+
+    with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+        alpha = np.sqrt(K * (K + 2 * S))
+        # Ratio of the upward to the downward flux of the decaying solution
+        beta = S / (K + S + alpha)
+        decay = np.exp(-alpha * thickness)
+
+        # I = A (e^(-αz) + C β e^(-α(L-z))), J = A (β e^(-αz) + C e^(-α(L-z))),
+        # with I(0) = 1 - R and J(L) = 0
+        C = -beta * decay
+        A = transmitted / (1 - beta**2 * decay**2)
+        net_flux = (
+            A
+            * (1 - beta)
+            * (
+                np.exp(-alpha * boundaries)
+                - C * np.exp(-alpha * (thickness - boundaries))
+            )
+        )
+        kernel = net_flux[..., :-1, :] - net_flux[..., 1:, :]
+    kernel[~np.isfinite(kernel)] = 0
+
+    # Reverse the rows to align with the core side
+    return np.ascontiguousarray(kernel[..., ::-1, :])
+
+
+# Kernel function of each radiative transfer model
+RADIATIVE_TRANSFER_KERNELS = {
+    "beer_lambert": calculate_attenuation_kernel,
+    "two_flux": calculate_two_flux_kernel,
+}
+
+
+@lru_cache(maxsize=32)
+def _get_cached_kernel(radiative_transfer, node_coordinates, dx, properties):
+    """
+    Calculate a kernel from hashable arguments (see get_attenuation_kernel).
+    """
+    kernel = RADIATIVE_TRANSFER_KERNELS[radiative_transfer](
+        np.frombuffer(node_coordinates),
+        dx,
+        *[np.frombuffer(values) for values in properties],
+    )
+    kernel.flags.writeable = False
+    return kernel
+
+
+def get_attenuation_kernel(
+    node_coordinates,
+    dx,
+    reflectance,
+    absorption_coefficient,
+    scattering_coefficient,
+    radiative_transfer="beer_lambert",
+):
+    """
+    Get the attenuation kernel of a radiative transfer model, cached by the optical
+    properties and the node grid.
+
+    Parameters:
+    - node_coordinates, dx, reflectance, absorption_coefficient, scattering_coefficient:
+      Node grid and spectral properties (see calculate_attenuation_kernel), without
+      batch axes.
+    - radiative_transfer (str): Radiative transfer model (see
+      RADIATIVE_TRANSFER_MODELS).
+
+    Returns:
+    - numpy.ndarray: Read-only kernel of shape (n, wavelengths), core side first.
+
+    Raises:
+    - ValueError: If the radiative transfer model is unknown.
+    """
+    if radiative_transfer not in RADIATIVE_TRANSFER_MODELS:
+        raise ValueError(
+            f"radiative_transfer must be one of {RADIATIVE_TRANSFER_MODELS}."
+        )
+    properties = tuple(
+        np.ascontiguousarray(values, dtype=float).tobytes()
+        for values in (reflectance, absorption_coefficient, scattering_coefficient)
+    )
+    return _get_cached_kernel(
+        radiative_transfer,
+        np.ascontiguousarray(node_coordinates, dtype=float).tobytes(),
+        float(dx),
+        properties,
+    )
+
+
+def calculate_absorbed_profiles(attenuation_kernel, spectra, chunk_size=4096):
+    """
+    Calculate the absorbed irradiance profiles of many spectra in batched products.
+
+    The spectra are processed in chunks of frames, so memory-mapped arrays are read
+    sequentially and never loaded as a whole.
+
+    Parameters:
+    - attenuation_kernel (numpy.ndarray): Kernel of shape (n, wavelengths).
+    - spectra (numpy.ndarray): Spectral irradiance of shape (frames, wavelengths)
+      [W/m²]. Missing values (NaN) are treated as zero.
+    - chunk_size (int): Number of frames per matrix product.
+
+    Returns:
+    - numpy.ndarray: Absorbed irradiance of shape (frames, n) [W/m²], core side first.
+    """
+    profiles = np.empty((len(spectra), attenuation_kernel.shape[0]))
+    for start in range(0, len(spectra), chunk_size):
+        chunk = np.nan_to_num(
+            np.asarray(spectra[start : start + chunk_size], dtype=float)
+        )
+        profiles[start : start + chunk_size] = chunk @ attenuation_kernel.T
+    return profiles
+
+
+def build_spectral_tables(
+    wavelengths,
+    node_coordinates,
+    dx,
+    properties=None,
+    radiative_transfer="beer_lambert",
+):
+    """
+    Build spectral tables for a wavelength grid and a node grid.
+
+    Parameters:
+    - wavelengths (numpy.ndarray): Wavelength grid [nm].
+    - node_coordinates (numpy.ndarray): Depth of each node from the surface [m].
+    - dx (float): Thickness of each skin layer [m].
+    - properties (dict or DataFrame): Spectral properties of the skin with the columns
+      of skin-spectral-properties.csv. Loaded from file if None.
+    - radiative_transfer (str): Radiative transfer model of the attenuation kernel
+      (see RADIATIVE_TRANSFER_MODELS).
+
+    Returns:
+    - SpectralTables: Tables aligned with the given grids.
+    """
+    if properties is None:
+        properties = load_skin_properties()
+
+    # Ensure the spectral properties align with the wavelengths
+    columns = {
+        "reflectance": "reflectance_nd",
+        "transmittance": "transmittance_nd",
+        "absorption_coefficient": "absorption_coefficient_1/mm",
+        "scattering_coefficient": "scattering_coefficient_1/mm",
+    }
+    aligned = {
+        name: _reindex(properties["wavelength_nm"], properties[column], wavelengths)
+        for name, column in columns.items()
+    }
+
+    kernel = get_attenuation_kernel(
+        node_coordinates,
+        dx,
+        aligned["reflectance"],
+        aligned["absorption_coefficient"],
+        aligned["scattering_coefficient"],
+        radiative_transfer,
+    )
+    return SpectralTables(
+        wavelengths=np.asarray(wavelengths),
+        node_coordinates=np.asarray(node_coordinates, dtype=float),
+        attenuation_kernel=kernel,
+        radiative_transfer=radiative_transfer,
+        **aligned,
+    )
+
+
+def get_tables_for_grid(tables, node_coordinates, dx, radiative_transfer=None):
+    """
+    Get tables with the optical properties of other tables for a node grid.
+
+    Parameters:
+    - tables (SpectralTables): Tables providing the wavelength grid and the skin
+      optical properties.
+    - node_coordinates (numpy.ndarray): Depth of each node from the surface [m].
+    - dx (float): Thickness of each skin layer [m].
+    - radiative_transfer (str): Radiative transfer model of the attenuation kernel.
+      The model of the tables if None.
+
+    Returns:
+    - SpectralTables: The tables themselves if they match the node grid and the
+      radiative transfer model, else new tables with a kernel for them (cached by
+      get_attenuation_kernel).
+    """
+    if radiative_transfer is None:
+        radiative_transfer = tables.radiative_transfer
+    if tables.matches_grid(tables.wavelengths, node_coordinates, radiative_transfer):
+        return tables
+    kernel = get_attenuation_kernel(
+        node_coordinates,
+        dx,
+        tables.reflectance,
+        tables.absorption_coefficient,
+        tables.scattering_coefficient,
+        radiative_transfer,
+    )
+    return SpectralTables(
+        wavelengths=tables.wavelengths,
+        reflectance=tables.reflectance,
+        transmittance=tables.transmittance,
+        absorption_coefficient=tables.absorption_coefficient,
+        scattering_coefficient=tables.scattering_coefficient,
+        node_coordinates=np.asarray(node_coordinates, dtype=float),
+        attenuation_kernel=kernel,
+        radiative_transfer=radiative_transfer,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_default_tables(length, n, radiative_transfer="beer_lambert"):
+    """
+    Get the spectral tables of the default wavelength grid, built once per process.
+
+    Parameters:
+    - length (float): Thickness of the skin layer [m].
+    - n (int): Number of discretized skin layers.
+    - radiative_transfer (str): Radiative transfer model of the attenuation kernel.
+
+    Returns:
+    - SpectralTables: Tables for the default wavelength grid.
+    """
+    dx = length / n
+    node_coordinates = np.linspace(dx / 2, length - dx / 2, n)
+    return build_spectral_tables(
+        DEFAULT_WAVELENGTHS,
+        node_coordinates,
+        dx,
+        radiative_transfer=radiative_transfer,
+    )
+
+
+class SharedSpectralTables:
+    """
+    Spectral tables published once into shared memory.
+
+    The owner process creates the blocks and passes the picklable `handle` to the
+    workers, which attach to the blocks without copying the arrays
+    (see attach_spectral_tables and initialize_worker).
+
+    Usage:
+        with SharedSpectralTables(tables) as shared:
+            with create_worker_pool(shared, processes=4) as pool:
+                results = pool.map(run_simulation, conditions)
+    """
+
+    def __init__(self, tables):
+        from multiprocessing import shared_memory
+
+        self.handle = {}
+        self._shared_memory_blocks = []
+        for name in TABLE_NAMES:
+            array = np.ascontiguousarray(getattr(tables, name))
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared_array[...] = array
+            self._shared_memory_blocks.append(block)
+            self.handle[name] = (block.name, array.shape, array.dtype.str)
+        self.handle["radiative_transfer"] = tables.radiative_transfer
+
+    def close(self):
+        """
+        Close the shared memory blocks and release them from the system.
+        """
+        for block in self._shared_memory_blocks:
+            block.close()
+            block.unlink()
+        self._shared_memory_blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _attach_shared_memory(name):
+    """
+    Attach to an existing shared memory block without taking over its lifetime.
+    """
+    from multiprocessing import shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        return shared_memory.SharedMemory(name=name)
+
+
+def attach_spectral_tables(handle):
+    """
+    Attach to spectral tables published by SharedSpectralTables.
+
+    The arrays are read-only views on the shared memory blocks; nothing is copied.
+
+    Parameters:
+    - handle (dict): The `handle` of a SharedSpectralTables instance.
+
+    Returns:
+    - SpectralTables: Tables backed by the shared memory blocks.
+    """
+    arrays = {}
+    blocks = []
+    for name in TABLE_NAMES:
+        block_name, shape, dtype = handle[name]
+        block = _attach_shared_memory(block_name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[name] = array
+        blocks.append(block)
+
+    tables = SpectralTables(
+        **arrays, radiative_transfer=handle.get("radiative_transfer", "beer_lambert")
+    )
+    tables._shared_memory_blocks = blocks
+    return tables
+
+
+def initialize_worker(handle):
+    """
+    Pool initializer attaching the worker process to the shared spectral tables.
+
+    ReceptorModel instances created in the worker use the attached tables.
+
+    Parameters:
+    - handle (dict): The `handle` of a SharedSpectralTables instance.
+    """
+    global _worker_tables
+    _worker_tables = attach_spectral_tables(handle)
+
+
+def get_worker_tables():
+    """
+    Get the spectral tables attached by initialize_worker.
+
+    Returns:
+    - SpectralTables or None: Attached tables, or None outside of a pool worker.
+    """
+    return _worker_tables
+
+
+def create_worker_pool(shared_tables, processes=None):
+    """
+    Create a process pool whose workers attach to the shared spectral tables.
+
+    Parameters:
+    - shared_tables (SharedSpectralTables): Tables published in shared memory.
+    - processes (int): Number of worker processes. Uses all CPUs if None.
+
+    Returns:
+    - multiprocessing.pool.Pool: The worker pool.
+    """
+    from multiprocessing import Pool
+
+    return Pool(
+        processes=processes,
+        initializer=initialize_worker,
+        initargs=(shared_tables.handle,),
+    )
@@ -0,0 +1,207 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+import configration as config
+from model import _is_pandas_object
+from spectral_tables import DEFAULT_WAVELENGTHS
+
+# Define constants
+FILTER_SPECTRUM_PATH = os.path.join(
+    config.DATA_DIRECTORY, "Nomoto_2021_filter_and_radiation_spectrum.xlsx"
+)
+FILTER_SPECTRUM_SHEET = "Spectral properties"
+FILTER_SPECTRUM_COLUMNS = [
+    "wavelength",
+    "Filter A",
+    "Filter B",
+    "Radiation A",
+    "Radiation B",
+    "Radiation C",
+]
+
+PLANCK_CONSTANT = 6.62607015e-34  # [J·s]
+SPEED_OF_LIGHT = 2.99792458e8  # [m/s]
+BOLTZMANN_CONSTANT = 1.380649e-23  # [J/K]
+
+
+def planck_spectra(temperatures, wavelengths=DEFAULT_WAVELENGTHS):
+    """
+    Spectral radiance of blackbodies at many emitter temperatures in one call.
+
+    Parameters:
+    - temperatures (float or numpy.ndarray): Emitter temperatures [K].
+    - wavelengths (numpy.ndarray): Wavelengths [nm].
+
+    Returns:
+    - numpy.ndarray: Spectral radiance of shape (temperatures, wavelengths) [W/m²/sr/m].
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float) * 1e-9
+    temperatures = np.atleast_1d(np.asarray(temperatures, dtype=float))[:, np.newaxis]
+    with np.errstate(over="ignore", divide="ignore"):
+        exponent = (
+            PLANCK_CONSTANT
+            * SPEED_OF_LIGHT
+            / (wavelengths * BOLTZMANN_CONSTANT * temperatures)
+        )
+        return (
+            2
+            * PLANCK_CONSTANT
+            * SPEED_OF_LIGHT**2
+            / wavelengths**5
+            / np.expm1(exponent)
+        )
+
+
+def normalize_spectra(spectra):
+    """
+    Scale spectra to a total irradiance of 1 W/m² over the wavelength grid, as the
+    normalized_radiation_* columns of the experimental conditions.
+
+    Parameters:
+    - spectra (numpy.ndarray): Spectra of shape (..., wavelengths).
+
+    Returns:
+    - numpy.ndarray: Normalized spectra. Spectra without irradiance remain zero.
+    """
+    spectra = np.asarray(spectra, dtype=float)
+    total = spectra.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, spectra / total, 0)
+
+
+def load_filter_transmission(path=FILTER_SPECTRUM_PATH):
+    """
+    Load the transmittance of the filters of Nomoto et al. (2021).
+
+    Parameters:
+    - path (str): Path of the workbook of the filter and radiation spectra.
+
+    Returns:
+    - pd.DataFrame: Transmittance [-] of "Filter A" and "Filter B", indexed by
+      wavelength [nm].
+    """
+    import pandas as pd
+
+    df = pd.read_excel(path, sheet_name=FILTER_SPECTRUM_SHEET)
+    df.columns = FILTER_SPECTRUM_COLUMNS
+    df = df.set_index("wavelength")
+    return df[["Filter A", "Filter B"]] * 1e-2  # Convert percentage to fraction
+
+
+def align_transmission(transmission, wavelengths=DEFAULT_WAVELENGTHS):
+    """
+    Align transmission curves with a wavelength grid.
+
+    Parameters:
+    - transmission (numpy.ndarray, pd.Series or pd.DataFrame): Transmittance [-] on the
+      wavelength grid, of shape (wavelengths,) or (curves, wavelengths), or a Series
+      (or a DataFrame with one curve per column) indexed by wavelength [nm].
+      Series are interpolated linearly, and zero outside the measured wavelengths.
+
+    Returns:
+    - numpy.ndarray: Transmittance of shape (wavelengths,) or (curves, wavelengths),
+      with missing values as zero.
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    if _is_pandas_object(transmission, "DataFrame"):
+        return np.array(
+            [
+                align_transmission(transmission[name], wavelengths)
+                for name in transmission
+            ]
+        )
+    if _is_pandas_object(transmission, "Series"):
+        curve = transmission.dropna().sort_index()
+        return np.interp(
+            wavelengths,
+            curve.index.to_numpy(dtype=float),
+            curve.to_numpy(dtype=float),
+            left=0,
+            right=0,
+        )
+    transmission = np.array(transmission, dtype=float)
+    transmission[np.isnan(transmission)] = 0
+    return transmission
+
+
+@lru_cache(maxsize=32)
+def _synthesize(temperatures, wavelengths, transmission, normalize):
+    """
+    Synthesize spectra from hashable arguments (see synthesize_spectra).
+    """
+    wavelengths = np.frombuffer(wavelengths)
+    spectra = planck_spectra(np.frombuffer(temperatures), wavelengths)
+    if transmission is not None:
+        shape, values = transmission
+        spectra = spectra * np.frombuffer(values).reshape(shape)
+    if normalize:
+        spectra = normalize_spectra(spectra)
+    spectra.flags.writeable = False
+    return spectra
+
+
+def synthesize_spectra(
+    temperatures, transmission=None, wavelengths=DEFAULT_WAVELENGTHS, normalize=True
+):
+    """
+    Synthesize the spectra of blackbody emitters, optionally behind filters.
+
+    The results are memoized by temperatures, transmission and wavelength grid, so
+    repeated sweeps reuse the same read-only arrays.
+
+    Usage:
+        filter_a = load_filter_transmission()["Filter A"]
+        spectra = synthesize_spectra([1000, 1500, 2000], filter_a)
+        model = BatchedReceptorModel(range(len(spectra)))
+        model.set_spectrum(spectra)
+
+    Parameters:
+    - temperatures (float or numpy.ndarray): Emitter temperatures [K].
+    - transmission (numpy.ndarray, pd.Series or pd.DataFrame): Transmittance of a filter
+      for all emitters, or one per emitter (see align_transmission). No filter if None.
+    - wavelengths (numpy.ndarray): Wavelength grid of the model [nm].
+    - normalize (bool): If True, scale each spectrum to 1 W/m² (see normalize_spectra);
+      otherwise return the spectral radiance [W/m²/sr/m].
+
+    Returns:
+    - numpy.ndarray: Read-only spectra of shape (temperatures, wavelengths).
+
+    Raises:
+    - ValueError: If the transmission does not match the temperatures or wavelengths.
+    """
+    temperatures = np.atleast_1d(np.asarray(temperatures, dtype=float)).ravel()
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    key = None
+    if transmission is not None:
+        transmission = align_transmission(transmission, wavelengths)
+        if transmission.shape[-1] != len(wavelengths) or (
+            transmission.ndim == 2 and len(transmission) not in (1, len(temperatures))
+        ):
+            raise ValueError(
+                "transmission must have one curve, or one curve per temperature, "
+                "on the wavelength grid."
+            )
+        key = (transmission.shape, transmission.tobytes())
+    return _synthesize(temperatures.tobytes(), wavelengths.tobytes(), key, normalize)
+
+
+def synthesize_spectra_for(model, temperatures, transmission=None):
+    """
+    Synthesize normalized emitter spectra on the wavelength grid of a model.
+
+    Parameters:
+    - model (ReceptorModel or BatchedReceptorModel): Model providing the wavelength
+      grid.
+    - temperatures (float or numpy.ndarray): Emitter temperatures [K].
+    - transmission: Transmittance of the filters (see synthesize_spectra).
+
+    Returns:
+    - numpy.ndarray: Spectra of 1 W/m², shape (temperatures, wavelengths), ready for
+      BatchedReceptorModel.set_spectrum.
+    """
+    template = getattr(model, "template", model)
+    return synthesize_spectra(
+        temperatures, transmission, template.spectral_tables.wavelengths
+    )
@@ -0,0 +1,319 @@
+import json
+
+import numpy as np
+from numpy.polynomial import chebyshev
+
+from batched_model import BatchedReceptorModel
+from model import ReceptorModel
+
+# Conditions that can span the parameter box of a surrogate
+SURROGATE_PARAMETERS = ["t_db", "t_r", "hc", "T_core", "q_irradiance"]
+# Conditions passed to BatchedReceptorModel.add_phase (the others are patch parameters)
+PHASE_PARAMETERS = ["t_db", "t_r", "q_irradiance"]
+
+
+def chebyshev_points(degree, lower, upper):
+    """
+    Chebyshev points of the second kind (extrema), mapped to [lower, upper].
+
+    Parameters:
+    - degree (int): Polynomial degree; degree + 1 points are returned.
+    - lower (float): Lower bound.
+    - upper (float): Upper bound.
+
+    Returns:
+    - numpy.ndarray: Points in increasing order.
+    """
+    if degree == 0:
+        return np.array([(lower + upper) / 2])
+    unit = -np.cos(np.pi * np.arange(degree + 1) / degree)
+    return lower + (unit + 1) / 2 * (upper - lower)
+
+
+def simulate_psi(
+    conditions,
+    q_spectrum,
+    warm_up_duration=1000,
+    duration=20,
+    records=21,
+    batch_size=1024,
+    template=None,
+):
+    """
+    Simulate the mean PSI of many conditions with batched runs.
+
+    Each condition is a warm-up without irradiation followed by an irradiation, and
+    PSI is averaged over the last records, as in main.py.
+
+    Parameters:
+    - conditions (dict): Arrays of the same length by name (see SURROGATE_PARAMETERS).
+      Missing conditions are taken from the template (t_db and t_r from T_db and T_r).
+    - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance.
+    - warm_up_duration (int): Duration of the phase without irradiation [s].
+    - duration (int): Duration of the irradiation [s].
+    - records (int): Number of last records averaged.
+    - batch_size (int): Number of conditions integrated at once.
+    - template (ReceptorModel): Model providing the other parameters.
+
+    Returns:
+    - numpy.ndarray: Mean PSI of each condition (Hz).
+    """
+    if template is None:
+        template = ReceptorModel()
+    defaults = {"t_db": template.T_db, "t_r": template.T_r, "q_irradiance": 0}
+    size = len(next(iter(conditions.values())))
+
+    psi = []
+    for start in range(0, size, batch_size):
+        batch = {
+            name: np.broadcast_to(
+                conditions.get(name, defaults.get(name, getattr(template, name, 0))),
+                size,
+            )[start : start + batch_size]
+            for name in SURROGATE_PARAMETERS
+        }
+        model = BatchedReceptorModel(
+            range(len(batch["t_db"])),
+            template=template,
+            **{
+                name: batch[name]
+                for name in SURROGATE_PARAMETERS
+                if name not in PHASE_PARAMETERS
+            },
+        )
+        model.set_spectrum(q_spectrum)
+        model.add_phase(warm_up_duration, batch["t_db"], batch["t_r"], q_irradiance=0)
+        model.add_phase(duration, batch["t_db"], batch["t_r"], batch["q_irradiance"])
+        psi.append(model.simulate()["PSI"][:, -records:].mean(axis=1))
+    return np.concatenate(psi)
+
+
+class ChebyshevSurrogate:
+    """
+    Tensor-product Chebyshev interpolant of the mean PSI over a box of conditions.
+
+    The table is built from batched simulations at the Chebyshev points of the box and
+    stored as Chebyshev coefficients, so a query is a few small tensor contractions.
+    The spectrum, durations and other parameters are fixed when the table is built.
+
+    Usage:
+        surrogate = ChebyshevSurrogate.build(
+            {
+                "t_db": (20, 30),
+                "t_r": (20, 30),
+                "T_core": (34, 37),
+                "q_irradiance": (0, 300),
+            },
+            degrees=4,
+            q_spectrum=spectrum,
+        )
+        surrogate.save("psi_surrogate.npz")
+        psi = surrogate.predict(t_db=25, t_r=25, T_core=[35, 36], q_irradiance=200)
+    """
+
+    def __init__(self, names, bounds, coefficients, error_bound, metadata=None):
+        """
+        Parameters:
+        - names (list): Conditions spanning the box (see SURROGATE_PARAMETERS).
+        - bounds (numpy.ndarray): (lower, upper) bounds of each condition, shape
+          (dims, 2).
+        - coefficients (numpy.ndarray): Chebyshev coefficients, one axis per condition.
+        - error_bound (dict): "estimate" from the trailing coefficients and "validation"
+          (maximum error against full simulations at random points) (Hz).
+        - metadata (dict): Fixed settings of the build (durations, fixed conditions).
+        """
+        self.names = list(names)
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.error_bound = error_bound
+        self.metadata = metadata or {}
+
+    @classmethod
+    def build(
+        cls,
+        bounds,
+        degrees,
+        q_spectrum,
+        warm_up_duration=1000,
+        duration=20,
+        records=21,
+        validation_samples=64,
+        batch_size=1024,
+        seed=0,
+        template=None,
+    ):
+        """
+        Build a surrogate from batched simulations at the Chebyshev points.
+
+        Parameters:
+        - bounds (dict): (lower, upper) bounds by condition (see SURROGATE_PARAMETERS).
+        - degrees (int or dict): Polynomial degree of each condition. The number of
+          simulations is the product of (degree + 1).
+        - q_spectrum (pd.Series or numpy.ndarray): Spectral irradiance.
+        - warm_up_duration (int): Duration of the phase without irradiation [s].
+        - duration (int): Duration of the irradiation [s].
+        - records (int): Number of last records averaged into PSI.
+        - validation_samples (int): Number of random points simulated to validate the
+          interpolant. No validation if 0.
+        - batch_size (int): Number of simulations integrated at once.
+        - seed (int): Seed of the validation points.
+        - template (ReceptorModel): Model providing the other parameters.
+
+        Returns:
+        - ChebyshevSurrogate: The surrogate.
+
+        Raises:
+        - ValueError: If a condition is unknown or its bounds are not increasing.
+        """
+        unknown_parameters = set(bounds) - set(SURROGATE_PARAMETERS)
+        if unknown_parameters:
+            raise ValueError(f"Unknown parameters: {sorted(unknown_parameters)}")
+        names = list(bounds)
+        box = np.array([bounds[name] for name in names], dtype=float)
+        if np.any(box[:, 1] <= box[:, 0]):
+            raise ValueError("Upper bounds must be greater than lower bounds.")
+        if not isinstance(degrees, dict):
+            degrees = {name: degrees for name in names}
+
+        settings = {
+            "q_spectrum": q_spectrum,
+            "warm_up_duration": warm_up_duration,
+            "duration": duration,
+            "records": records,
+            "batch_size": batch_size,
+            "template": template,
+        }
+
+        # Simulate the tensor grid of Chebyshev points
+        axes = [chebyshev_points(degrees[name], *bounds[name]) for name in names]
+        grid = np.meshgrid(*axes, indexing="ij")
+        values = simulate_psi(
+            {name: points.ravel() for name, points in zip(names, grid)}, **settings
+        ).reshape(grid[0].shape)
+
+        # Fit the Chebyshev coefficients axis by axis
+        coefficients = values
+        for axis, name in enumerate(names):
+            unit = cls._to_unit(axes[axis], box[axis])
+            vandermonde = chebyshev.chebvander(unit, degrees[name])
+            coefficients = np.moveaxis(
+                np.tensordot(
+                    np.linalg.inv(vandermonde), coefficients, axes=([1], [axis])
+                ),
+                0,
+                axis,
+            )
+
+        # A posteriori estimate: the size of the highest-degree coefficients
+        estimate = 0.0
+        for axis, name in enumerate(names):
+            if degrees[name] > 0:
+                estimate += float(np.abs(np.take(coefficients, -1, axis=axis)).sum())
+        error_bound = {"estimate": estimate, "validation": None}
+
+        surrogate = cls(
+            names,
+            box,
+            coefficients,
+            error_bound,
+            {
+                "degrees": degrees,
+                "warm_up_duration": warm_up_duration,
+                "duration": duration,
+                "records": records,
+            },
+        )
+
+        if validation_samples:
+            rng = np.random.default_rng(seed)
+            points = {
+                name: rng.uniform(*bounds[name], validation_samples) for name in names
+            }
+            error = surrogate.predict(**points) - simulate_psi(points, **settings)
+            surrogate.error_bound["validation"] = float(np.max(np.abs(error)))
+        return surrogate
+
+    @staticmethod
+    def _to_unit(values, bounds):
+        """
+        Map values from [lower, upper] to [-1, 1].
+        """
+        values = np.asarray(values, dtype=float)
+        return 2 * (values - bounds[0]) / (bounds[1] - bounds[0]) - 1
+
+    def predict(self, **conditions):
+        """
+        Interpolate the mean PSI at many conditions.
+
+        Parameters:
+        - conditions: Values of every condition of the box, as scalars or arrays that
+          broadcast together.
+
+        Returns:
+        - numpy.ndarray: Mean PSI (Hz) of the broadcast shape of the conditions.
+
+        Raises:
+        - ValueError: If a condition is missing or outside the box.
+        """
+        missing = set(self.names) - set(conditions)
+        unknown = set(conditions) - set(self.names)
+        if missing or unknown:
+            raise ValueError(
+                f"Conditions must be {self.names} (missing {sorted(missing)}, "
+                f"unknown {sorted(unknown)})."
+            )
+        values = np.broadcast_arrays(
+            *[np.asarray(conditions[name], dtype=float) for name in self.names]
+        )
+        shape = values[0].shape
+
+        result = None
+        for axis, (name, value) in enumerate(zip(self.names, values)):
+            unit = self._to_unit(value.ravel(), self.bounds[axis])
+            if np.any(np.abs(unit) > 1 + 1e-9):
+                raise ValueError(f"{name} is outside the bounds of the surrogate.")
+            vandermonde = chebyshev.chebvander(
+                np.clip(unit, -1, 1), self.coefficients.shape[axis] - 1
+            )
+            if result is None:
+                # (queries, remaining axes...)
+                result = np.tensordot(vandermonde, self.coefficients, axes=([1], [0]))
+            else:
+                result = np.einsum("qk,qk...->q...", vandermonde, result)
+        return result.reshape(shape)
+
+    def save(self, path):
+        """
+        Save the surrogate into a compressed .npz file.
+
+        Parameters:
+        - path (str): Path of the file.
+        """
+        np.savez_compressed(
+            path,
+            names=np.array(self.names),
+            bounds=self.bounds,
+            coefficients=self.coefficients,
+            error_bound=json.dumps(self.error_bound),
+            metadata=json.dumps(self.metadata),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a surrogate saved with save.
+
+        Parameters:
+        - path (str): Path of the file.
+
+        Returns:
+        - ChebyshevSurrogate: The surrogate.
+        """
+        with np.load(path) as data:
+            return cls(
+                data["names"].tolist(),
+                data["bounds"],
+                data["coefficients"],
+                json.loads(str(data["error_bound"])),
+                json.loads(str(data["metadata"])),
+            )
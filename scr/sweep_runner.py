@@ -0,0 +1,602 @@
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import socket
+import time
+import traceback
+
+import numpy as np
+
+import configration
+from batched_model import BatchedReceptorModel
+from model import ReceptorModel
+
+MANIFEST_NAME = "manifest.json"
+RESULTS_DIRECTORY_NAME = "results"
+CLAIMS_DIRECTORY_NAME = "claims"
+ERRORS_DIRECTORY_NAME = "errors"
+
+# Parameters of the rows of simulate_sweep_task
+SWEEP_PARAMETERS = [
+    "wavelength",
+    "emitter_temperature",
+    "t_db",
+    "t_r",
+    "q_irradiance",
+    "T_core",
+    "hc",
+]
+
+
+def expand_grid(grid):
+    """
+    Expand a declarative parameter grid into rows.
+
+    Parameters:
+    - grid (dict): Values of each parameter by name, as a list, or a scalar for a
+      parameter fixed over the sweep.
+
+    Returns:
+    - list: Rows (dict of parameter values) of the Cartesian product, with the last
+      parameter varying fastest.
+    """
+    grid = _normalize_grid(grid)
+    names = list(grid)
+    return [dict(zip(names, row)) for row in itertools.product(*grid.values())]
+
+
+def _normalize_grid(grid):
+    """
+    Convert the values of a grid into lists of JSON-serializable values.
+    """
+    normalized = {}
+    for name, values in grid.items():
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        elif not isinstance(values, (list, tuple)):
+            values = [values]
+        normalized[name] = [
+            value.item() if isinstance(value, np.generic) else value for value in values
+        ]
+    return normalized
+
+
+def task_key(rows):
+    """
+    Create the key of a task from its rows.
+
+    Parameters:
+    - rows (list): Rows of the task.
+
+    Returns:
+    - str: The task key.
+    """
+    content = json.dumps(rows, sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _write_json(path, content):
+    """
+    Write a JSON file atomically, so that an interrupted run leaves no partial file.
+    """
+    temporary_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(content, file)
+    os.replace(temporary_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _result_path(directory, key):
+    return os.path.join(directory, RESULTS_DIRECTORY_NAME, key + ".json")
+
+
+def _claim_path(directory, key):
+    return os.path.join(directory, CLAIMS_DIRECTORY_NAME, key)
+
+
+def _error_path(directory, key):
+    return os.path.join(directory, ERRORS_DIRECTORY_NAME, key + ".json")
+
+
+def create_manifest(
+    directory, grid, function="sweep_runner:simulate_sweep_task", chunk_size=64
+):
+    """
+    Create the task manifest of a sweep, or reuse the identical manifest of a directory.
+
+    The rows of the grid are split into tasks of chunk_size rows, each simulated by one
+    call of the task function and keyed by the hash of its rows. The manifest is the
+    only shared state besides the result files, so several machines sharing the
+    directory can run shards of the same sweep.
+
+    Parameters:
+    - directory (str): Directory of the sweep.
+    - grid (dict): Parameter grid (see expand_grid).
+    - function (str): Task function as "module:function". It takes a list of rows and
+      returns one JSON-serializable dict of results per row.
+    - chunk_size (int): Number of rows per task.
+
+    Returns:
+    - dict: The manifest, with "function", "grid", "chunk_size" and "tasks" (list of
+      {"key", "rows"}).
+
+    Raises:
+    - ValueError: If the directory holds the manifest of a different sweep.
+    """
+    grid = _normalize_grid(grid)
+    rows = expand_grid(grid)
+    chunks = [
+        rows[start : start + chunk_size] for start in range(0, len(rows), chunk_size)
+    ]
+    tasks = [{"key": task_key(chunk), "rows": chunk} for chunk in chunks]
+    manifest = json.loads(
+        json.dumps(
+            {
+                "function": function,
+                "grid": grid,
+                "chunk_size": chunk_size,
+                "tasks": tasks,
+            }
+        )
+    )
+
+    path = os.path.join(directory, MANIFEST_NAME)
+    if os.path.exists(path):
+        existing = _read_json(path)
+        if existing != manifest:
+            raise ValueError(f"{directory} holds the manifest of a different sweep.")
+        return existing
+
+    for name in [RESULTS_DIRECTORY_NAME, CLAIMS_DIRECTORY_NAME, ERRORS_DIRECTORY_NAME]:
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    _write_json(path, manifest)
+    return manifest
+
+
+def load_manifest(directory):
+    """
+    Load the task manifest of a sweep.
+
+    Parameters:
+    - directory (str): Directory of the sweep.
+
+    Returns:
+    - dict: The manifest (see create_manifest).
+    """
+    return _read_json(os.path.join(directory, MANIFEST_NAME))
+
+
+def _import_function(function):
+    """
+    Import a function from a "module:function" reference.
+    """
+    module_name, function_name = function.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _claim_identity(claim_path):
+    """
+    Identify a claim file by its content, inode and modification time.
+
+    Returns:
+    - tuple: (claim, inode, modification time [ns]), or None if the claim is released.
+    """
+    try:
+        status = os.stat(claim_path)
+        return _read_json(claim_path), status.st_ino, status.st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+
+def _is_stale(identity, stale_after):
+    """
+    Check whether a claim was left by a worker that stopped.
+
+    A claim of this host is stale when its process no longer runs; a claim of another
+    host when it is older than stale_after seconds.
+    """
+    claim, _, modification_time = identity
+    if claim["host"] == socket.gethostname():
+        return not _pid_alive(claim["pid"])
+    age = time.time() - modification_time / 1e9
+    return stale_after is not None and age > stale_after
+
+
+def claim_file(path, stale_after=None):
+    """
+    Claim a path exclusively with a claim file that only one process can create.
+
+    The claim is released with release_claim. Claims left by processes that stopped
+    are taken over (see run_sweep).
+
+    Parameters:
+    - path (str): Path of the claim file.
+    - stale_after (float): Age [s] after which a claim of another host is taken over.
+
+    Returns:
+    - bool: True if the path was claimed by this process.
+    """
+    temporary_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump({"host": socket.gethostname(), "pid": os.getpid()}, file)
+    try:
+        for _ in range(2):
+            # Linking a complete claim file fails if the path is already claimed
+            try:
+                os.link(temporary_path, path)
+                return True
+            except FileExistsError:
+                identity = _claim_identity(path)
+                if identity is None:
+                    continue  # released since the link
+                if not _is_stale(identity, stale_after):
+                    return False
+            # Only one worker can move the stale claim away before claiming again
+            stale_path = f"{path}.{socket.gethostname()}.{os.getpid()}.stale"
+            try:
+                os.rename(path, stale_path)
+            except FileNotFoundError:
+                return False
+            if _claim_identity(stale_path) != identity:
+                # Another worker took the stale claim over first, and this is its
+                # live claim: put it back, unless the path was claimed meanwhile
+                try:
+                    os.link(stale_path, path)
+                except FileExistsError:
+                    pass
+                os.remove(stale_path)
+                return False
+            os.remove(stale_path)
+        return False
+    finally:
+        os.remove(temporary_path)
+
+
+def release_claim(path):
+    """
+    Release a claim of this process.
+
+    A claim that another worker has taken over (see claim_file) is left in place.
+
+    Parameters:
+    - path (str): Path of the claim file.
+    """
+    identity = _claim_identity(path)
+    if identity is None:
+        return
+    claim = identity[0]
+    if claim["host"] == socket.gethostname() and claim["pid"] == os.getpid():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _run_task(directory, function, task, stale_after, cube_path=None):
+    """
+    Claim, simulate and save one task, and write its results into the cube if any.
+
+    Returns:
+    - str: "done", "skipped" (finished or claimed by another worker) or "failed".
+    """
+    key = task["key"]
+    if os.path.exists(_result_path(directory, key)) or not claim_file(
+        _claim_path(directory, key), stale_after
+    ):
+        return "skipped"
+    try:
+        if os.path.exists(_result_path(directory, key)):
+            return "skipped"  # finished between the check and the claim
+        try:
+            results = _import_function(function)(task["rows"])
+            if len(results) != len(task["rows"]):
+                raise ValueError("The task function must return one result per row.")
+            if cube_path is not None:
+                from result_cube import ResultCube
+
+                ResultCube(cube_path).write_rows(task["rows"], results, stale_after)
+        except Exception:
+            _write_json(
+                _error_path(directory, key),
+                {"rows": task["rows"], "traceback": traceback.format_exc()},
+            )
+            return "failed"
+        _write_json(
+            _result_path(directory, key), {"rows": task["rows"], "results": results}
+        )
+        if os.path.exists(_error_path(directory, key)):
+            os.remove(_error_path(directory, key))
+        return "done"
+    finally:
+        release_claim(_claim_path(directory, key))
+
+
+def run_sweep(
+    directory, shard=0, shards=1, processes=1, stale_after=None, cube_path=None
+):
+    """
+    Run the unfinished tasks of one shard of a sweep.
+
+    Each result is written atomically as soon as its task finishes, so an interrupted
+    run is resumed by running it again: finished tasks are skipped. A task is claimed
+    with a file created exclusively before it is simulated, so shards can overlap and
+    several processes or machines sharing the directory never simulate a task twice.
+    Tasks that raise are recorded with their traceback and retried by the next run.
+    With a result cube, each worker also writes the results of its tasks into the cube
+    (see result_cube.create_sweep_cube) before saving them, so the cube holds every
+    finished task.
+
+    Usage:
+        axes = {"wavelength": list(range(300, 20001, 100)), "q_irradiance": [100, 300]}
+        create_manifest(directory, axes)
+        run_sweep(directory, shard=0, shards=2, processes=4)  # each machine, its shard
+        df = merge_results(directory, "results.csv")
+
+    Parameters:
+    - directory (str): Directory of the sweep, with its manifest (see create_manifest).
+    - shard (int): Index of the shard run, in [0, shards).
+    - shards (int): Number of shards; task i belongs to shard i % shards.
+    - processes (int): Number of worker processes. Uses all CPUs if None.
+    - stale_after (float): Age [s] after which a claim of another host is taken over,
+      for machines that stopped. Claims of this host are taken over as soon as their
+      process has stopped. Claims of other hosts are never taken over if None.
+    - cube_path (str): Directory of a result cube with an axis for each parameter of
+      the grid (see result_cube.create_sweep_cube). Not written if None.
+
+    Returns:
+    - dict: Number of tasks of the shard "done", "skipped" and "failed" by this run.
+
+    Raises:
+    - ValueError: If the shard is out of range.
+    """
+    if not 0 <= shard < shards:
+        raise ValueError("shard must be in [0, shards).")
+    manifest = load_manifest(directory)
+    tasks = [
+        task
+        for task in manifest["tasks"][shard::shards]
+        if not os.path.exists(_result_path(directory, task["key"]))
+    ]
+    arguments = [
+        (directory, manifest["function"], task, stale_after, cube_path)
+        for task in tasks
+    ]
+
+    # Simulate the tasks in parallel when there are several
+    if len(tasks) > 1 and processes != 1:
+        from spectral_tables import SharedSpectralTables, create_worker_pool
+
+        with SharedSpectralTables(ReceptorModel().spectral_tables) as shared:
+            with create_worker_pool(shared, processes) as pool:
+                statuses = pool.starmap(_run_task, arguments, chunksize=1)
+    else:
+        statuses = [_run_task(*argument) for argument in arguments]
+
+    summary = {"done": 0, "skipped": 0, "failed": 0}
+    summary["skipped"] += len(manifest["tasks"][shard::shards]) - len(tasks)
+    for status in statuses:
+        summary[status] += 1
+    return summary
+
+
+def sweep_status(directory):
+    """
+    Count the tasks of a sweep by state.
+
+    Parameters:
+    - directory (str): Directory of the sweep.
+
+    Returns:
+    - dict: Number of tasks "total", "done", "running" (claimed) and "failed" (with an
+      error from their last run and no result).
+    """
+    manifest = load_manifest(directory)
+    status = {"total": len(manifest["tasks"]), "done": 0, "running": 0, "failed": 0}
+    for task in manifest["tasks"]:
+        key = task["key"]
+        if os.path.exists(_result_path(directory, key)):
+            status["done"] += 1
+        elif os.path.exists(_claim_path(directory, key)):
+            status["running"] += 1
+        elif os.path.exists(_error_path(directory, key)):
+            status["failed"] += 1
+    return status
+
+
+def load_task_results(directory, task):
+    """
+    Load the results of a task of a sweep.
+
+    Parameters:
+    - directory (str): Directory of the sweep.
+    - task (dict): Task of the manifest (see create_manifest).
+
+    Returns:
+    - list: Results of each row of the task, or None if the task is unfinished.
+    """
+    result_path = _result_path(directory, task["key"])
+    if not os.path.exists(result_path):
+        return None
+    return _read_json(result_path)["results"]
+
+
+def merge_results(directory, path=None, allow_missing=False):
+    """
+    Merge the results of a sweep into one table.
+
+    Parameters:
+    - directory (str): Directory of the sweep.
+    - path (str): CSV file the table is written to (atomically). Not written if None.
+    - allow_missing (bool): If True, unfinished tasks are rows without results.
+
+    Returns:
+    - pd.DataFrame: One row per row of the grid, in the order of the manifest, with
+      the parameters and the results.
+
+    Raises:
+    - ValueError: If tasks are unfinished and allow_missing is False.
+    """
+    import pandas as pd
+
+    manifest = load_manifest(directory)
+    records = []
+    missing = 0
+    for task in manifest["tasks"]:
+        results = load_task_results(directory, task)
+        if results is None:
+            missing += 1
+            results = [{}] * len(task["rows"])
+        records += [{**row, **result} for row, result in zip(task["rows"], results)]
+    if missing and not allow_missing:
+        raise ValueError(
+            f"{missing} of {len(manifest['tasks'])} tasks have no result; "
+            "run the sweep again or set allow_missing."
+        )
+
+    df = pd.DataFrame(records)
+    if path is not None:
+        temporary_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+        df.to_csv(temporary_path, index=False)
+        os.replace(temporary_path, path)
+    return df
+
+
+def simulate_sweep_task(
+    rows, warm_up_duration=1000, duration=20, records=21, history=False
+):
+    """
+    Simulate the mean PSI of the rows of a task in one batched run.
+
+    Each row is a warm-up without irradiation followed by an irradiation, and PSI is
+    averaged over the last records, as in main.py. The irradiance is monochromatic at
+    "wavelength" [nm] (the nearest wavelength of the spectral tables), or the normalized
+    blackbody spectrum of "emitter_temperature" [K].
+
+    Parameters:
+    - rows (list): Rows with "q_irradiance" and "wavelength" or "emitter_temperature",
+      and optionally the other SWEEP_PARAMETERS. Missing conditions are taken from a
+      new ReceptorModel (t_db and t_r from T_db and T_r).
+    - warm_up_duration (int): Duration of the phase without irradiation [s].
+    - duration (int): Duration of the irradiation [s].
+    - records (int): Number of last records averaged.
+    - history (bool): If True, PSI of each of the last records instead of their mean.
+
+    Returns:
+    - list: {"PSI": mean PSI (Hz), or list of PSI of the last records} for each row.
+
+    Raises:
+    - ValueError: If a row has an unknown parameter, no irradiance or no irradiance
+      spectrum.
+    """
+    from spectrum_synthesis import synthesize_spectra_for
+
+    template = ReceptorModel()
+    for row in rows:
+        unknown_parameters = set(row) - set(SWEEP_PARAMETERS)
+        if unknown_parameters:
+            raise ValueError(f"Unknown parameters: {sorted(unknown_parameters)}")
+        if ("wavelength" in row) == ("emitter_temperature" in row):
+            raise ValueError("Each row needs either wavelength or emitter_temperature.")
+        if "q_irradiance" not in row:
+            raise ValueError("Each row needs q_irradiance.")
+
+    defaults = {"t_db": template.T_db, "t_r": template.T_r}
+
+    def column(name):
+        return np.array(
+            [
+                row.get(name, defaults.get(name, getattr(template, name, 0)))
+                for row in rows
+            ],
+            dtype=float,
+        )
+
+    model = BatchedReceptorModel(
+        range(len(rows)),
+        template=template,
+        T_core=column("T_core"),
+        hc=column("hc"),
+    )
+    tables = template.spectral_tables
+    spectra = np.zeros((len(rows), len(tables.wavelengths)))
+    for lane, row in enumerate(rows):
+        if "wavelength" in row:
+            spectra[lane, np.abs(tables.wavelengths - row["wavelength"]).argmin()] = 1
+        else:
+            spectra[lane] = synthesize_spectra_for(
+                template, row["emitter_temperature"]
+            )[0]
+    model.set_spectrum(spectra)
+
+    t_db, t_r = column("t_db"), column("t_r")
+    model.add_phase(warm_up_duration, t_db, t_r, q_irradiance=0)
+    model.add_phase(duration, t_db, t_r, column("q_irradiance"))
+    psi = model.simulate()["PSI"][:, -records:]
+    if history:
+        return [{"PSI": values.tolist()} for values in psi]
+    return [{"PSI": float(value)} for value in psi.mean(axis=1)]
+
+
+def simulate_sweep_history_task(rows):
+    """
+    Simulate the PSI of the rows of a task at each second of the irradiation.
+
+    Task function for a result cube with a "time" axis of the 21 records from the start
+    to the end of the irradiation, 0 to 20 s (see result_cube.create_sweep_cube);
+    otherwise as simulate_sweep_task.
+
+    Parameters:
+    - rows (list): Rows of the task (see simulate_sweep_task).
+
+    Returns:
+    - list: {"PSI": list of PSI of the last records (Hz)} for each row.
+    """
+    return simulate_sweep_task(rows, history=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run or merge a sweep.")
+    parser.add_argument("command", choices=["run", "status", "merge"])
+    parser.add_argument("directory", nargs="?", default=configration.SWEEP_DIRECTORY)
+    parser.add_argument("--shard", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--stale-after", type=float, default=None)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--cube", default=None)
+    arguments = parser.parse_args()
+
+    if arguments.command == "run":
+        print(
+            run_sweep(
+                arguments.directory,
+                arguments.shard,
+                arguments.shards,
+                arguments.processes,
+                arguments.stale_after,
+                arguments.cube,
+            )
+        )
+    elif arguments.command == "status":
+        print(sweep_status(arguments.directory))
+    else:
+        output = arguments.output or os.path.join(arguments.directory, "results.csv")
+        print(merge_results(arguments.directory, output))
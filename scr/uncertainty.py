@@ -0,0 +1,259 @@
+import numpy as np
+from batched_model import BatchedReceptorModel
+from model import ReceptorModel
+from population import StreamingPercentiles
+from spectral_tables import RADIATIVE_TRANSFER_KERNELS
+
+# Standard deviations of the log perturbations of the skin optical properties
+DEFAULT_OPTICAL_UNCERTAINTY = {
+    "reflectance": 0.2,
+    "absorption_coefficient": 0.2,
+    "scattering_coefficient": 0.3,
+}
+# Standard deviations of the log perturbations of the thermal parameters
+DEFAULT_THERMAL_UNCERTAINTY = {
+    "conductance": 0.15,
+    "volumetric_capacity": 0.1,
+}
+
+
+def calculate_correlated_modes(
+    wavelengths, correlation_length=0.3, modes=8, grid_size=256
+):
+    """
+    Calculate the modes of a spectrally correlated random perturbation.
+
+    The perturbation is a Gaussian process of unit variance with a squared exponential
+    correlation in log wavelength. It is truncated to its leading Karhunen-Loève modes,
+    computed on a coarse grid and interpolated to the wavelength grid, and rescaled so
+    that the variance stays one at every wavelength.
+
+    Parameters:
+    - wavelengths (numpy.ndarray): Wavelength grid [nm].
+    - correlation_length (float): Correlation length in natural log of wavelength
+      (0.3 correlates wavelengths within about ±35 %).
+    - modes (int): Number of modes.
+    - grid_size (int): Number of points of the coarse grid.
+
+    Returns:
+    - numpy.ndarray: Modes of shape (modes, wavelengths). A perturbation is
+      standard_normal_weights @ modes.
+    """
+    log_wavelengths = np.log(wavelengths)
+    grid = np.linspace(log_wavelengths[0], log_wavelengths[-1], grid_size)
+    correlation = np.exp(
+        -((grid[:, np.newaxis] - grid[np.newaxis, :]) ** 2)
+        / (2 * correlation_length**2)
+    )
+    eigenvalues, eigenvectors = np.linalg.eigh(correlation)
+
+    # Leading modes, largest first
+    order = np.argsort(eigenvalues)[::-1][:modes]
+    coarse_modes = eigenvectors[:, order] * np.sqrt(np.maximum(eigenvalues[order], 0))
+    coarse_modes /= np.sqrt(np.sum(coarse_modes**2, axis=1, keepdims=True))
+
+    return np.array([np.interp(log_wavelengths, grid, mode) for mode in coarse_modes.T])
+
+
+def sample_standard_normal(samples, dimensions, method="sobol", seed=0):
+    """
+    Sample independent standard normal variables.
+
+    Parameters:
+    - samples (int): Number of samples. A power of two keeps the Sobol sequence
+      balanced.
+    - dimensions (int): Number of variables.
+    - method (str): "sobol" for a scrambled Sobol sequence, "random" for plain Monte
+      Carlo.
+    - seed (int): Seed of the random number generator.
+
+    Returns:
+    - numpy.ndarray: Samples of shape (samples, dimensions).
+
+    Raises:
+    - ValueError: If the method is unknown.
+    """
+    if method == "random":
+        return np.random.default_rng(seed).standard_normal((samples, dimensions))
+    if method != "sobol":
+        raise ValueError(f"Unknown sampling method: {method}")
+
+    from scipy.stats import norm, qmc
+
+    uniform = qmc.Sobol(dimensions, scramble=True, seed=seed).random(samples)
+    return norm.ppf(np.clip(uniform, 1e-12, 1 - 1e-12))
+
+
+def propagate_uncertainty(
+    spectra,
+    q_irradiance,
+    t_db,
+    t_r,
+    samples=1024,
+    optical_uncertainty=DEFAULT_OPTICAL_UNCERTAINTY,
+    thermal_uncertainty=DEFAULT_THERMAL_UNCERTAINTY,
+    correlation_length=0.3,
+    modes=8,
+    method="sobol",
+    seed=0,
+    warm_up_duration=1000,
+    duration=20,
+    confidence=0.95,
+    psi_range=None,
+    batch_size=64,
+    template=None,
+    **parameters,
+):
+    """
+    Propagate the uncertainty of the skin optical and thermal properties to PSI.
+
+    Each sample perturbs the reflectance, absorption and scattering coefficients by
+    spectrally correlated log-normal factors, and the conductance and volumetric heat
+    capacity by log-normal factors. The attenuation kernels of a batch of samples are
+    computed at once, and all samples and spectra of the batch are integrated as lanes
+    of one BatchedReceptorModel.
+
+    As in main.py, PSI is averaged over the last 21 records of each run, and Ratio is
+    this PSI divided by the largest PSI over the spectra of the same sample.
+
+    Parameters:
+    - spectra (dict): Spectral irradiance (pd.Series or numpy.ndarray) by name.
+    - q_irradiance (float or dict): Total irradiance (W/m²), or a dict by name.
+    - t_db (float): Dry bulb temperature (°C).
+    - t_r (float): Radiant temperature (°C).
+    - samples (int): Number of samples.
+    - optical_uncertainty (dict): Standard deviations of the log perturbations of
+      "reflectance", "absorption_coefficient" and "scattering_coefficient".
+    - thermal_uncertainty (dict): Standard deviations of the log perturbations of
+      "conductance" and "volumetric_capacity".
+    - correlation_length (float): Spectral correlation length in log wavelength.
+    - modes (int): Number of modes of each spectral perturbation.
+    - method (str): "sobol" or "random" (see sample_standard_normal).
+    - seed (int): Seed of the random number generator.
+    - warm_up_duration (int): Duration of the phase without irradiation [s].
+    - duration (int): Duration of the irradiation [s].
+    - confidence (float): Level of the confidence bands.
+    - psi_range (tuple): Range of the bins of the PSI bands (Hz). If None, the range
+      is set from the first batch as (minimum - 10, 2 * maximum + 10). Values of later
+      batches outside the range are counted in "PSI_out_of_range".
+    - batch_size (int): Number of samples integrated at once. The attenuation kernels
+      and their intermediates take about 4 MB per sample of a batch with the default
+      wavelength grid, so the default batch peaks near 0.5 GB.
+    - template (ReceptorModel): Model providing the nominal parameters, the layer grid
+      and the skin optical properties. A new ReceptorModel if None.
+    - parameters: Other per-patch parameters of BatchedReceptorModel (e.g. hc, T_core).
+
+    Returns:
+    - dict:
+      - "summary": pd.DataFrame by spectrum with the mean, lower, median and upper
+        values of "PSI" and "Ratio".
+      - "PSI" and "Ratio": pd.DataFrame of each sample (rows) and spectrum (columns).
+      - "time" (records,) [s] and "PSI_bands" of shape (3, spectra, records) with the
+        lower, median and upper PSI over time.
+      - "PSI_out_of_range": Number of PSI values outside the range of the bins of
+        PSI_bands, counted at its edges. The bands are biased if it is not zero.
+    """
+    import pandas as pd
+
+    if template is None:
+        template = ReceptorModel()
+    tables = template.spectral_tables
+    names = list(spectra)
+    if not isinstance(q_irradiance, dict):
+        q_irradiance = {name: q_irradiance for name in names}
+
+    aligned_spectra = np.array(
+        [np.asarray(template._align_spectrum(spectra[name])) for name in names]
+    )
+    q_lanes = np.array([q_irradiance[name] for name in names])
+
+    # Standard normal weights of the spectral modes and the thermal parameters
+    optical_names = list(optical_uncertainty)
+    thermal_names = list(thermal_uncertainty)
+    weights = sample_standard_normal(
+        samples, modes * len(optical_names) + len(thermal_names), method, seed
+    )
+    spectral_modes = calculate_correlated_modes(
+        tables.wavelengths, correlation_length, modes
+    )
+
+    tail = (1 - confidence) / 2 * 100
+    percentiles = [tail, 50, 100 - tail]
+    psi_bands = None
+    psi = []
+
+    for start in range(0, samples, batch_size):
+        batch_weights = weights[start : start + batch_size]
+        batch = len(batch_weights)
+
+        # Perturbed optical properties and attenuation kernels of the batch
+        properties = {}
+        for i, name in enumerate(optical_names):
+            field = batch_weights[:, i * modes : (i + 1) * modes] @ spectral_modes
+            properties[name] = getattr(tables, name) * np.exp(
+                optical_uncertainty[name] * field
+            )
+        properties["reflectance"] = np.clip(properties["reflectance"], 0, 1)
+        kernels = RADIATIVE_TRANSFER_KERNELS[template.radiative_transfer](
+            template.node_coordinates,
+            template.dx,
+            properties["reflectance"],
+            properties["absorption_coefficient"],
+            properties["scattering_coefficient"],
+        )
+        absorbed_profiles = np.einsum("bnl,sl->bsn", kernels, aligned_spectra)
+
+        # Perturbed thermal parameters, one lane per sample and spectrum
+        thermal_weights = batch_weights[:, modes * len(optical_names) :]
+        nominal = {
+            "conductance": template.conductance,
+            "volumetric_capacity": template.capacity / template.dx,
+        }
+        lane_parameters = dict(parameters)
+        for i, name in enumerate(thermal_names):
+            values = nominal[name] * np.exp(
+                thermal_uncertainty[name] * thermal_weights[:, i]
+            )
+            lane_parameters[name] = np.repeat(values, len(names))
+
+        labels = [f"{start + i}_{name}" for i in range(batch) for name in names]
+        model = BatchedReceptorModel(labels, template=template, **lane_parameters)
+        model.set_absorbed_profiles(absorbed_profiles.reshape(-1, template.n))
+        model.add_phase(
+            duration_in_sec=warm_up_duration, t_db=t_db, t_r=t_r, q_irradiance=0
+        )
+        model.add_phase(
+            duration_in_sec=duration,
+            t_db=t_db,
+            t_r=t_r,
+            q_irradiance=np.tile(q_lanes, batch),
+        )
+        results = model.simulate()
+
+        batch_psi = results["PSI"].reshape(batch, len(names), -1)
+        if psi_bands is None:
+            time = results["time"]
+            if psi_range is None:
+                psi_range = (np.nanmin(batch_psi) - 10, 2 * np.nanmax(batch_psi) + 10)
+            psi_bands = StreamingPercentiles(batch_psi.shape[1:], psi_range, bins=4000)
+        psi_bands.update(batch_psi)
+        psi.append(batch_psi[:, :, -21:].mean(axis=2))
+
+    psi = pd.DataFrame(np.concatenate(psi), columns=names)
+    ratio = psi.div(psi.max(axis=1), axis=0)
+
+    summary = {}
+    for metric, values in [("PSI", psi), ("Ratio", ratio)]:
+        summary[(metric, "mean")] = values.mean()
+        summary[(metric, "lower")] = values.quantile(percentiles[0] / 100)
+        summary[(metric, "median")] = values.median()
+        summary[(metric, "upper")] = values.quantile(percentiles[2] / 100)
+
+    return {
+        "summary": pd.DataFrame(summary),
+        "PSI": psi,
+        "Ratio": ratio,
+        "time": time,
+        "PSI_bands": psi_bands.percentiles(percentiles),
+        "PSI_out_of_range": psi_bands.out_of_range,
+    }